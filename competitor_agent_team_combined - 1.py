@@ -5,12 +5,29 @@ AI 竞争对手智能分析代理团队 - 综合版本
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import requests
 import pandas as pd
+import numpy as np
+import altair as alt
+import abc
 import json
-from typing import List, Optional, Dict, Any
+import os
+import re
+import socket
+import sys
+import hashlib
+import queue
+import threading
+import heapq
+import itertools
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Set, Tuple
 from pydantic import BaseModel, Field
 import time
+import uuid
 
 # 尝试导入各种依赖
 try:
@@ -41,6 +58,21 @@ try:
 except ImportError:
     EXA_AVAILABLE = False
 
+try:
+    import tldextract
+    # 使用包内自带的公共后缀列表快照，不在运行时联网下载
+    _tld_extract = tldextract.TLDExtract(suffix_list_urls=())
+    TLDEXTRACT_AVAILABLE = True
+except ImportError:
+    TLDEXTRACT_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # 配置 Streamlit 页面
 st.set_page_config(page_title="AI 竞争对手智能分析代理团队 - 综合版本", layout="wide")
 
@@ -98,91 +130,261 @@ st.markdown("""
 st.markdown('<h1 class="main-header">🧲 AI 竞争对手智能分析代理团队</h1>', unsafe_allow_html=True)
 st.markdown('<h2 style="text-align: center; color: #666; margin-bottom: 2rem;">综合版本 - 支持多种AI模型</h2>', unsafe_allow_html=True)
 
+# 必要配置检查（侧边栏和主区域共用）
+def get_missing_configs() -> List[str]:
+    """返回尚未配置的必要选项"""
+    required_configs = []
+    if not st.session_state.get('model_provider'):
+        required_configs.append("AI模型提供商")
+    if not st.session_state.get('search_engine'):
+        required_configs.append("搜索引擎")
+    if not st.session_state.get('firecrawl_api_key'):
+        required_configs.append("Firecrawl API")
+    return required_configs
+
 # 侧边栏 - 模型和API配置
-st.sidebar.title("🔧 配置选项")
-
-# 安全提示
-st.sidebar.markdown("""
-<div class="warning-box">
-    <h4>🔒 安全提示</h4>
-    <p><strong>重要：</strong>请勿将API密钥提交到版本控制系统！</p>
-    <p>建议使用环境变量或配置文件来管理API密钥。</p>
-</div>
-""", unsafe_allow_html=True)
+@st.fragment
+def render_sidebar_config() -> None:
+    """侧边栏配置（独立重新运行，修改选项不会重跑整个页面）"""
+    missing_before = get_missing_configs()
+    
+    st.title("🔧 配置选项")
 
-# 模型选择
-model_provider = st.sidebar.selectbox(
-    "选择AI模型提供商",
-    options=["OpenAI GPT-4", "Qwen (通义千问)"],
-    help="选择用于分析的AI模型"
-)
-
-# 根据选择的模型显示相应的配置
-if model_provider == "OpenAI GPT-4":
-    st.sidebar.subheader("OpenAI 配置")
-    openai_api_key = st.sidebar.text_input("OpenAI API Key", type="password", help="OpenAI API 密钥")
-    
-    if openai_api_key:
-        st.session_state.openai_api_key = openai_api_key
-        st.session_state.model_provider = "openai"
-        st.sidebar.success("✅ OpenAI API 已配置")
-    else:
-        st.sidebar.warning("⚠️ 请输入 OpenAI API Key")
-        
-else:  # Qwen
-    st.sidebar.subheader("Qwen 配置")
-    # DashScope API Key
-    dashscope_api_key = st.sidebar.text_input("DashScope API Key", type="password", help="阿里云 DashScope API 密钥")
-    qwen_model = st.sidebar.selectbox(
-        "选择 Qwen 模型",
-        options=["qwen-max", "qwen-plus", "qwen-turbo", "qwen-long"],
-        help="选择要使用的 Qwen 模型"
+    # 安全提示
+    st.markdown("""
+    <div class="warning-box">
+        <h4>🔒 安全提示</h4>
+        <p><strong>重要：</strong>请勿将API密钥提交到版本控制系统！</p>
+        <p>建议使用环境变量或配置文件来管理API密钥。</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # 模型选择
+    model_provider = st.selectbox(
+        "选择AI模型提供商",
+        options=["OpenAI GPT-4", "Qwen (通义千问)", "OpenAI 兼容接口（本地）"],
+        help="选择用于分析的AI模型"
     )
+
+    # 根据选择的模型显示相应的配置
+    if model_provider == "OpenAI GPT-4":
+        st.subheader("OpenAI 配置")
+        openai_api_key = st.text_input("OpenAI API Key", type="password", help="OpenAI API 密钥")
+        openai_model = st.selectbox(
+            "选择 OpenAI 模型",
+            options=list(MODEL_PROFILES["openai"])[::-1],
+            help="选择要使用的 OpenAI 模型"
+        )
     
-    if dashscope_api_key:
-        st.session_state.dashscope_api_key = dashscope_api_key
-        st.session_state.qwen_model = qwen_model
-        st.session_state.model_provider = "qwen"
-        st.sidebar.success("✅ Qwen API 已配置")
-    else:
-        st.sidebar.warning("⚠️ 请输入 DashScope API Key")
-
-# 搜索引擎选择
-st.sidebar.subheader("🔍 搜索引擎配置")
-search_engine = st.sidebar.selectbox(
-    "选择搜索引擎",
-    options=["Perplexity AI - Sonar Pro", "Exa AI"],
-    help="选择用于查找竞争对手的搜索引擎"
-)
-
-# 根据选择的搜索引擎显示相应的API密钥输入框
-if search_engine == "Perplexity AI - Sonar Pro":
-    perplexity_api_key = st.sidebar.text_input("Perplexity API Key", type="password", help="Perplexity API 密钥")
-    if perplexity_api_key:
-        st.session_state.perplexity_api_key = perplexity_api_key
-        st.session_state.search_engine = "perplexity"
-        st.sidebar.success("✅ Perplexity API 已配置")
+        if openai_api_key:
+            st.session_state.openai_api_key = openai_api_key
+            st.session_state.openai_model = openai_model
+            st.session_state.model_provider = "openai"
+            st.success("✅ OpenAI API 已配置")
+        else:
+            st.warning("⚠️ 请输入 OpenAI API Key")
+        
+    elif model_provider == "OpenAI 兼容接口（本地）":
+        st.subheader("OpenAI 兼容接口配置")
+        local_base_url = st.text_input(
+            "服务地址",
+            value=OPENAI_COMPATIBLE_DEFAULT_BASE_URL,
+            help="OpenAI 兼容接口的 Base URL，如本地 vLLM、llama.cpp 服务"
+        )
+        local_model = st.text_input("模型名称", help="服务端加载的模型名称")
+        local_api_key = st.text_input("API Key（可选）", type="password", help="服务端未启用鉴权时留空")
+    
+        if local_base_url and local_model:
+            st.session_state.local_base_url = local_base_url
+            st.session_state.local_model = local_model
+            st.session_state.local_api_key = local_api_key
+            st.session_state.model_provider = "openai_compatible"
+            st.success("✅ OpenAI 兼容接口已配置")
+        else:
+            st.warning("⚠️ 请输入服务地址和模型名称")
+        
+    else:  # Qwen
+        st.subheader("Qwen 配置")
+        # DashScope API Key
+        dashscope_api_key = st.text_input("DashScope API Key", type="password", help="阿里云 DashScope API 密钥")
+        qwen_model = st.selectbox(
+            "选择 Qwen 模型",
+            options=["qwen-max", "qwen-plus", "qwen-turbo", "qwen-long"],
+            help="选择要使用的 Qwen 模型"
+        )
+    
+        if dashscope_api_key:
+            st.session_state.dashscope_api_key = dashscope_api_key
+            st.session_state.qwen_model = qwen_model
+            st.session_state.model_provider = "qwen"
+            st.success("✅ Qwen API 已配置")
+        else:
+            st.warning("⚠️ 请输入 DashScope API Key")
+
+    # 模型路由策略
+    routing_policy = st.selectbox(
+        "模型路由策略",
+        options=["固定模型", "延迟优先", "均衡", "质量优先"],
+        help="固定模型：始终使用上面选择的模型；其余策略按提示长度和上下文需求为每次调用自动选择模型"
+    )
+    st.session_state.routing_policy = {"固定模型": "fixed", "延迟优先": "latency", "均衡": "balanced", "质量优先": "quality"}[routing_policy]
+
+    # 对冲与故障转移
+    st.session_state.hedging_enabled = st.checkbox(
+        "对冲备用提供方",
+        value=False,
+        help="主提供方在等待时间内未开始输出时，在备用提供方上发起相同请求，使用先开始输出的结果；主提供方出错时立即切换到备用提供方"
+    )
+    if st.session_state.hedging_enabled:
+        hedge_provider = st.selectbox(
+            "备用提供方",
+            options=[provider for provider in ANALYZER_PROVIDER_LABELS if provider != st.session_state.get('model_provider')],
+            format_func=ANALYZER_PROVIDER_LABELS.get
+        )
+        st.session_state.hedge_provider = hedge_provider
+        st.session_state.hedge_delay = st.number_input(
+            "首个输出等待时间（秒）",
+            min_value=0.0,
+            max_value=HEDGE_MAX_DELAY,
+            value=HEDGE_DEFAULT_DELAY,
+            step=1.0,
+            help="主提供方超过该时间仍未开始输出时启动备用请求；设为 0 时两个提供方同时请求"
+        )
+        
+        # 备用提供方的配置单独保存在 hedge_ 前缀的键中，不覆盖主提供方的配置（留空则使用已配置的值）
+        if hedge_provider == "openai":
+            st.session_state.hedge_openai_api_key = st.text_input(
+                "备用 OpenAI API Key", type="password", help="留空则使用已配置的密钥"
+            )
+            hedge_configured = bool(get_backend_setting('openai_api_key', hedge=True))
+        elif hedge_provider == "qwen":
+            st.session_state.hedge_dashscope_api_key = st.text_input(
+                "备用 DashScope API Key", type="password", help="留空则使用已配置的密钥"
+            )
+            hedge_configured = bool(get_backend_setting('dashscope_api_key', hedge=True))
+        else:
+            st.session_state.hedge_local_base_url = st.text_input(
+                "备用服务地址", value=st.session_state.get('local_base_url', OPENAI_COMPATIBLE_DEFAULT_BASE_URL)
+            )
+            st.session_state.hedge_local_model = st.text_input(
+                "备用模型名称", value=st.session_state.get('local_model', '')
+            )
+            st.session_state.hedge_local_api_key = st.text_input(
+                "备用 API Key（可选）", type="password", help="服务端未启用鉴权时留空"
+            )
+            hedge_configured = bool(
+                get_backend_setting('local_base_url', hedge=True) and get_backend_setting('local_model', hedge=True)
+            )
+        
+        if hedge_configured:
+            st.success(f"✅ 备用提供方 {ANALYZER_PROVIDER_LABELS[hedge_provider]} 已配置")
+        else:
+            st.warning("⚠️ 请配置备用提供方，未配置时只使用主提供方")
+
+    # 搜索引擎选择
+    st.subheader("🔍 搜索引擎配置")
+    search_engine = st.selectbox(
+        "选择搜索引擎",
+        options=["Perplexity AI - Sonar Pro", "Exa AI"],
+        help="选择用于查找竞争对手的搜索引擎"
+    )
+
+    # 根据选择的搜索引擎显示相应的API密钥输入框
+    if search_engine == "Perplexity AI - Sonar Pro":
+        perplexity_api_key = st.text_input("Perplexity API Key", type="password", help="Perplexity API 密钥")
+        if perplexity_api_key:
+            st.session_state.perplexity_api_key = perplexity_api_key
+            st.session_state.search_engine = "perplexity"
+            st.success("✅ Perplexity API 已配置")
+        else:
+            st.warning("⚠️ 请输入 Perplexity API Key")
+    else:  # Exa AI
+        # Exa API Key
+        exa_api_key = st.text_input("Exa API Key", type="password", help="Exa API 密钥")
+        if exa_api_key:
+            st.session_state.exa_api_key = exa_api_key
+            st.session_state.search_engine = "exa"
+            st.success("✅ Exa API 已配置")
+        else:
+            st.warning("⚠️ 请输入 Exa API Key")
+
+    # Firecrawl 配置
+    st.subheader("🕷️ 网站爬取配置")
+    # Firecrawl API Key
+    firecrawl_api_key = st.text_input("Firecrawl API Key", type="password", help="Firecrawl API 密钥")
+    if firecrawl_api_key:
+        st.session_state.firecrawl_api_key = firecrawl_api_key
+        st.success("✅ Firecrawl API 已配置")
     else:
-        st.sidebar.warning("⚠️ 请输入 Perplexity API Key")
-else:  # Exa AI
-    # Exa API Key
-    exa_api_key = st.sidebar.text_input("Exa API Key", type="password", help="Exa API 密钥")
-    if exa_api_key:
-        st.session_state.exa_api_key = exa_api_key
-        st.session_state.search_engine = "exa"
-        st.sidebar.success("✅ Exa API 已配置")
+        st.warning("⚠️ 请输入 Firecrawl API Key")
+
+    # 高级选项
+    st.subheader("⚙️ 高级选项")
+    st.session_state.dedupe_enabled = st.checkbox(
+        "合并近重复竞争对手",
+        value=True,
+        help="合并同一公司的多个域名/子域名，以及提取后内容高度相似的记录，避免重复爬取和重复送入 LLM"
+    )
+    st.session_state.dedupe_fingerprints = st.checkbox(
+        "提取前比对页面指纹",
+        value=False,
+        disabled=not st.session_state.dedupe_enabled,
+        help="在调用 Firecrawl 前抓取各网站首页标题和描述，识别更名或不同域名的同一公司"
+    )
+    target_count_enabled = st.checkbox(
+        "目标数量模式",
+        value=False,
+        help="扩大候选池并按排名并发提取，成功数量达到目标后立即取消剩余任务，保证结果数量"
+    )
+    if target_count_enabled:
+        st.session_state.target_count = int(st.number_input("目标竞争对手数量", min_value=1, max_value=20, value=10, step=1))
     else:
-        st.sidebar.warning("⚠️ 请输入 Exa API Key")
-
-# Firecrawl 配置
-st.sidebar.subheader("🕷️ 网站爬取配置")
-# Firecrawl API Key
-firecrawl_api_key = st.sidebar.text_input("Firecrawl API Key", type="password", help="Firecrawl API 密钥")
-if firecrawl_api_key:
-    st.session_state.firecrawl_api_key = firecrawl_api_key
-    st.sidebar.success("✅ Firecrawl API 已配置")
-else:
-    st.sidebar.warning("⚠️ 请输入 Firecrawl API Key")
+        st.session_state.target_count = None
+    job_priority = st.selectbox(
+        "调度优先级",
+        options=["交互式", "批量"],
+        help="所有会话的提供方调用统一排队；交互式作业获得更高的公平排队权重，批量作业不会挤占其他用户的配额"
+    )
+    st.session_state.job_priority = "interactive" if job_priority == "交互式" else "batch"
+    extraction_profile = st.selectbox(
+        "提取画像",
+        options=list(EXTRACTION_PROFILES),
+        format_func=lambda profile: EXTRACTION_PROFILES[profile][0],
+        help="只提取关心的字段（如仅定价），缩小提取 schema 和提示；各字段结果会缓存，不同画像的结果合并为同一条记录"
+    )
+    st.session_state.extraction_profile = extraction_profile
+    st.session_state.refresh_extraction = st.checkbox(
+        "忽略提取缓存",
+        value=False,
+        help="重新提取所选画像的字段（例如检查竞争对手定价是否有变化），其他字段仍使用缓存"
+    )
+    st.session_state.incremental_report = st.checkbox(
+        "增量生成报告",
+        value=False,
+        help="逐个竞争对手生成分析片段并缓存到磁盘，再次运行时只重新分析数据有变化的竞争对手，最后合并为完整报告"
+    )
+    st.session_state.profiling_enabled = st.checkbox(
+        "性能采样分析",
+        value=False,
+        help="对下一次分析运行进行低开销采样，区分墙钟与 CPU 时间，并提供 speedscope / 火焰图文件下载"
+    )
+    st.session_state.speculative_prefetch = st.checkbox(
+        "推测性预取",
+        value=False,
+        help="输入完整的 URL 或描述后立即在后台发现竞争对手，点击分析时直接复用；输入变化时丢弃预取结果"
+    )
+    if st.session_state.speculative_prefetch:
+        st.session_state.prefetch_extractions = st.number_input(
+            "预取提取数量",
+            min_value=0,
+            max_value=PREFETCH_MAX_EXTRACTIONS,
+            value=2,
+            help="同时预先提取前几个发现的竞争对手，结果写入提取缓存"
+        )
+    
+    # 必要配置完成或失效时主区域需要刷新（配置提示和分析按钮）
+    if get_missing_configs() != missing_before:
+        st.rerun()
 
 # 功能说明
 st.markdown("""
@@ -200,12 +402,50 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # 用户输入区域
-st.subheader("📝 输入信息")
-col1, col2 = st.columns(2)
-with col1:
-    url = st.text_input("输入您的公司 URL：", placeholder="https://example.com")
-with col2:
-    description = st.text_area("输入您公司的描述（如果 URL 不可用）：", placeholder="例如：AI驱动的数据分析平台")
+def mark_portfolio_mode_changed() -> None:
+    """组合模式开关的回调：标记模式已切换（回调中不能调用 st.rerun）"""
+    st.session_state.portfolio_mode_changed = True
+
+@st.fragment
+def render_input_form() -> None:
+    """用户输入区域（输入内容保存在 session_state 中，供分析按钮读取）"""
+    st.subheader("📝 输入信息")
+    portfolio_mode = st.toggle(
+        "组合模式（同时分析多家公司）",
+        key="portfolio_mode",
+        on_change=mark_portfolio_mode_changed,
+        help="多家公司的竞争对手放入同一个共享队列，每个竞争对手只提取一次，再分发到各公司的对比表格和报告"
+    )
+    # 模式决定主程序显示组合结果还是单次结果，切换时重跑整个页面而不只是本区域
+    if st.session_state.pop('portfolio_mode_changed', False):
+        st.rerun()
+    if portfolio_mode:
+        st.text_area(
+            f"每行一家公司（URL 或描述，最多 {PORTFOLIO_MAX_TARGETS} 家）：",
+            placeholder="https://example.com\nAI驱动的数据分析平台",
+            height=200,
+            key="portfolio_targets"
+        )
+        discard_discovery_prefetch()
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        st.text_input("输入您的公司 URL：", placeholder="https://example.com", key="input_url")
+    with col2:
+        st.text_area("输入您公司的描述（如果 URL 不可用）：", placeholder="例如：AI驱动的数据分析平台", key="input_description")
+    
+    # 输入提交后（回车或失去焦点）开始推测性预取
+    if st.session_state.get('speculative_prefetch'):
+        prefetch = update_discovery_prefetch(
+            st.session_state.get('input_url', ''), st.session_state.get('input_description', '')
+        )
+        if prefetch is not None and not prefetch.consumed:
+            if prefetch.done:
+                st.caption(describe_discovery_prefetch(prefetch))
+            else:
+                render_prefetch_progress()
+    else:
+        discard_discovery_prefetch()
 
 # 竞争对手数据模式定义
 class CompetitorDataSchema(BaseModel):
@@ -217,261 +457,401 @@ class CompetitorDataSchema(BaseModel):
     marketing_focus: str = Field(description="主要营销角度和目标受众")
     customer_feedback: str = Field(description="客户推荐、评论和反馈")
 
-# OpenAI 分析器
-class OpenAIAnalyzer:
-    """使用 OpenAI 的竞争对手分析器"""
-    
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        if AGNO_AVAILABLE:
-            self.analysis_agent = Agent(
-                model=OpenAIChat(id="gpt-4o", api_key=api_key),
-                show_tool_calls=True,
-                markdown=True
-            )
-        else:
-            self.analysis_agent = None
-    
-    def analyze_competitors(self, competitor_data: List[Dict]) -> str:
-        """分析竞争对手数据"""
-        if not self.analysis_agent:
-            return "OpenAI Agent 未正确初始化，请检查 agno 库是否正确安装"
-        
-        # 格式化数据
-        formatted_data = json.dumps(competitor_data, indent=2, ensure_ascii=False)
-        
-        # 构建分析提示
-        analysis_prompt = f"""
-        请分析以下竞争对手数据，并提供详细的竞争分析报告：
+# 构建分析提示
+# 报告分析角度（完整分析和增量合并共用）：(角度, 依赖的提取字段)，依赖字段未被提取时省略该角度
+ANALYSIS_SECTIONS = [
+    ("市场定位分析 - 分析各竞争对手的市场定位和差异化策略", None),
+    ("产品功能对比 - 对比各竞争对手的核心功能和特性", "key_features"),
+    ("定价策略分析 - 分析定价模式和策略", "pricing"),
+    ("技术栈对比 - 分析各竞争对手使用的技术", "tech_stack"),
+    ("营销策略分析 - 分析目标受众和营销重点", "marketing_focus"),
+    ("竞争优势识别 - 识别各竞争对手的独特优势", None),
+    ("市场机会发现 - 发现市场空白和机会", None),
+    ("战略建议 - 提供具体的竞争策略建议", None),
+]
 
-        {formatted_data}
+def extracted_fields(competitor_data: List[Dict]) -> Set[str]:
+    """记录中实际包含的字段（按提取画像，只提取部分字段时其余字段不出现在记录中）"""
+    return {field for competitor in competitor_data for field in competitor}
 
+def build_analysis_requirements(competitor_data: List[Dict] = None) -> str:
+    """构建报告分析角度，省略所依赖字段未被提取的角度（未提供数据时包含全部角度）"""
+    fields = extracted_fields(competitor_data) if competitor_data is not None else set(EXTRACTION_FIELDS)
+    sections = [section for section, field in ANALYSIS_SECTIONS if field is None or field in fields]
+    section_lines = "\n".join(f"        {i}. {section}" for i, section in enumerate(sections, 1))
+    return f"""
         请从以下角度进行分析：
-        1. 市场定位分析 - 分析各竞争对手的市场定位和差异化策略
-        2. 产品功能对比 - 对比各竞争对手的核心功能和特性
-        3. 定价策略分析 - 分析定价模式和策略
-        4. 技术栈对比 - 分析各竞争对手使用的技术
-        5. 营销策略分析 - 分析目标受众和营销重点
-        6. 竞争优势识别 - 识别各竞争对手的独特优势
-        7. 市场机会发现 - 发现市场空白和机会
-        8. 战略建议 - 提供具体的竞争策略建议
+{section_lines}
 
         请提供具体、可操作的分析结果，重点关注如何获得竞争优势。
         请确保报告内容完整且不重复。
         """
-        
-        try:
-            report = self.analysis_agent.run(analysis_prompt)
-            content = report.content
-            
-            # 如果响应内容为空或过短，返回备用分析
-            if len(content.strip()) < 100:
-                return self._generate_fallback_analysis(competitor_data)
-            
-            return content
-        except Exception as e:
-            return f"分析过程中出现错误: {str(e)}"
-    
-    def _generate_fallback_analysis(self, competitor_data: List[Dict]) -> str:
-        """生成备用分析报告"""
-        if not competitor_data:
-            return "没有竞争对手数据可供分析"
-        
-        analysis = f"""
-# 竞争对手分析报告（OpenAI 备用版本）
 
-## 分析概览
-成功分析了 {len(competitor_data)} 个竞争对手的数据。
+def build_analysis_prompt(competitor_data: List[Dict], analytics_summary: str = None) -> str:
+    """构建竞争对手分析提示（有本地数值摘要时，用摘要代替原始技术栈列表并压缩长文本）"""
+    if analytics_summary:
+        compact_data = []
+        for competitor in competitor_data:
+            record = {key: value for key, value in competitor.items() if key != 'tech_stack'}
+            for field in ['pricing', 'marketing_focus', 'customer_feedback']:
+                if isinstance(record.get(field), str) and len(record[field]) > 300:
+                    record[field] = record[field][:300] + '...'
+            compact_data.append(record)
+        formatted_data = json.dumps(compact_data, ensure_ascii=False, separators=(',', ':'))
+        analytics_section = f"""
+        以下是本地计算的功能与技术栈相似度数值摘要（已确定，无需重新计算，请直接引用）：
 
-## 竞争对手列表
+        {analytics_summary}
 """
-        
-        for i, competitor in enumerate(competitor_data, 1):
-            analysis += f"""
-### {i}. {competitor.get('company_name', f'竞争对手 {i}')}
-- **网站**: {competitor.get('competitor_url', 'N/A')}
-- **定价策略**: {competitor.get('pricing', 'N/A')[:200]}...
-- **关键功能**: {', '.join(competitor.get('key_features', [])[:3]) if competitor.get('key_features') else 'N/A'}
-- **技术栈**: {', '.join(competitor.get('tech_stack', [])[:3]) if competitor.get('tech_stack') else 'N/A'}
-- **营销重点**: {competitor.get('marketing_focus', 'N/A')[:200]}...
+    else:
+        formatted_data = json.dumps(competitor_data, indent=2, ensure_ascii=False)
+        analytics_section = ""
+    
+    return f"""
+        请分析以下竞争对手数据，并提供详细的竞争分析报告：
 
-"""
-        
-        analysis += """
-## 基础分析建议
+        {formatted_data}
+{analytics_section}{build_analysis_requirements(competitor_data)}"""
 
-### 1. 市场定位分析
-- 分析各竞争对手的市场定位和差异化策略
-- 识别市场空白和机会
+# 模型路由：按提示长度、上下文需求和延迟/成本目标为每次调用选择模型
+# 模型档案：上下文窗口（tokens，保守估计）、相对延迟、相对成本、质量等级
+MODEL_PROFILES = {
+    "openai": {
+        "gpt-4o-mini": {"context": 128000, "latency": 1, "cost": 1, "quality": 2},
+        "gpt-4o": {"context": 128000, "latency": 2, "cost": 16, "quality": 3},
+    },
+    "qwen": {
+        "qwen-turbo": {"context": 131072, "latency": 1, "cost": 1, "quality": 1},
+        "qwen-plus": {"context": 131072, "latency": 2, "cost": 3, "quality": 2},
+        "qwen-max": {"context": 32768, "latency": 3, "cost": 8, "quality": 3},
+        "qwen-long": {"context": 10000000, "latency": 4, "cost": 2, "quality": 2},
+    },
+}
+OPENAI_DEFAULT_MODEL = "gpt-4o"
+QWEN_DEFAULT_MODEL = "qwen-max"
+ROUTING_SHORT_PROMPT_TOKENS = 4000
+ROUTING_OUTPUT_TOKENS = 4096
 
-### 2. 产品功能对比
-- 对比各竞争对手的核心功能和特性
-- 发现功能优势和不足
+# 各策略下不同阶段所需的最低质量等级：(短输入, 长输入)
+ROUTING_MIN_QUALITY = {
+    "latency": {"intermediate": (1, 1), "final": (1, 2)},
+    "balanced": {"intermediate": (1, 1), "final": (2, 3)},
+    "quality": {"intermediate": (2, 2), "final": (3, 3)},
+}
 
-### 3. 定价策略分析
-- 分析定价模式和策略
-- 制定有竞争力的定价方案
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数（中日韩字符约 1 token/字，其余约 4 字符/token）"""
+    cjk_chars = len(re.findall(r'[　-鿿＀-￯]', text))
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
 
-### 4. 技术栈对比
-- 分析各竞争对手使用的技术
-- 评估技术优势和劣势
+def route_model(provider: str, prompt: str, stage: str = "final", policy: str = "fixed",
+                fixed_model: str = None, output_tokens: int = ROUTING_OUTPUT_TOKENS) -> Dict[str, Any]:
+    """为单次调用选择模型，返回路由结果（模型、估计 token 数和选择原因）"""
+    profiles = MODEL_PROFILES.get(provider)
+    prompt_tokens = estimate_tokens(prompt)
+    route = {"provider": provider, "stage": stage, "policy": policy, "prompt_tokens": prompt_tokens}
+    if not profiles:
+        # 自定义后端（如本地服务）没有模型档案，始终使用配置的模型
+        route["model"] = fixed_model
+        route["reason"] = "无模型档案，使用配置的模型"
+        return route
+    
+    required_context = prompt_tokens + output_tokens
+    fitting = [model for model, profile in profiles.items() if profile["context"] >= required_context]
+    
+    if not fitting:
+        route["model"] = max(profiles, key=lambda model: profiles[model]["context"])
+        route["reason"] = "输入超出所有模型的上下文窗口，使用上下文最大的模型"
+        return route
+    
+    if policy == "fixed" or policy not in ROUTING_MIN_QUALITY:
+        if fixed_model in fitting:
+            route["model"] = fixed_model
+            route["reason"] = "使用固定选择的模型"
+        else:
+            route["model"] = min(fitting, key=lambda model: (-profiles[model]["quality"], profiles[model]["latency"]))
+            route["reason"] = f"{fixed_model} 上下文不足，改用可容纳输入的模型"
+        return route
+    
+    is_short = prompt_tokens <= ROUTING_SHORT_PROMPT_TOKENS
+    min_quality = ROUTING_MIN_QUALITY[policy][stage][0 if is_short else 1]
+    qualified = [model for model in fitting if profiles[model]["quality"] >= min_quality]
+    if qualified:
+        route["model"] = min(qualified, key=lambda model: (profiles[model]["latency"], profiles[model]["cost"]))
+        route["reason"] = f"{'短' if is_short else '长'}输入，满足质量等级 {min_quality} 的最快模型"
+    else:
+        route["model"] = max(fitting, key=lambda model: (profiles[model]["quality"], -profiles[model]["latency"]))
+        route["reason"] = f"可容纳输入的模型均低于质量等级 {min_quality}，使用其中质量最高的模型"
+    return route
 
-### 5. 营销策略分析
-- 分析目标受众和营销重点
-- 制定差异化营销策略
+def describe_model_route(route: Dict[str, Any]) -> str:
+    """生成模型路由的简短说明"""
+    description = f"模型路由: {route['model']}（提示约 {route['prompt_tokens']:,} tokens，{route['reason']}）"
+    if route.get('hedge'):
+        description += f"；{route['hedge']}，由备用提供方生成"
+    return description
 
-## 建议
-1. 深入分析竞争对手的优劣势
-2. 制定差异化竞争策略
-3. 关注市场趋势和客户需求
-4. 持续监控竞争对手动态
+# 分析器后端：统一的提示构建、备用报告和错误处理，各后端只需实现单次模型调用
+ANALYZER_SYSTEM_MESSAGE = "你是一个专业的竞争对手分析专家。请根据提供的信息进行深入分析，提供具体、可操作的建议。"
+OPENAI_COMPATIBLE_DEFAULT_BASE_URL = "http://localhost:8000/v1"
+OPENAI_COMPATIBLE_TIMEOUT = 600
 
----
-*注：此为备用分析报告，建议检查OpenAI API配置以获得更深入的分析。*
-"""
+class AnalyzerBackend(abc.ABC):
+    """竞争对手分析器后端基类"""
+    provider = ""
+    display_name = ""
+    not_ready_message = "分析器未正确初始化"
+    
+    def __init__(self, api_key: str, model: str, routing_policy: str = "fixed", job: "SchedulerJob" = None):
+        self.api_key = api_key
+        self.model = model
+        self.routing_policy = routing_policy
+        self.job = job
+        self.last_route = None
+    
+    def is_ready(self) -> bool:
+        """后端依赖和配置是否可用"""
+        return True
+    
+    def identity(self) -> List[str]:
+        """标识后端配置（用于合并相同请求和缓存报告）"""
+        return [self.provider, self.model, self.routing_policy]
+    
+    def credential_key(self) -> str:
+        """API 密钥的短哈希（合并请求时区分使用不同密钥的会话）"""
+        return credential_fingerprint(self.api_key)
+    
+    @abc.abstractmethod
+    def _stream(self, prompt: str, model: str) -> Iterator[str]:
+        """使用指定模型流式产出输出片段（由各后端实现）"""
+    
+    def _finalize(self, content: str) -> str:
+        """对完整输出做后处理"""
+        return content
+    
+    def _start(self, prompt: str, stage: str) -> Tuple[Dict[str, Any], Iterator[str]]:
+        """选择模型并开始流式调用，返回 (模型路由, 输出片段迭代器)"""
+        if not self.is_ready():
+            raise RuntimeError(self.not_ready_message)
+        route = route_model(self.provider, prompt, stage, self.routing_policy, self.model)
+        return route, self._stream(prompt, route["model"])
+    
+    def _finalize_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """产出输出片段；覆盖了 _finalize 的后端先缓冲，结束后产出处理过的完整输出（与 complete 的结果一致）"""
+        if type(self)._finalize is AnalyzerBackend._finalize:
+            yield from chunks
+        else:
+            yield self._finalize("".join(chunks))
+    
+    def stream(self, prompt: str, stage: str = "final") -> Iterator[str]:
+        """按路由选择的模型流式调用，逐个产出输出片段（出错时抛出异常）"""
+        route, chunks = self._start(prompt, stage)
+        self.last_route = route
+        yield from self._finalize_stream(chunks)
+    
+    def complete_with_route(self, prompt: str, stage: str = "final") -> Tuple[str, Dict[str, Any]]:
+        """完成单次调用，返回 (输出, 模型路由)（出错时抛出异常）
         
-        return analysis
+        同一分析器被多个线程并发调用时 last_route 只反映最后一次调用，需要准确路由时使用本方法的返回值。
+        """
+        route, chunks = self._start(prompt, stage)
+        self.last_route = route
+        return self._finalize("".join(chunks)), route
+    
+    def complete(self, prompt: str, stage: str = "final") -> str:
+        """按路由选择的模型完成单次调用（出错时抛出异常）"""
+        return self.complete_with_route(prompt, stage)[0]
+    
+    def analyze_competitors(self, competitor_data: List[Dict], analytics_summary: str = None) -> str:
+        """分析竞争对手数据"""
+        return self.analyze_competitors_with_route(competitor_data, analytics_summary)[0]
+    
+    def analyze_competitors_with_route(self, competitor_data: List[Dict],
+                                       analytics_summary: str = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """分析竞争对手数据，返回 (报告, 模型路由)（未调用模型或调用出错时路由为 None；多线程共用分析器时使用本方法）"""
+        if not self.is_ready():
+            return self.not_ready_message, None
+        
+        # 构建分析提示
+        analysis_prompt = build_analysis_prompt(competitor_data, analytics_summary)
+        
+        try:
+            content, route = self.complete_with_route(analysis_prompt)
+            
+            # 如果响应内容为空或过短，返回备用分析
+            if len(content.strip()) < 100:
+                return self._generate_fallback_analysis(competitor_data), route
+            
+            return content, route
+        except Exception as e:
+            return f"分析过程中出现错误: {str(e)}", None
+    
+    def _generate_fallback_analysis(self, competitor_data: List[Dict]) -> str:
+        """生成备用分析报告"""
+        return render_baseline_report(
+            competitor_data,
+            f"{self.display_name} 备用版本",
+            f"此为备用分析报告，建议检查{self.display_name} API配置以获得更深入的分析。"
+        )
+
+# OpenAI 分析器
+class OpenAIAnalyzer(AnalyzerBackend):
+    """使用 OpenAI 的竞争对手分析器"""
+    provider = "openai"
+    display_name = "OpenAI"
+    not_ready_message = "OpenAI Agent 未正确初始化，请检查 agno 库是否正确安装"
+    
+    def __init__(self, api_key: str, model: str = OPENAI_DEFAULT_MODEL, routing_policy: str = "fixed",
+                 job: "SchedulerJob" = None):
+        super().__init__(api_key, model, routing_policy, job)
+        self._agents = {}
+        if AGNO_AVAILABLE:
+            self.analysis_agent = self._get_agent(model)
+        else:
+            self.analysis_agent = None
+    
+    def is_ready(self) -> bool:
+        return self.analysis_agent is not None
+    
+    def _get_agent(self, model: str) -> "Agent":
+        """获取（并复用）指定模型的 Agent（Agent 会记录运行状态，每个线程各用一个实例）"""
+        key = (model, threading.get_ident())
+        if key not in self._agents:
+            self._agents[key] = Agent(
+                model=OpenAIChat(id=model, api_key=self.api_key),
+                show_tool_calls=True,
+                markdown=True
+            )
+        return self._agents[key]
+    
+    def _stream(self, prompt: str, model: str) -> Iterator[str]:
+        agent = self._get_agent(model)
+        for chunk in _scheduler.iterate("openai", self.api_key, self.job, lambda: agent.run(prompt, stream=True)):
+            if chunk.content:
+                yield chunk.content
 
 # Qwen 分析器
-class QwenAnalyzer:
+class QwenAnalyzer(AnalyzerBackend):
     """使用 Qwen 的竞争对手分析器"""
+    provider = "qwen"
+    display_name = "Qwen"
+    not_ready_message = "Qwen Agent 未正确初始化，请检查 qwen-agent 库是否正确安装"
     
-    def __init__(self, api_key: str, model: str):
-        self.api_key = api_key
-        self.model = model
-        self.llm_cfg = {
+    def __init__(self, api_key: str, model: str, routing_policy: str = "fixed", job: "SchedulerJob" = None):
+        super().__init__(api_key, model, routing_policy, job)
+        self._assistants = {}
+        self.llm_cfg = self._build_llm_cfg(model)
+        
+        # 初始化 Qwen Agent
+        if QWEN_AVAILABLE:
+            self.assistant = self._get_assistant(model)
+        else:
+            self.assistant = None
+    
+    def is_ready(self) -> bool:
+        return self.assistant is not None
+    
+    def _build_llm_cfg(self, model: str) -> Dict[str, Any]:
+        """构建指定模型的 LLM 配置"""
+        return {
             'model': model,
             'model_type': 'qwen_dashscope',
-            'api_key': api_key,
+            'api_key': self.api_key,
             'generate_cfg': {
                 'top_p': 0.8,
                 'temperature': 0.7
             }
         }
-        
-        # 初始化 Qwen Agent
-        if QWEN_AVAILABLE:
-            self.assistant = Assistant(
-                llm=self.llm_cfg,
-                system_message="你是一个专业的竞争对手分析专家。请根据提供的信息进行深入分析，提供具体、可操作的建议。",
+    
+    def _get_assistant(self, model: str) -> "Assistant":
+        """获取（并复用）指定模型的 Qwen Agent"""
+        if model not in self._assistants:
+            self._assistants[model] = Assistant(
+                llm=self._build_llm_cfg(model),
+                system_message=ANALYZER_SYSTEM_MESSAGE,
                 function_list=[]
             )
-        else:
-            self.assistant = None
+        return self._assistants[model]
     
-    def analyze_competitors(self, competitor_data: List[Dict]) -> str:
-        """分析竞争对手数据"""
-        if not self.assistant:
-            return "Qwen Agent 未正确初始化，请检查 qwen-agent 库是否正确安装"
-        
-        # 格式化数据
-        formatted_data = json.dumps(competitor_data, indent=2, ensure_ascii=False)
+    def _stream(self, prompt: str, model: str) -> Iterator[str]:
+        assistant = self._get_assistant(model)
         
-        # 构建分析提示
-        analysis_prompt = f"""
-        请分析以下竞争对手数据，并提供详细的竞争分析报告：
-
-        {formatted_data}
-
-        请从以下角度进行分析：
-        1. 市场定位分析 - 分析各竞争对手的市场定位和差异化策略
-        2. 产品功能对比 - 对比各竞争对手的核心功能和特性
-        3. 定价策略分析 - 分析定价模式和策略
-        4. 技术栈对比 - 分析各竞争对手使用的技术
-        5. 营销策略分析 - 分析目标受众和营销重点
-        6. 竞争优势识别 - 识别各竞争对手的独特优势
-        7. 市场机会发现 - 发现市场空白和机会
-        8. 战略建议 - 提供具体的竞争策略建议
-
-        请提供具体、可操作的分析结果，重点关注如何获得竞争优势。
-        请确保报告内容完整且不重复。
-        """
+        messages = [{'role': 'user', 'content': prompt}]
+        seen_content = set()  # 用于去重
+        last_content_length = 0  # 记录上次内容长度
         
-        try:
-            messages = [{'role': 'user', 'content': analysis_prompt}]
-            response_content = ""
-            seen_content = set()  # 用于去重
-            last_content_length = 0  # 记录上次内容长度
-            
-            # 处理Qwen Agent的流式响应
-            for response in self.assistant.run(messages=messages):
-                # 检查响应类型并提取内容
-                if isinstance(response, list):
-                    for item in response:
-                        if isinstance(item, dict):
-                            if 'content' in item:
-                                content = item['content']
-                                # 检查内容是否真正新增（避免重复的标题和开头）
-                                if content and len(content) > last_content_length:
-                                    new_content = content[last_content_length:]
-                                    if new_content not in seen_content and len(new_content.strip()) > 0:
-                                        response_content += new_content
-                                        seen_content.add(new_content)
-                                        last_content_length = len(content)
-                            elif 'extra' in item and 'model_service_info' in item['extra']:
-                                model_info = item['extra']['model_service_info']
-                                if 'output' in model_info and 'choices' in model_info['output']:
-                                    choices = model_info['output']['choices']
-                                    if choices and len(choices) > 0:
-                                        choice = choices[0]
-                                        if 'message' in choice and 'content' in choice['message']:
-                                            content = choice['message']['content']
-                                            if content and len(content) > last_content_length:
-                                                new_content = content[last_content_length:]
-                                                if new_content not in seen_content and len(new_content.strip()) > 0:
-                                                    response_content += new_content
-                                                    seen_content.add(new_content)
-                                                    last_content_length = len(content)
-                elif isinstance(response, dict):
-                    if 'content' in response:
-                        content = response['content']
-                        if content and len(content) > last_content_length:
-                            new_content = content[last_content_length:]
-                            if new_content not in seen_content and len(new_content.strip()) > 0:
-                                response_content += new_content
-                                seen_content.add(new_content)
-                                last_content_length = len(content)
-                    elif 'extra' in response and 'model_service_info' in response['extra']:
-                        model_info = response['extra']['model_service_info']
-                        if 'output' in model_info and 'choices' in model_info['output']:
-                            choices = model_info['output']['choices']
-                            if choices and len(choices) > 0:
-                                choice = choices[0]
-                                if 'message' in choice and 'content' in choice['message']:
-                                    content = choice['message']['content']
-                                    if content and len(content) > last_content_length:
-                                        new_content = content[last_content_length:]
-                                        if new_content not in seen_content and len(new_content.strip()) > 0:
-                                            response_content += new_content
-                                            seen_content.add(new_content)
-                                            last_content_length = len(content)
-                elif hasattr(response, 'content'):
-                    content = response.content
-                    if content and len(content) > last_content_length:
-                        new_content = content[last_content_length:]
-                        if new_content not in seen_content and len(new_content.strip()) > 0:
-                            response_content += new_content
-                            seen_content.add(new_content)
-                            last_content_length = len(content)
-                else:
-                    content = str(response)
+        # 处理Qwen Agent的流式响应
+        for response in _scheduler.iterate("dashscope", self.api_key, self.job, lambda: assistant.run(messages=messages)):
+            # 检查响应类型并提取内容
+            if isinstance(response, list):
+                for item in response:
+                    if isinstance(item, dict):
+                        if 'content' in item:
+                            content = item['content']
+                            # 检查内容是否真正新增（避免重复的标题和开头）
+                            if content and len(content) > last_content_length:
+                                new_content = content[last_content_length:]
+                                if new_content not in seen_content and len(new_content.strip()) > 0:
+                                    yield new_content
+                                    seen_content.add(new_content)
+                                    last_content_length = len(content)
+                        elif 'extra' in item and 'model_service_info' in item['extra']:
+                            model_info = item['extra']['model_service_info']
+                            if 'output' in model_info and 'choices' in model_info['output']:
+                                choices = model_info['output']['choices']
+                                if choices and len(choices) > 0:
+                                    choice = choices[0]
+                                    if 'message' in choice and 'content' in choice['message']:
+                                        content = choice['message']['content']
+                                        if content and len(content) > last_content_length:
+                                            new_content = content[last_content_length:]
+                                            if new_content not in seen_content and len(new_content.strip()) > 0:
+                                                yield new_content
+                                                seen_content.add(new_content)
+                                                last_content_length = len(content)
+            elif isinstance(response, dict):
+                if 'content' in response:
+                    content = response['content']
                     if content and len(content) > last_content_length:
                         new_content = content[last_content_length:]
                         if new_content not in seen_content and len(new_content.strip()) > 0:
-                            response_content += new_content
+                            yield new_content
                             seen_content.add(new_content)
                             last_content_length = len(content)
-            
-            # 如果响应内容为空或过短，返回备用分析
-            if len(response_content.strip()) < 100:
-                return self._generate_fallback_analysis(competitor_data)
-            
-            # 后处理：清理可能的重复内容
-            cleaned_content = self._clean_duplicate_content(response_content)
-            
-            return cleaned_content
-        except Exception as e:
-            return f"分析过程中出现错误: {str(e)}"
+                elif 'extra' in response and 'model_service_info' in response['extra']:
+                    model_info = response['extra']['model_service_info']
+                    if 'output' in model_info and 'choices' in model_info['output']:
+                        choices = model_info['output']['choices']
+                        if choices and len(choices) > 0:
+                            choice = choices[0]
+                            if 'message' in choice and 'content' in choice['message']:
+                                content = choice['message']['content']
+                                if content and len(content) > last_content_length:
+                                    new_content = content[last_content_length:]
+                                    if new_content not in seen_content and len(new_content.strip()) > 0:
+                                        yield new_content
+                                        seen_content.add(new_content)
+                                        last_content_length = len(content)
+            elif hasattr(response, 'content'):
+                content = response.content
+                if content and len(content) > last_content_length:
+                    new_content = content[last_content_length:]
+                    if new_content not in seen_content and len(new_content.strip()) > 0:
+                        yield new_content
+                        seen_content.add(new_content)
+                        last_content_length = len(content)
+            else:
+                content = str(response)
+                if content and len(content) > last_content_length:
+                    new_content = content[last_content_length:]
+                    if new_content not in seen_content and len(new_content.strip()) > 0:
+                        yield new_content
+                        seen_content.add(new_content)
+                        last_content_length = len(content)
+    
+    def _finalize(self, content: str) -> str:
+        # 后处理：清理可能的重复内容
+        return self._clean_duplicate_content(content)
     
     def _clean_duplicate_content(self, content: str) -> str:
         """清理重复的内容，特别是重复的标题和开头"""
@@ -544,258 +924,2128 @@ class QwenAnalyzer:
                     seen_paragraphs.add(paragraph_stripped)
         
         return '\n\n'.join(unique_paragraphs)
-    
-    def _generate_fallback_analysis(self, competitor_data: List[Dict]) -> str:
-        """生成备用分析报告"""
-        if not competitor_data:
-            return "没有竞争对手数据可供分析"
-        
-        analysis = f"""
-# 竞争对手分析报告（Qwen 备用版本）
 
-## 分析概览
-成功分析了 {len(competitor_data)} 个竞争对手的数据。
+# 调用取消：对冲中落败或被放弃的后端调用由其他线程取消，调用线程登记释放资源的回调（如中止 HTTP 响应），
+# 不必等到下一个输出片段到达
+_call_context = threading.local()
 
-## 竞争对手列表
-"""
-        
-        for i, competitor in enumerate(competitor_data, 1):
-            analysis += f"""
-### {i}. {competitor.get('company_name', f'竞争对手 {i}')}
-- **网站**: {competitor.get('competitor_url', 'N/A')}
-- **定价策略**: {competitor.get('pricing', 'N/A')[:200]}...
-- **关键功能**: {', '.join(competitor.get('key_features', [])[:3]) if competitor.get('key_features') else 'N/A'}
-- **技术栈**: {', '.join(competitor.get('tech_stack', [])[:3]) if competitor.get('tech_stack') else 'N/A'}
-- **营销重点**: {competitor.get('marketing_focus', 'N/A')[:200]}...
+class CallCancellation:
+    """一次后端调用的取消句柄"""
+    
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Any] = {}
+        self._ids = itertools.count()
+    
+    def cancel(self) -> None:
+        """取消调用并立即执行已登记的回调"""
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            callback()
+    
+    @contextmanager
+    def on_cancel(self, callback) -> Iterator[None]:
+        """在上下文内登记取消回调（已取消时立即执行）"""
+        with self._lock:
+            callback_id = None if self.cancelled.is_set() else next(self._ids)
+            if callback_id is not None:
+                self._callbacks[callback_id] = callback
+        if callback_id is None:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(callback_id, None)
 
+@contextmanager
+def on_call_cancelled(callback) -> Iterator[None]:
+    """为当前线程上的后端调用登记取消回调（调用未绑定取消句柄时不做任何事）"""
+    cancellation = getattr(_call_context, "cancellation", None)
+    if cancellation is None:
+        yield
+    else:
+        with cancellation.on_cancel(callback):
+            yield
+
+def abort_response(response: requests.Response) -> None:
+    """从其他线程中止流式响应：关闭底层套接字的读写，阻塞中的读取立即返回（仅关闭响应不会唤醒读取线程）"""
+    try:
+        with socket.socket(fileno=os.dup(response.raw.fileno())) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+# OpenAI 兼容接口分析器（如本地 vLLM、llama.cpp 服务）
+class OpenAICompatibleAnalyzer(AnalyzerBackend):
+    """通过 OpenAI 兼容的 /chat/completions 接口进行分析"""
+    provider = "openai_compatible"
+    display_name = "OpenAI 兼容接口"
+    not_ready_message = "OpenAI 兼容接口未正确配置，请填写服务地址和模型名称"
+    
+    def __init__(self, base_url: str, model: str, api_key: str = "", routing_policy: str = "fixed",
+                 job: "SchedulerJob" = None):
+        super().__init__(api_key, model, routing_policy, job)
+        self.base_url = (base_url or "").rstrip('/')
+    
+    def is_ready(self) -> bool:
+        return bool(self.base_url and self.model)
+    
+    def identity(self) -> List[str]:
+        return super().identity() + [self.base_url]
+    
+    def _stream(self, prompt: str, model: str) -> Iterator[str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": ANALYZER_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": 0.7,
+            "top_p": 0.8,
+            "stream": True,
+        }
+        # 按 (服务地址, API Key) 分配配额：不同服务即使共用密钥（或都不需要密钥）也互不占用
+        with _scheduler.slot(self.provider, json.dumps([self.base_url, self.api_key]), self.job), \
+                requests.post(f"{self.base_url}/chat/completions", json=payload, headers=headers,
+                              stream=True, timeout=OPENAI_COMPATIBLE_TIMEOUT) as response, \
+                on_call_cancelled(lambda: abort_response(response)):
+            response.raise_for_status()
+            for raw_line in response.iter_lines(decode_unicode=True):
+                if not raw_line or not raw_line.startswith("data:"):
+                    continue
+                data = raw_line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+
+# 对冲调用：主提供方在延迟内未输出首个片段时，在备用提供方上发起相同请求，先开始输出者胜出；
+# 出错时立即故障转移到下一个提供方
+HEDGE_DEFAULT_DELAY = 8.0  # 秒
+HEDGE_MAX_DELAY = 120.0
+ANALYZER_PROVIDER_LABELS = {
+    "openai": "OpenAI GPT-4",
+    "qwen": "Qwen (通义千问)",
+    "openai_compatible": "OpenAI 兼容接口（本地）",
+}
+
+class HedgedAnalyzer(AnalyzerBackend):
+    """按顺序对冲多个分析器后端（第一个为主提供方）"""
+    
+    def __init__(self, backends: List[AnalyzerBackend], hedge_delay: float = HEDGE_DEFAULT_DELAY):
+        primary = backends[0]
+        super().__init__(primary.api_key, primary.model, primary.routing_policy, primary.job)
+        self.backends = backends
+        self.hedge_delay = hedge_delay
+        self.provider = primary.provider
+        self.display_name = primary.display_name
+        self.not_ready_message = primary.not_ready_message
+    
+    def is_ready(self) -> bool:
+        return any(backend.is_ready() for backend in self.backends)
+    
+    def identity(self) -> List[Any]:
+        return ["hedged"] + [backend.identity() for backend in self.backends]
+    
+    def credential_key(self) -> str:
+        return ",".join(backend.credential_key() for backend in self.backends)
+    
+    def _stream(self, prompt: str, model: str) -> Iterator[str]:
+        # 各后端按自己的路由策略选择模型，这里的 model 参数不使用
+        for _, _, chunk in self._race(prompt, "final"):
+            yield chunk
+    
+    def _race(self, prompt: str, stage: str) -> Iterator[Tuple[AnalyzerBackend, Dict[str, Any], str]]:
+        """对冲执行一次调用，产出 (胜出的后端, 模型路由, 输出片段)"""
+        events: "queue.Queue[Tuple[int, str, Any]]" = queue.Queue()
+        cancellations = [CallCancellation() for _ in self.backends]
+        routes: List[Optional[Dict[str, Any]]] = [None] * len(self.backends)
+        
+        def run(index: int) -> None:
+            track_job_thread(self.backends[index].job)
+            # 后端在本线程上登记的取消回调由竞速循环在其他后端胜出时直接执行（如中止停滞的 HTTP 响应）
+            _call_context.cancellation = cancellations[index]
+            chunks = None
+            produced = False
+            try:
+                routes[index], chunks = self.backends[index]._start(prompt, stage)
+                for chunk in chunks:
+                    if cancellations[index].cancelled.is_set():
+                        return
+                    produced = True
+                    events.put((index, "chunk", chunk))
+                if produced:
+                    events.put((index, "done", None))
+                else:
+                    events.put((index, "error", RuntimeError("响应为空")))
+            except Exception as e:
+                events.put((index, "error", e))
+            finally:
+                # 关闭生成器以释放调度许可和网络连接
+                if chunks is not None:
+                    chunks.close()
+                _call_context.cancellation = None
+        
+        started = 0
+        failures: List[str] = []
+        winner = None
+        hedge_reason = None
+        
+        def start_next() -> None:
+            nonlocal started
+            threading.Thread(target=run, args=(started,), daemon=True).start()
+            started += 1
+        
+        start_next()
+        deadline = time.monotonic() + self.hedge_delay
+        try:
+            while True:
+                timeout = None
+                if winner is None and started < len(self.backends):
+                    timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    # 首个片段超时：在下一个提供方上发起相同请求
+                    hedge_reason = f"{self.backends[started - 1].display_name} 超过 {self.hedge_delay:g}s 未开始输出"
+                    start_next()
+                    deadline = time.monotonic() + self.hedge_delay
+                    continue
+                
+                if winner is not None and index != winner:
+                    continue
+                if kind == "error":
+                    if winner is not None:
+                        raise payload
+                    backend = self.backends[index]
+                    failures.append(f"{backend.display_name}: {payload}")
+                    hedge_reason = f"{backend.display_name} 出错，已故障转移"
+                    if started < len(self.backends):
+                        start_next()
+                        deadline = time.monotonic() + self.hedge_delay
+                    elif len(failures) == started:
+                        raise RuntimeError("所有提供方均调用失败（" + "；".join(failures) + "）")
+                    continue
+                
+                if winner is None:
+                    winner = index
+                    for other, cancellation in enumerate(cancellations):
+                        if other != index:
+                            cancellation.cancel()
+                    route = dict(routes[index], hedge=hedge_reason) if index else routes[index]
+                    self.last_route = route
+                if kind == "done":
+                    return
+                yield self.backends[index], route, payload
+        finally:
+            for cancellation in cancellations:
+                cancellation.cancel()
+    
+    def stream(self, prompt: str, stage: str = "final") -> Iterator[str]:
+        race = self._race(prompt, stage)
+        try:
+            first = next(race, None)
+            if first is None:
+                return
+            winner = first[0]
+            yield from winner._finalize_stream(itertools.chain([first[2]], (chunk for _, _, chunk in race)))
+        finally:
+            race.close()
+    
+    def complete_with_route(self, prompt: str, stage: str = "final") -> Tuple[str, Optional[Dict[str, Any]]]:
+        winner = route = None
+        parts = []
+        for winner, route, chunk in self._race(prompt, stage):
+            parts.append(chunk)
+        return (winner._finalize("".join(parts)) if winner is not None else ""), route
+
+# 增量报告：逐个竞争对手生成分析片段，按输入哈希缓存到磁盘，只重新分析变化的竞争对手
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", ".report_cache")
+REPORT_FRAGMENT_VERSION = 1  # 修改片段或合并提示后递增，使旧缓存失效
+REPORT_CACHE_MAX_ENTRIES = 2000  # 超出后删除最久未使用的缓存文件
+REPORT_CACHE_MAX_AGE = 30 * 24 * 3600  # 超过该时间（秒）未使用的缓存文件被删除
+INCREMENTAL_MAX_WORKERS = 4
+
+# 分析片段要点：(要点, 依赖的提取字段)
+FRAGMENT_SECTIONS = [
+    ("市场定位与差异化", None),
+    ("核心功能与特色", "key_features"),
+    ("定价模式", "pricing"),
+    ("技术栈特点", "tech_stack"),
+    ("目标受众与营销重点", "marketing_focus"),
+    ("主要优势与劣势", None),
+]
+
+def build_competitor_fragment_prompt(competitor: Dict) -> str:
+    """构建单个竞争对手的分析片段提示（省略记录中未提取字段对应的要点）"""
+    section_lines = "\n".join(
+        f"        - {section}" for section, field in FRAGMENT_SECTIONS if field is None or field in competitor
+    )
+    return f"""
+        请对以下单个竞争对手进行简明分析，作为综合竞争分析报告的素材：
+
+        {json.dumps(competitor, ensure_ascii=False, indent=2)}
+
+        请按以下要点输出（Markdown 列表，每项 1-3 句，总计不超过 300 字）：
+{section_lines}
+        """
+
+def build_report_merge_prompt(fragments: List[Tuple[str, str]], analytics_summary: str = None,
+                              competitor_data: List[Dict] = None) -> str:
+    """构建由各竞争对手分析片段合并为完整报告的提示"""
+    formatted_fragments = "\n\n".join(f"### {name}\n{text.strip()}" for name, text in fragments)
+    analytics_section = ""
+    if analytics_summary:
+        analytics_section = f"""
+        以下是本地计算的功能与技术栈相似度数值摘要（已确定，无需重新计算，请直接引用）：
+
+        {analytics_summary}
 """
+    return f"""
+        以下是对各竞争对手逐一分析得到的摘要，请据此撰写完整的竞争分析报告：
+
+{formatted_fragments}
+{analytics_section}{build_analysis_requirements(competitor_data)}"""
+
+def report_cache_key(kind: str, *parts: Any) -> str:
+    """报告缓存键：输入内容的哈希"""
+    payload = json.dumps([kind, REPORT_FRAGMENT_VERSION, *parts], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ReportFragmentCache:
+    """按输入哈希在磁盘上缓存报告片段和合并后的报告（按最近使用时间限制文件数和保留时间）"""
+
+    def __init__(self, directory: str = REPORT_CACHE_DIR, max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+                 max_age: float = REPORT_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目（文本及写入时附带的信息），命中时刷新修改时间作为最近使用时间"""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return entry.get("text") if entry else None
+
+    def put(self, key: str, text: str, **info: Any) -> None:
+        """原子写入，避免并发会话读到不完整的文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump({"text": text, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **info}, cache_file, ensure_ascii=False)
+        os.replace(temp_path, self._path(key))
+
+    def prune(self) -> int:
+        """删除超过保留时间未使用的文件，并在文件数超限时删除最久未使用的文件，返回删除数量"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith((".json", ".tmp"))]
+        except OSError:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        cutoff = time.time() - self.max_age
+        stale = [entry for entry in entries[:self.max_entries] if entry.stat().st_mtime < cutoff]
+        removed = 0
+        for entry in entries[self.max_entries:] + stale:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+class IncrementalReportBuilder:
+    """增量生成分析报告：记录一到达就提交该竞争对手的分析片段（缓存未命中时），全部记录到齐后合并为完整报告
+    
+    每个竞争对手的分析片段以（模型配置, API 密钥哈希, 记录内容）的哈希为键缓存，只有输入变化的片段重新调用 LLM；
+    合并步骤以全部片段键和相似度摘要为键缓存，输入完全不变时不调用 LLM（路由取自缓存条目）。
+    单个片段调用失败时合并提示改用该竞争对手的原始数据，其余成功的片段照常缓存。
+    """
+    
+    def __init__(self, analyzer: Any, cache: ReportFragmentCache = None, max_workers: int = INCREMENTAL_MAX_WORKERS):
+        self.analyzer = analyzer
+        self.cache = cache or ReportFragmentCache()
+        self.model_config = [analyzer.identity(), analyzer.credential_key()]
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, initializer=track_job_thread,
+                                           initargs=(getattr(analyzer, 'job', None),))
+        self.lock = threading.Lock()
+        self.cached: Dict[str, str] = {}
+        self.futures: Dict[str, Future] = {}
+    
+    def fragment_key(self, competitor: Dict) -> str:
+        return report_cache_key("fragment", self.model_config, competitor)
+    
+    def _compute_fragment(self, key: str, competitor: Dict) -> str:
+        fragment = self.analyzer.complete(build_competitor_fragment_prompt(competitor), "intermediate")
+        if fragment.strip():
+            self.cache.put(key, fragment, kind="fragment", url=competitor.get('competitor_url'))
+        return fragment
+    
+    def submit(self, competitor: Dict) -> str:
+        """登记一个竞争对手，片段缓存未命中时立即在线程池中开始分析，返回片段键"""
+        key = self.fragment_key(competitor)
+        with self.lock:
+            if key in self.cached or key in self.futures:
+                return key
+            fragment = self.cache.get(key)
+            if fragment is not None:
+                self.cached[key] = fragment
+            elif self.analyzer.is_ready():
+                self.futures[key] = self.executor.submit(self._compute_fragment, key, competitor)
+        return key
+    
+    def close(self) -> None:
+        """不再提交新片段（已开始的片段调用继续完成并写入缓存）"""
+        self.executor.shutdown(wait=False)
+    
+    def finish(self, competitor_data: List[Dict], analytics_summary: str = None
+               ) -> Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]]:
+        """等待最终记录的片段并合并，返回 (报告, 合并步骤的模型路由, 统计)（合并去重后的记录可能产生新的片段）"""
+        try:
+            if not self.analyzer.is_ready():
+                return self.analyzer.not_ready_message, None, {"reused": 0, "computed": 0, "failed": 0,
+                                                               "merge_cached": False}
+            fragment_keys = [self.submit(competitor) for competitor in competitor_data]
+            fragments: Dict[str, str] = {}
+            failed = set()
+            for key in fragment_keys:
+                if key in self.cached:
+                    fragments[key] = self.cached[key]
+                    continue
+                try:
+                    fragments[key] = self.futures[key].result()
+                except Exception:
+                    fragments[key] = ""
+                if not fragments[key].strip():
+                    failed.add(key)
+        finally:
+            self.close()
         
-        analysis += """
-## 基础分析建议
+        cache = self.cache
+        merge_key = report_cache_key("report", self.model_config, fragment_keys, analytics_summary)
+        cached_report = None if failed else cache.get_entry(merge_key)
+        reused = sum(key in self.cached for key in set(fragment_keys))
+        stats = {"reused": reused, "computed": len(set(fragment_keys)) - reused - len(failed), "failed": len(failed),
+                 "merge_cached": cached_report is not None}
+        if cached_report is not None:
+            report, route = cached_report.get("text", ""), cached_report.get("route")
+        else:
+            named_fragments = [
+                (competitor.get('company_name') or competitor.get('competitor_url') or f"竞争对手 {i}",
+                 fragments[key] if key not in failed else json.dumps(competitor, ensure_ascii=False))
+                for i, (key, competitor) in enumerate(zip(fragment_keys, competitor_data), 1)
+            ]
+            try:
+                report, route = self.analyzer.complete_with_route(
+                    build_report_merge_prompt(named_fragments, analytics_summary, competitor_data), "final"
+                )
+            except Exception as e:
+                report, route = f"分析过程中出现错误: {str(e)}", None
+            else:
+                # 与 analyze_competitors 一致：输出为空或过短时返回备用分析（不缓存）
+                if len(report.strip()) < 100:
+                    report = self.analyzer._generate_fallback_analysis(competitor_data)
+                elif not failed:
+                    cache.put(merge_key, report, kind="report", route=route)
+        if stats["computed"] or stats["failed"] or cached_report is None:
+            cache.prune()
+        return report, route, stats
 
-### 1. 市场定位分析
-- 分析各竞争对手的市场定位和差异化策略
-- 识别市场空白和机会
+def generate_incremental_report(analyzer: Any, competitor_data: List[Dict], analytics_summary: str = None,
+                                cache: ReportFragmentCache = None,
+                                max_workers: int = INCREMENTAL_MAX_WORKERS
+                                ) -> Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]]:
+    """增量生成分析报告，返回 (报告, 合并步骤的模型路由, 统计)（所有记录一次提交，见 IncrementalReportBuilder）"""
+    return IncrementalReportBuilder(analyzer, cache, max_workers).finish(competitor_data, analytics_summary)
 
-### 2. 产品功能对比
-- 对比各竞争对手的核心功能和特性
-- 发现功能优势和不足
+# 跨会话请求合并（single-flight）
+class _LeaderAborted(Exception):
+    """执行请求的会话被中断（如页面重新运行），等待者应重新发起请求"""
 
-### 3. 定价策略分析
-- 分析定价模式和策略
-- 制定有竞争力的定价方案
+class _SharedStream:
+    """可被多个消费者同时迭代的缓冲流"""
+    
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.abandoned = False
+        self.consumers = 0
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+    
+    def pump(self, iterator_factory) -> None:
+        """消费源迭代器并写入缓冲（在独立线程中运行，单个消费者提前退出不会截断其他消费者；
+        所有消费者都退出后停止消费并关闭源迭代器）"""
+        iterator = iterator_factory()
+        try:
+            for item in iterator:
+                with self.condition:
+                    if self.abandoned:
+                        break
+                    self.items.append(item)
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+    
+    def attach(self) -> bool:
+        """登记一个消费者，流已被放弃时返回 False"""
+        with self.condition:
+            if self.abandoned:
+                return False
+            self.consumers += 1
+            return True
+    
+    def iterate(self) -> Iterator[Any]:
+        """迭代缓冲流（需先调用 attach 登记），退出时注销，最后一个消费者退出后放弃该流"""
+        index = 0
+        try:
+            while True:
+                with self.condition:
+                    while index >= len(self.items) and not self.done:
+                        self.condition.wait()
+                    if index < len(self.items):
+                        item = self.items[index]
+                        index += 1
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                yield item
+        finally:
+            with self.condition:
+                self.consumers -= 1
+                if self.consumers == 0 and not self.done:
+                    self.abandoned = True
+
+class SingleFlight:
+    """进程级请求合并：相同键的并发请求只执行一次，结果共享给所有等待的会话"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Future] = {}
+        self.streams: Dict[str, _SharedStream] = {}
+        self.stats = {"executed": 0, "shared": 0}
+    
+    def do(self, key: str, fn, *args, **kwargs) -> Tuple[Any, bool]:
+        """执行或加入相同键的进行中请求，返回 (结果, 是否复用了其他请求)"""
+        while True:
+            with self.lock:
+                future = self.calls.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = Future()
+                    self.calls[key] = future
+                    self.stats["executed"] += 1
+                else:
+                    self.stats["shared"] += 1
+            
+            if is_leader:
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                except BaseException:
+                    future.set_exception(_LeaderAborted())
+                    raise
+                else:
+                    future.set_result(result)
+                    return result, False
+                finally:
+                    with self.lock:
+                        self.calls.pop(key, None)
+            
+            try:
+                return future.result(), True
+            except _LeaderAborted:
+                continue
+    
+    def stream(self, key: str, iterator_factory) -> Iterator[Any]:
+        """流式请求合并：相同键的进行中请求共享同一个产出序列（所有消费者退出后停止源请求）"""
+        with self.lock:
+            shared_stream = self.streams.get(key)
+            if shared_stream is not None and shared_stream.attach():
+                self.stats["shared"] += 1
+            else:
+                shared_stream = _SharedStream()
+                shared_stream.attach()
+                self.streams[key] = shared_stream
+                self.stats["executed"] += 1
+                
+                def pump() -> None:
+                    shared_stream.pump(iterator_factory)
+                    with self.lock:
+                        if self.streams.get(key) is shared_stream:
+                            del self.streams[key]
+                
+                threading.Thread(target=pump, daemon=True).start()
+        return shared_stream.iterate()
+
+def single_flight_key(*parts: Any) -> str:
+    """根据请求参数生成合并键"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def credential_fingerprint(api_key: Optional[str]) -> str:
+    """API 密钥的短哈希：用于区分不同租户的合并键、缓存键和配额，不保存密钥本身"""
+    return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:12]
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight() -> SingleFlight:
+    """获取进程内所有会话共享的 SingleFlight 实例"""
+    return SingleFlight()
+
+_single_flight = get_single_flight()
+
+# 全局提供方调用调度（按 API 密钥限制并发和速率，会话间加权公平排队）
+# 各提供方每个 API 密钥的默认限额：(最大并发数, 每分钟请求数)
+# 流式调用（Perplexity、OpenAI、DashScope、本地服务）在整个响应输出期间占用一个并发名额，
+# 与提供方按打开的连接计算并发的方式一致；速率令牌只在请求开始时消耗一次
+PROVIDER_QUOTAS = {
+    "perplexity": (3, 50),
+    "exa": (5, 60),
+    "firecrawl": (5, 60),
+    "openai": (4, 60),
+    "dashscope": (4, 60),
+    "openai_compatible": (4, 600),  # 本地服务没有按分钟计费限制，只限制并发
+}
+DEFAULT_PROVIDER_QUOTA = (4, 60)
+
+# 作业优先级对应的公平排队权重
+JOB_PRIORITY_WEIGHTS = {"interactive": 2.0, "batch": 1.0}
+
+class SchedulerJob:
+    """调度作业：所属会话、公平排队权重和为本作业工作的线程（供采样分析器只采集本次运行）"""
+    
+    def __init__(self, session_id: str, weight: float = 1.0):
+        self.session_id = session_id
+        self.weight = weight
+        self.thread_idents: Set[int] = set()
+
+DEFAULT_SCHEDULER_JOB = SchedulerJob("default")
+
+def track_job_thread(job: Optional[SchedulerJob]) -> None:
+    """登记当前线程为作业工作（在作业启动的线程开头调用，或作为线程池的 initializer）"""
+    if job is not None and job is not DEFAULT_SCHEDULER_JOB:
+        job.thread_idents.add(threading.get_ident())
+
+class ProviderScheduler:
+    """进程级提供方调用调度器
+    
+    每个 (提供方, API 密钥) 是一个独立资源，具有并发上限和令牌桶速率限制；
+    等待中的调用按自时钟加权公平排队（SCFQ）的完成标签出队，
+    因此单个会话的大批量任务不会挤占其他会话的配额。
+    """
+    
+    def __init__(self, quotas: Dict[str, Tuple[int, int]]):
+        self.quotas = quotas
+        self.condition = threading.Condition()
+        self.resources: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.sequence = itertools.count()
+    
+    def _get_resource(self, provider: str, api_key: str) -> Dict[str, Any]:
+        key_hash = credential_fingerprint(api_key)
+        resource = self.resources.get((provider, key_hash))
+        if resource is None:
+            concurrency, per_minute = self.quotas.get(provider, DEFAULT_PROVIDER_QUOTA)
+            resource = {
+                "provider": provider,
+                "key_hash": key_hash,
+                "concurrency": concurrency,
+                "per_minute": per_minute,
+                "tokens": float(concurrency),
+                "refilled_at": time.monotonic(),
+                "active": 0,
+                "waiting": [],
+                "virtual_time": 0.0,
+                "session_finish": {},
+                "served": 0,
+                "total_wait": 0.0,
+                "max_wait": 0.0,
+            }
+            self.resources[(provider, key_hash)] = resource
+        return resource
+    
+    @staticmethod
+    def _refill(resource: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        rate = resource["per_minute"] / 60.0
+        resource["tokens"] = min(float(resource["concurrency"]), resource["tokens"] + (now - resource["refilled_at"]) * rate)
+        resource["refilled_at"] = now
+    
+    @contextmanager
+    def slot(self, provider: str, api_key: str, job: SchedulerJob = None, cost: float = 1.0):
+        """排队获取一次提供方调用的执行许可"""
+        job = job or DEFAULT_SCHEDULER_JOB
+        with self.condition:
+            resource = self._get_resource(provider, api_key)
+            start_tag = max(resource["virtual_time"], resource["session_finish"].get(job.session_id, 0.0))
+            finish_tag = start_tag + cost / job.weight
+            resource["session_finish"][job.session_id] = finish_tag
+            ticket = (finish_tag, next(self.sequence), job.session_id)
+            heapq.heappush(resource["waiting"], ticket)
+            enqueued_at = time.monotonic()
+            
+            try:
+                while True:
+                    self._refill(resource)
+                    if (resource["waiting"][0] is ticket and resource["active"] < resource["concurrency"]
+                            and resource["tokens"] >= 1):
+                        break
+                    timeout = None
+                    if resource["tokens"] < 1:
+                        timeout = (1 - resource["tokens"]) * 60.0 / resource["per_minute"]
+                    self.condition.wait(timeout)
+            except BaseException:
+                # 等待被中断（如线程被停止）：撤销排队，避免队首的失效票据阻塞后续调用
+                resource["waiting"].remove(ticket)
+                heapq.heapify(resource["waiting"])
+                if resource["session_finish"].get(job.session_id) == finish_tag:
+                    resource["session_finish"][job.session_id] = start_tag
+                self.condition.notify_all()
+                raise
+            
+            heapq.heappop(resource["waiting"])
+            resource["active"] += 1
+            resource["tokens"] -= 1
+            resource["virtual_time"] = finish_tag
+            resource["session_finish"] = {
+                session_id: tag for session_id, tag in resource["session_finish"].items() if tag > finish_tag
+            }
+            wait_time = time.monotonic() - enqueued_at
+            resource["served"] += 1
+            resource["total_wait"] += wait_time
+            resource["max_wait"] = max(resource["max_wait"], wait_time)
+            self.condition.notify_all()
+        
+        try:
+            yield
+        finally:
+            with self.condition:
+                resource["active"] -= 1
+                self.condition.notify_all()
+    
+    def iterate(self, provider: str, api_key: str, job: Optional[SchedulerJob], iterator_factory) -> Iterator[Any]:
+        """在一次执行许可内消费流式响应（许可一直占用到响应结束或消费者停止迭代）"""
+        with self.slot(provider, api_key, job):
+            yield from iterator_factory()
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """返回各资源的队列状态"""
+        with self.condition:
+            return [
+                {
+                    "提供方": resource["provider"],
+                    "密钥": f"…{resource['key_hash'][-4:]}",
+                    "运行中": f"{resource['active']}/{resource['concurrency']}",
+                    "排队": len(resource["waiting"]),
+                    "排队会话": len({ticket[2] for ticket in resource["waiting"]}),
+                    "平均等待(秒)": round(resource["total_wait"] / resource["served"], 2) if resource["served"] else 0.0,
+                    "最长等待(秒)": round(resource["max_wait"], 2),
+                    "每分钟限额": resource["per_minute"],
+                }
+                for resource in self.resources.values()
+            ]
+
+@st.cache_resource(show_spinner=False)
+def get_provider_scheduler() -> ProviderScheduler:
+    """获取进程内所有会话共享的提供方调度器"""
+    return ProviderScheduler(PROVIDER_QUOTAS)
+
+_scheduler = get_provider_scheduler()
+
+def get_current_job() -> SchedulerJob:
+    """根据当前会话和侧边栏优先级构建调度作业"""
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx is not None else "local"
+    weight = JOB_PRIORITY_WEIGHTS.get(st.session_state.get('job_priority', 'interactive'), 1.0)
+    return SchedulerJob(session_id, weight)
+
+@st.fragment
+def render_scheduler_status() -> None:
+    """显示调度队列和请求合并统计（刷新时只重跑本区域）"""
+    st.button("🔄 刷新", key="refresh_scheduler_status")
+    rows = _scheduler.snapshot()
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    else:
+        st.caption("暂无提供方调用")
+    stats = _single_flight.stats
+    st.caption(f"请求合并：实际执行 {stats['executed']} 次，复用进行中请求 {stats['shared']} 次")
+
+# 获取竞争对手 URL 的函数
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+
+_URL_PATTERN = re.compile(r'https?://[^\s<>"\'()\[\]]+')
+
+def _parse_url_line(line: str) -> Optional[str]:
+    """从一行回答中解析 URL（兼容编号、Markdown 链接等格式）"""
+    match = _URL_PATTERN.search(line)
+    if match:
+        return match.group(0).rstrip('.,;')
+    candidate = line.strip().strip('-*•').strip()
+    return candidate if candidate and '.' in candidate and ' ' not in candidate else None
+
+def _iter_perplexity_urls(url: str, description: str, api_key: str, num_results: int,
+                          job: SchedulerJob = None) -> Iterator[str]:
+    """流式调用 Perplexity，每解析出一行 URL 立即产出"""
+    content = f"找到 {num_results} 个与公司相似的竞争对手公司 URL，"
+    if url and description:
+        content += f"URL: {url} 和描述: {description}"
+    elif url:
+        content += f"URL: {url}"
+    else:
+        content += f"描述: {description}"
+    content += "。只返回 URL，不要其他文本。"
+
+    payload = {
+        "model": "sonar-pro",
+        "messages": [
+            {
+                "role": "system",
+                "content": f"精确并只返回  {num_results}个公司 URL。"
+            },
+            {
+                "role": "user",
+                "content": content
+            }
+        ],
+        "max_tokens": 1000,
+        "temperature": 0.8,
+        "stream": True,
+    }
+    
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    buffer = ""
+    with _scheduler.slot("perplexity", api_key, job), \
+            requests.post(PERPLEXITY_API_URL, json=payload, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for raw_line in response.iter_lines(decode_unicode=True):
+            if not raw_line or not raw_line.startswith("data:"):
+                continue
+            data = raw_line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get('choices') or [{}]
+            buffer += (choices[0].get('delta') or {}).get('content') or ""
+            while '\n' in buffer:
+                line, buffer = buffer.split('\n', 1)
+                competitor_url = _parse_url_line(line)
+                if competitor_url:
+                    yield competitor_url
+    
+    competitor_url = _parse_url_line(buffer)
+    if competitor_url:
+        yield competitor_url
+
+def _iter_exa_urls(url: str, description: str, api_key: str, num_results: int,
+                   job: SchedulerJob = None) -> Iterator[str]:
+    """调用 Exa 查找竞争对手 URL"""
+    if not EXA_AVAILABLE:
+        raise RuntimeError("Exa 库未安装，请运行: pip install exa-py")
+    
+    exa = Exa(api_key=api_key)
+    
+    with _scheduler.slot("exa", api_key, job):
+        if url:
+            # 使用 find_similar 查找相似网站
+            result = exa.find_similar(
+                url=url,
+                num_results=num_results,
+                exclude_source_domain=True,
+                category="company"
+            )
+        else:
+            # 使用 search 根据描述搜索
+            result = exa.search(
+                description,
+                type="neural",
+                category="company",
+                use_autoprompt=True,
+                num_results=num_results
+            )
+    
+    urls = [item.url for item in result.results]
+    yield from urls
+    
+    # 如果结果不足，尝试使用不同的搜索策略补充
+    if len(urls) < num_results and description:
+        try:
+            with _scheduler.slot("exa", api_key, job):
+                additional_result = exa.search(
+                    f"{description} competitors",
+                    type="neural",
+                    num_results=num_results - len(urls)
+                )
+            yield from (item.url for item in additional_result.results)
+        except Exception:
+            pass
+
+def _discover_unique_urls(url: str, description: str, search_engine: str, api_key: str,
+                          num_results: int, job: SchedulerJob = None) -> Iterator[str]:
+    """调用搜索引擎并逐个产出去重后的 URL（合并请求时在共享的读取线程中运行，登记到发起请求的作业）"""
+    track_job_thread(job)
+    if search_engine == "perplexity":
+        url_stream = _iter_perplexity_urls(url, description, api_key, num_results, job)
+    else:
+        url_stream = _iter_exa_urls(url, description, api_key, num_results, job)
+    
+    seen = set()
+    for competitor_url in url_stream:
+        if competitor_url not in seen:
+            seen.add(competitor_url)
+            yield competitor_url
+            if len(seen) >= num_results:
+                break
+
+def iter_competitor_urls(url: str = None, description: str = None, search_engine: str = "perplexity",
+                         api_key: str = None, num_results: int = 10, job: SchedulerJob = None) -> Iterator[str]:
+    """逐个产出去重后的竞争对手 URL（不依赖 Streamlit 会话，可在后台线程中调用）
+    
+    相同输入和 API 密钥的并发发现请求在所有会话间合并为一次搜索引擎调用。
+    """
+    if not url and not description:
+        raise ValueError("请提供 URL 或描述")
+    
+    key = single_flight_key("discover", search_engine, credential_fingerprint(api_key), url, description, num_results)
+    yield from _single_flight.stream(
+        key, lambda: _discover_unique_urls(url, description, search_engine, api_key, num_results, job)
+    )
+
+def get_search_api_key(search_engine: str) -> Optional[str]:
+    """获取当前会话中搜索引擎对应的 API 密钥"""
+    if search_engine == "perplexity":
+        return st.session_state.get('perplexity_api_key')
+    return st.session_state.get('exa_api_key')
+
+# 使用 Firecrawl 提取竞争对手信息
+def _get_extracted_field(extracted_info: Any, field: str, default: Any) -> Any:
+    """从字典或对象形式的提取结果中读取字段"""
+    if isinstance(extracted_info, dict):
+        return extracted_info.get(field, default)
+    return getattr(extracted_info, field, default)
+
+# 提取画像：只提取关心的字段，缩小 schema 和提示
+EXTRACTION_FIELDS = list(CompetitorDataSchema.model_fields)
+
+EXTRACTION_FIELD_PROMPTS = {
+    "company_name": "公司名称和基本信息",
+    "pricing": "定价详情、计划和层级",
+    "key_features": "关键功能和主要能力",
+    "tech_stack": "技术栈和技术详情",
+    "marketing_focus": "营销重点和目标受众",
+    "customer_feedback": "客户反馈和推荐",
+}
+
+EXTRACTION_PROFILES = {
+    "full": ("完整", tuple(EXTRACTION_FIELDS)),
+    "pricing": ("仅定价", ("company_name", "pricing")),
+    "features": ("产品功能", ("company_name", "key_features", "marketing_focus")),
+    "tech": ("技术栈", ("company_name", "tech_stack")),
+}
+
+EXTRACTION_CACHE_TTL = 6 * 3600
+EXTRACTION_CACHE_MAX_ENTRIES = 5000  # 超出后删除最久未写入的 URL
+EXTRACTION_CACHE_SWEEP_INTERVAL = 60  # 写入时清理过期字段的最小间隔（秒）
+
+def get_extraction_fields(profile: str) -> Tuple[str, ...]:
+    """返回提取画像包含的字段（未知画像按完整提取）"""
+    return EXTRACTION_PROFILES.get(profile, EXTRACTION_PROFILES["full"])[1]
+
+def build_extraction_schema(fields: Iterable[str]) -> Dict[str, Any]:
+    """只保留指定字段的提取 schema"""
+    fields = list(fields)
+    schema = CompetitorDataSchema.model_json_schema()
+    schema["properties"] = {field: schema["properties"][field] for field in fields}
+    schema["required"] = [field for field in schema.get("required", []) if field in fields]
+    return schema
+
+def build_extraction_prompt(fields: Iterable[str]) -> str:
+    """只询问指定字段的提取提示"""
+    field_lines = "\n".join(f"    - {EXTRACTION_FIELD_PROMPTS[field]}" for field in fields)
+    return f"""
+    提取有关公司产品的详细信息，包括：
+{field_lines}
+    
+    分析整个网站内容，为每个字段提供全面信息。
+    """
+
+class ExtractionFieldCache:
+    """按 (API 密钥, URL, 字段) 缓存提取结果，不同画像提取的部分字段合并为同一条记录
+    
+    缓存在同一进程的所有会话间共享，但按 API 密钥隔离：只有使用相同 Firecrawl 密钥的会话复用彼此的提取结果。
+    """
+
+    def __init__(self, ttl: float = EXTRACTION_CACHE_TTL, max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Tuple[float, Any]]] = {}
+        self._swept_at = time.time()
+
+    @staticmethod
+    def _key(competitor_url: str, api_key: str) -> str:
+        return f"{credential_fingerprint(api_key)}:{competitor_url.strip().rstrip('/').lower()}"
+
+    def _evict_expired(self, key: str, now: float) -> Dict[str, Tuple[float, Any]]:
+        """删除条目中的过期字段，字段全部过期时删除整个条目（调用方持有锁）"""
+        entry = self._entries.get(key, {})
+        for field in [field for field, (stored_at, _) in entry.items() if now - stored_at >= self.ttl]:
+            del entry[field]
+        if not entry:
+            self._entries.pop(key, None)
+        return entry
+
+    def get(self, competitor_url: str, api_key: str) -> Dict[str, Any]:
+        """返回该密钥下该 URL 所有未过期的字段"""
+        with self._lock:
+            entry = self._evict_expired(self._key(competitor_url, api_key), time.time())
+            return {field: value for field, (_, value) in entry.items()}
+
+    def put(self, competitor_url: str, api_key: str, values: Dict[str, Any]) -> None:
+        """写入字段（条目移到最新位置），定期清理过期字段，并在条目数超限时删除最久未写入的条目"""
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at >= EXTRACTION_CACHE_SWEEP_INTERVAL:
+                for key in list(self._entries):
+                    self._evict_expired(key, now)
+                self._swept_at = now
+            key = self._key(competitor_url, api_key)
+            entry = self._entries.pop(key, {})
+            entry.update({field: (now, value) for field, value in values.items()})
+            if entry:
+                self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+@st.cache_resource(show_spinner=False)
+def get_extraction_cache() -> ExtractionFieldCache:
+    """获取进程内所有会话共享的字段级提取缓存"""
+    return ExtractionFieldCache()
+
+_extraction_cache = get_extraction_cache()
+
+def build_competitor_record(competitor_url: str, values: Dict[str, Any], fields: Iterable[str] = None) -> Optional[Dict]:
+    """由（可能不完整的）字段值构建竞争对手记录，只包含画像请求的字段，请求但缺失的字段填充 N/A
+    
+    请求的字段全部为空时返回 None（视为提取失败）。
+    """
+    fields = list(fields or EXTRACTION_FIELDS)
+    if not any(values.get(field) for field in fields):
+        return None
+    record = {"competitor_url": competitor_url}
+    for field in EXTRACTION_FIELDS:
+        if field not in fields:
+            continue
+        if field in ('key_features', 'tech_stack'):
+            record[field] = (values.get(field) or ['N/A'])[:5]
+        else:
+            record[field] = values.get(field) or 'N/A'
+    return record
+
+def extract_competitor_record(competitor_url: str, api_key: str, job: SchedulerJob = None,
+                              fields: Iterable[str] = None, use_cache: bool = True) -> Optional[Dict]:
+    """使用 Firecrawl 提取竞争对手信息（不依赖 Streamlit 会话，失败时抛出异常）
+    
+    相同 URL、字段和 API 密钥的并发提取请求在所有会话间合并为一次 Firecrawl 调用。
+    """
+    fields = tuple(fields or EXTRACTION_FIELDS)
+    record, _ = _single_flight.do(
+        single_flight_key("extract", credential_fingerprint(api_key), competitor_url, fields, use_cache),
+        _extract_competitor_record, competitor_url, api_key, job, fields, use_cache
+    )
+    return record
+
+def _extract_competitor_record(competitor_url: str, api_key: str, job: SchedulerJob = None,
+                               fields: Iterable[str] = None, use_cache: bool = True) -> Optional[Dict]:
+    """调用 Firecrawl 提取单个竞争对手信息，只请求缓存中没有的字段"""
+    fields = list(fields or EXTRACTION_FIELDS)
+    values = _extraction_cache.get(competitor_url, api_key)
+    missing_fields = [field for field in fields if not use_cache or field not in values]
+    if not missing_fields:
+        return build_competitor_record(competitor_url, values, fields)
+    
+    if not FIRECRAWL_AVAILABLE:
+        raise RuntimeError("Firecrawl 库未安装，请运行: pip install firecrawl-py")
+        
+    # 初始化 FirecrawlApp
+    app = FirecrawlApp(api_key=api_key)
+    
+    # 添加通配符以爬取子页面
+    url_pattern = f"{competitor_url}/*"
+    
+    # 调用 Firecrawl 提取功能（只包含缺失字段的 schema 和提示）
+    with _scheduler.slot("firecrawl", api_key, job):
+        response = app.extract(
+            [url_pattern],
+            prompt=build_extraction_prompt(missing_fields),
+            schema=build_extraction_schema(missing_fields)
+        )
+    
+    # 处理 ExtractResponse 对象（兼容返回字典的 SDK 版本）
+    success = response.get('success') if isinstance(response, dict) else getattr(response, 'success', False)
+    extracted_info = response.get('data') if isinstance(response, dict) else getattr(response, 'data', None)
+    if not success or not extracted_info:
+        return None
+    
+    # 新提取的字段写入缓存，与之前其他画像提取的字段合并
+    extracted_values = {field: _get_extracted_field(extracted_info, field, None) for field in missing_fields}
+    extracted_values = {field: value for field, value in extracted_values.items() if value not in (None, '', [])}
+    _extraction_cache.put(competitor_url, api_key, extracted_values)
+    values.update(extracted_values)
+    return build_competitor_record(competitor_url, values, fields)
+
+# 近重复竞争对手检测（MinHash / LSH）
+MINHASH_NUM_PERM = 64
+LSH_BANDS = 16
+MINHASH_PRIME = (1 << 31) - 1
+NEAR_DUPLICATE_THRESHOLD = 0.6
+# 提取结果按内容合并的阈值（高于页面指纹阈值，且只在品牌主体相同的记录之间比较）
+RECORD_MERGE_THRESHOLD = 0.8
+
+# 未安装 tldextract 时使用的常见二级公共后缀（如 co.uk、com.cn）
+_SECOND_LEVEL_SUFFIXES = {'co', 'com', 'net', 'org', 'gov', 'edu', 'ac'}
+
+# 共享托管和内容平台：不同公司共用同一个可注册域名，按完整主机名和路径区分
+SHARED_HOSTING_DOMAINS = {
+    "github.io", "gitlab.io", "vercel.app", "netlify.app", "pages.dev", "herokuapp.com", "onrender.com",
+    "fly.dev", "railway.app", "web.app", "firebaseapp.com", "appspot.com", "azurewebsites.net",
+    "cloudfront.net", "myshopify.com", "wixsite.com", "squarespace.com", "webflow.io", "framer.website",
+    "notion.site", "carrd.co", "bubbleapps.io", "glitch.me", "readthedocs.io", "gitbook.io",
+    "wordpress.com", "blogspot.com", "medium.com", "substack.com", "github.com", "g2.com",
+    "capterra.com", "producthunt.com", "crunchbase.com", "linkedin.com", "twitter.com", "x.com",
+    "facebook.com", "youtube.com", "apps.apple.com", "play.google.com",
+}
+
+_minhash_rng = np.random.default_rng(20240601)
+_MINHASH_A = _minhash_rng.integers(1, MINHASH_PRIME, size=MINHASH_NUM_PERM, dtype=np.uint64)
+_MINHASH_B = _minhash_rng.integers(0, MINHASH_PRIME, size=MINHASH_NUM_PERM, dtype=np.uint64)
+
+def _split_registered_domain(host: str) -> Tuple[str, str]:
+    """将主机名拆分为 (品牌主体, 公共后缀)，如 app.acme.co.uk -> (acme, co.uk)"""
+    if TLDEXTRACT_AVAILABLE:
+        parts = _tld_extract(host)
+        if parts.domain:
+            return parts.domain, parts.suffix
+    labels = host.split('.')
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL_SUFFIXES:
+        return labels[-3], '.'.join(labels[-2:])
+    if len(labels) >= 2:
+        return labels[-2], labels[-1]
+    return host, ''
+
+def competitor_brand_parts(competitor_url: str) -> Optional[Tuple[str, str]]:
+    """返回 (品牌去重键, 品牌主体)，无法解析主机名时返回 None
+    
+    去重键为可注册域名（app.acme.co.uk 与 acme.co.uk 相同，acme.com 与 acme.ai 不同）；
+    共享托管平台（如 foo.github.io、medium.com/@acme）使用完整主机名和路径。
+    品牌主体（acme.com 与 acme.de 均为 acme）只作为按内容合并的候选条件。
+    """
+    parsed = urlparse(competitor_url if "://" in competitor_url else f"https://{competitor_url}")
+    host = (parsed.hostname or "").lower().rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if '.' not in host:
+        return None
+    
+    label, suffix = _split_registered_domain(host)
+    registered_domain = f"{label}.{suffix}" if suffix else label
+    if registered_domain in SHARED_HOSTING_DOMAINS or host in SHARED_HOSTING_DOMAINS:
+        key = host + parsed.path.rstrip('/').lower()
+        return key, key
+    return registered_domain, label
+
+def competitor_brand_key(competitor_url: str) -> Optional[str]:
+    """品牌去重键（可注册域名；共享托管平台为主机名和路径；无法解析时为 None）"""
+    parts = competitor_brand_parts(competitor_url)
+    return parts[0] if parts else None
+
+def _shingles(text: str, size: int = 4) -> set:
+    """将文本切分为字符 n-gram（同时适用于中英文）"""
+    normalized = re.sub(r'\s+', ' ', text.lower()).strip()
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def minhash_signature(text: str) -> np.ndarray:
+    """计算文本的 MinHash 签名"""
+    shingles = _shingles(text)
+    if not shingles:
+        return np.full(MINHASH_NUM_PERM, MINHASH_PRIME, dtype=np.uint64)
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    ) % np.uint64(MINHASH_PRIME)
+    permuted = (_MINHASH_A[:, None] * hashes[None, :] + _MINHASH_B[:, None]) % np.uint64(MINHASH_PRIME)
+    return permuted.min(axis=1)
+
+class MinHashLSHIndex:
+    """基于分带 LSH 的近重复索引"""
+    
+    def __init__(self, bands: int = LSH_BANDS):
+        self.bands = bands
+        self.rows = MINHASH_NUM_PERM // bands
+        self.buckets: Dict[Tuple[int, bytes], List[Any]] = {}
+        self.signatures: Dict[Any, np.ndarray] = {}
+    
+    def _band_keys(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def query(self, signature: np.ndarray, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Any]:
+        """返回估计 Jaccard 相似度不低于阈值的已索引键"""
+        candidates = []
+        for band_key in self._band_keys(signature):
+            for key in self.buckets.get(band_key, []):
+                if key not in candidates:
+                    candidates.append(key)
+        return [key for key in candidates if float(np.mean(self.signatures[key] == signature)) >= threshold]
+    
+    def add(self, key: Any, signature: np.ndarray) -> None:
+        """将签名加入索引"""
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets.setdefault(band_key, []).append(key)
+
+def fetch_page_fingerprint(competitor_url: str, timeout: float = 5.0, max_bytes: int = 32768) -> str:
+    """抓取首页开头部分，返回标题和描述组成的廉价页面指纹"""
+    try:
+        with requests.get(competitor_url, timeout=timeout, stream=True, headers={"User-Agent": "Mozilla/5.0"}) as response:
+            response.raise_for_status()
+            head = response.raw.read(max_bytes, decode_content=True).decode(response.encoding or 'utf-8', errors='ignore')
+    except Exception:
+        return ""
+    
+    parts = re.findall(r'<title[^>]*>(.*?)</title>', head, re.IGNORECASE | re.DOTALL)[:1]
+    parts += re.findall(
+        r'<meta[^>]+(?:name|property)=["\'](?:description|og:site_name|og:title)["\'][^>]*content=["\']([^"\']*)["\']',
+        head,
+        re.IGNORECASE
+    )
+    return ' '.join(part.strip() for part in parts if part.strip())
+
+class CompetitorUrlDeduplicator:
+    """线程安全的竞争对手 URL 去重器（品牌域名 + 可选页面指纹），可在 URL 逐个到达时使用"""
+    
+    def __init__(self, use_fingerprints: bool = False):
+        self.use_fingerprints = use_fingerprints
+        self.lock = threading.Lock()
+        self.seen_brands: Dict[str, str] = {}
+        self.index = MinHashLSHIndex()
+    
+    def check_brand(self, competitor_url: str) -> Optional[str]:
+        """按品牌域名检查，重复时返回已保留的 URL，否则登记并返回 None（不同顶级域名只按页面指纹合并）"""
+        brand = competitor_brand_key(competitor_url)
+        if brand is None:
+            return None
+        with self.lock:
+            if brand in self.seen_brands:
+                return self.seen_brands[brand]
+            self.seen_brands[brand] = competitor_url
+            return None
+    
+    def check_fingerprint(self, competitor_url: str, fingerprint: str = None) -> Optional[str]:
+        """按页面指纹检查，重复时返回已保留的 URL，否则登记并返回 None"""
+        if not self.use_fingerprints:
+            return None
+        if fingerprint is None:
+            fingerprint = fetch_page_fingerprint(competitor_url)
+        if not fingerprint:
+            return None
+        signature = minhash_signature(fingerprint)
+        with self.lock:
+            matches = self.index.query(signature)
+            if matches:
+                return matches[0]
+            self.index.add(competitor_url, signature)
+            return None
+
+def _record_fingerprint_text(record: Dict) -> str:
+    """拼接用于相似度比较的记录文本（公司名、功能和营销文本）"""
+    parts = [str(record.get('company_name') or ''), *_as_text_list(record.get('key_features')),
+             str(record.get('marketing_focus') or '')]
+    # 跳过未提取字段的占位值，避免只提取部分字段的记录因 N/A 而被误判为近重复
+    return ' '.join(part for part in parts if part and part != 'N/A')
+
+def _merge_competitor_records(records: List[Dict]) -> Dict:
+    """合并同一竞争对手的多条记录：文本取最完整的值，列表取并集"""
+    merged = dict(records[0])
+    for field in ['company_name', 'pricing', 'marketing_focus', 'customer_feedback']:
+        values = [str(record.get(field) or '') for record in records if record.get(field) not in (None, '', 'N/A')]
+        if values:
+            merged[field] = max(values, key=len)
+    for field in ['key_features', 'tech_stack']:
+        if not any(field in record for record in records):
+            continue  # 提取画像未包含该字段
+        merged[field] = list(dict.fromkeys(
+            item for record in records for item in _as_text_list(record.get(field)) if item != 'N/A'
+        )) or ['N/A']
+    merged_urls = [record.get('competitor_url') for record in records[1:]]
+    merged_urls += [u for record in records for u in record.get('merged_urls', [])]
+    if merged_urls:
+        merged['merged_urls'] = list(dict.fromkeys(u for u in merged_urls if u))
+    return merged
+
+def merge_near_duplicate_records(competitor_data: List[Dict], threshold: float = RECORD_MERGE_THRESHOLD) -> List[Dict]:
+    """对提取结果做近重复聚类并合并，避免同一公司被重复送入 LLM
+    
+    相同可注册域名或相同公司名直接合并；内容近似只在品牌主体相同（如 acme.com 与 acme.de 的地区站点）时合并，
+    避免同一市场中营销文案相近的不同公司被合并。
+    """
+    index = MinHashLSHIndex()
+    clusters: List[List[Dict]] = []
+    cluster_by_key: Dict[str, int] = {}
+    brand_labels: Dict[str, str] = {}
+    
+    for position, record in enumerate(competitor_data):
+        name = str(record.get('company_name') or '').strip().lower()
+        name_key = f"name:{name}" if name and name != 'n/a' else None
+        brand_key, brand_label = competitor_brand_parts(str(record.get('competitor_url') or '')) or (None, None)
+        brand_key = f"brand:{brand_key}" if brand_key else None
+        signature = minhash_signature(_record_fingerprint_text(record))
+        
+        cluster_id = None
+        for key in (brand_key, name_key):
+            if key is not None and key in cluster_by_key:
+                cluster_id = cluster_by_key[key]
+                break
+        if cluster_id is None and brand_label:
+            matches = [key for key in index.query(signature, threshold) if brand_labels[key] == brand_label]
+            cluster_id = cluster_by_key[matches[0]] if matches else None
+        
+        if cluster_id is None:
+            cluster_id = len(clusters)
+            clusters.append([])
+        clusters[cluster_id].append(record)
+        
+        record_key = f"record:{position}"
+        if brand_label:
+            index.add(record_key, signature)
+            brand_labels[record_key] = brand_label
+        cluster_by_key.setdefault(record_key, cluster_id)
+        for key in (brand_key, name_key):
+            if key is not None:
+                cluster_by_key.setdefault(key, cluster_id)
+    
+    return [cluster[0] if len(cluster) == 1 else _merge_competitor_records(cluster) for cluster in clusters]
+
+# 流式分析流水线：发现 -> 提取 -> 逐条处理
+PIPELINE_MAX_WORKERS = 5
+DISCOVERY_OVERPROVISION_FACTOR = 2
+DISCOVERY_MAX_CANDIDATES = 40
+
+def discovery_num_results(target_count: int = None) -> int:
+    """发现阶段请求的候选 URL 数（指定目标数量时适当多取，弥补提取失败和重复）"""
+    if target_count:
+        return min(target_count * DISCOVERY_OVERPROVISION_FACTOR, DISCOVERY_MAX_CANDIDATES)
+    return 10
+
+def _pipeline_extract(competitor_url: str, firecrawl_api_key: str, job: SchedulerJob = None,
+                      fields: Iterable[str] = None, use_cache: bool = True) -> Tuple[str, Any]:
+    """流水线中的单个提取任务，返回 (状态, 结果)"""
+    record = extract_competitor_record(competitor_url, firecrawl_api_key, job, fields, use_cache)
+    return ("ok", record) if record is not None else ("failed", None)
+
+class _RankedFingerprintResolver:
+    """按排名顺序判定页面指纹重复：指纹在工作线程中并发抓取，判定在消费线程中按排名依次进行，
+    保证两个重复 URL 中总是保留排名靠前的一个"""
+    
+    def __init__(self, deduplicator: CompetitorUrlDeduplicator):
+        self.deduplicator = deduplicator
+        self.fingerprints: Dict[int, Tuple[str, str]] = {}
+        self.next_rank = 0
+    
+    def add(self, rank: int, competitor_url: str, fingerprint: str) -> List[Tuple[int, str, Optional[str]]]:
+        """登记某个排名的指纹，返回已可按顺序判定的 (排名, URL, 重复时保留的 URL) 列表"""
+        self.fingerprints[rank] = (competitor_url, fingerprint)
+        resolved = []
+        while self.next_rank in self.fingerprints:
+            competitor_url, fingerprint = self.fingerprints.pop(self.next_rank)
+            resolved.append((self.next_rank, competitor_url,
+                             self.deduplicator.check_fingerprint(competitor_url, fingerprint)))
+            self.next_rank += 1
+        return resolved
+
+class _RankedTargetCounter:
+    """按排名顺序统计去重合并后的不同竞争对手数，判断是否已达到目标数量（优先保留排名靠前的结果）"""
+    
+    def __init__(self, target_count: int, merge_records: bool):
+        self.target_count = target_count
+        self.merge_records = merge_records
+        self.outcomes: Dict[int, Optional[Dict]] = {}
+        self.records: List[Dict] = []
+        self.next_rank = 0
+    
+    def add(self, rank: int, record: Optional[Dict]) -> Optional[int]:
+        """登记某个排名的结果（失败或重复时为 None），达到目标时返回截止排名（不含），否则返回 None"""
+        self.outcomes[rank] = record
+        while self.next_rank in self.outcomes:
+            record = self.outcomes.pop(self.next_rank)
+            self.next_rank += 1
+            if record is None:
+                continue
+            self.records.append(record)
+            distinct = len(merge_near_duplicate_records(self.records)) if self.merge_records else len(self.records)
+            if distinct >= self.target_count:
+                return self.next_rank
+        return None
+
+def run_competitor_pipeline(url: str, description: str, search_engine: str, search_api_key: str,
+                            firecrawl_api_key: str, deduplicator: CompetitorUrlDeduplicator = None,
+                            max_workers: int = PIPELINE_MAX_WORKERS, num_results: int = 10,
+                            target_count: int = None, job: SchedulerJob = None,
+                            fields: Iterable[str] = None, use_cache: bool = True,
+                            discovered_urls: List[str] = None) -> Iterator[Tuple[str, Any]]:
+    """发现与提取重叠执行：每发现一个 URL 立即提交提取，按完成顺序产出事件
+    
+    URL 按发现排名依次提交，同时最多运行 max_workers 个提取任务。启用页面指纹去重时先并发抓取指纹，
+    再按排名顺序判定重复（保留排名靠前的 URL），未重复的才提交提取。指定 target_count 时，
+    按排名顺序统计（启用去重时为合并近重复记录后的）不同竞争对手数：排名靠前的结果全部完成、
+    且其中已有 target_count 个不同竞争对手时停止发现并取消其余提取任务，排名更靠后的结果即使先完成也不计入。
+    fields 限定提取的字段（默认全部）。
+    传入 discovered_urls（如推测性预取的结果）时跳过搜索引擎调用。
+    
+    事件类型：
+    - ("url", (rank, url))：发现新的 URL，已提交提取
+    - ("duplicate", (url, canonical_url))：URL 与已保留的竞争对手重复，已跳过（不计入提取数）
+    - ("record", (rank, url, record, error))：提取完成（失败时 record 为 None）
+    - ("discovery_error", message)：发现阶段出错
+    - ("discovery_done", url_count)：发现阶段结束
+    - ("target_reached", (cancelled_count, cutoff_rank))：排名 cutoff_rank 之前已有目标数量的不同竞争对手，
+      其余任务已取消，调用方应舍弃排名不小于 cutoff_rank 的记录
+    """
+    events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+    stop_event = threading.Event()
+    
+    def discover() -> None:
+        track_job_thread(job)
+        try:
+            url_stream = discovered_urls
+            if url_stream is None:
+                url_stream = iter_competitor_urls(url, description, search_engine, search_api_key, num_results, job)
+            for competitor_url in url_stream:
+                if stop_event.is_set():
+                    break
+                events.put(("url", competitor_url))
+        except Exception as e:
+            events.put(("discovery_error", str(e)))
+        finally:
+            events.put(("discovery_done", None))
+    
+    def submit_extraction(rank: int, competitor_url: str) -> None:
+        future = executor.submit(_pipeline_extract, competitor_url, firecrawl_api_key, job, fields, use_cache)
+        future.add_done_callback(lambda f: events.put(("extracted", (rank, competitor_url, f))))
+    
+    def on_fingerprint(future, rank: int, competitor_url: str) -> None:
+        try:
+            fingerprint = future.result()
+        except Exception:
+            fingerprint = ""
+        events.put(("fingerprint", (rank, competitor_url, fingerprint)))
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers, initializer=track_job_thread, initargs=(job,))
+    resolver = _RankedFingerprintResolver(deduplicator) if deduplicator is not None and deduplicator.use_fingerprints else None
+    threading.Thread(target=discover, daemon=True).start()
+    counter = _RankedTargetCounter(target_count, deduplicator is not None) if target_count else None
+    url_count = 0
+    pending = 0
+    discovery_done = False
+    try:
+        while not discovery_done or pending:
+            kind, payload = events.get()
+            if kind == "url":
+                canonical_url = deduplicator.check_brand(payload) if deduplicator is not None else None
+                if canonical_url:
+                    yield "duplicate", (payload, canonical_url)
+                    continue
+                rank = url_count
+                url_count += 1
+                pending += 1
+                if resolver is not None:
+                    future = executor.submit(fetch_page_fingerprint, payload)
+                    future.add_done_callback(lambda f, r=rank, u=payload: on_fingerprint(f, r, u))
+                    continue
+                submit_extraction(rank, payload)
+                yield "url", (rank, payload)
+            elif kind == "fingerprint":
+                cutoff_rank = None
+                for rank, competitor_url, canonical_url in resolver.add(*payload):
+                    if canonical_url:
+                        pending -= 1
+                        yield "duplicate", (competitor_url, canonical_url)
+                        if counter is not None:
+                            cutoff_rank = cutoff_rank or counter.add(rank, None)
+                        continue
+                    submit_extraction(rank, competitor_url)
+                    yield "url", (rank, competitor_url)
+                if cutoff_rank is not None:
+                    yield "target_reached", (pending, cutoff_rank)
+                    return
+            elif kind == "extracted":
+                pending -= 1
+                rank, competitor_url, future = payload
+                try:
+                    _, record = future.result()
+                except Exception as e:
+                    record = None
+                    yield "record", (rank, competitor_url, None, str(e))
+                else:
+                    yield "record", (rank, competitor_url, record, None)
+                cutoff_rank = counter.add(rank, record) if counter is not None else None
+                if cutoff_rank is not None:
+                    yield "target_reached", (pending, cutoff_rank)
+                    return
+            elif kind == "discovery_error":
+                yield "discovery_error", payload
+            elif kind == "discovery_done":
+                discovery_done = True
+                yield "discovery_done", url_count
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# 推测性预取：输入有效的 URL 或描述后立即在后台发现竞争对手（可同时预取前几个提取），
+# 点击分析时直接复用；输入或发现参数变化时丢弃
+PREFETCH_MIN_DESCRIPTION_LENGTH = 10
+PREFETCH_MAX_EXTRACTIONS = 5
+PREFETCH_TTL = 10 * 60  # 预取结果的有效期（秒）
+PREFETCH_STATUS_INTERVAL = 1.0  # 预取进行中时状态说明的刷新间隔（秒）
+
+class DiscoveryPrefetch:
+    """一次推测性发现预取（后台线程运行，结果只供发起预取的会话使用）"""
+    
+    def __init__(self, key: str, url: str, description: str, search_engine: str, search_api_key: str,
+                 num_results: int, firecrawl_api_key: str = None, extraction_count: int = 0,
+                 fields: Iterable[str] = None, job: SchedulerJob = None):
+        self.key = key
+        self.urls: List[str] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.consumed = False  # 已被一次分析使用（相同输入不再重新预取）
+        self.started_at = time.time()
+        self.job = job
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(url, description, search_engine, search_api_key, num_results,
+                  firecrawl_api_key, extraction_count, fields, job),
+            daemon=True
+        )
+    
+    def start(self) -> "DiscoveryPrefetch":
+        self.thread.start()
+        return self
+    
+    def cancel(self) -> None:
+        """丢弃预取（已开始的提取会继续完成并写入提取缓存）"""
+        self.cancelled.set()
+    
+    def is_expired(self) -> bool:
+        return time.time() - self.started_at > PREFETCH_TTL
+    
+    def _run(self, url: str, description: str, search_engine: str, search_api_key: str, num_results: int,
+             firecrawl_api_key: Optional[str], extraction_count: int, fields: Optional[Iterable[str]],
+             job: Optional[SchedulerJob]) -> None:
+        # 提取预取结果写入提取缓存，分析时按 URL 命中缓存或加入进行中的提取
+        executor = ThreadPoolExecutor(max_workers=extraction_count) if firecrawl_api_key and extraction_count else None
+        try:
+            # 与正式分析使用相同的发现参数，点击分析时若预取仍在进行会直接加入同一个发现请求
+            for competitor_url in iter_competitor_urls(url, description, search_engine, search_api_key, num_results, job):
+                if self.cancelled.is_set():
+                    break
+                self.urls.append(competitor_url)
+                if executor is not None and len(self.urls) <= extraction_count:
+                    executor.submit(extract_competitor_record, competitor_url, firecrawl_api_key, job, fields)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=self.cancelled.is_set())
+            self.done = True
+
+def discovery_prefetch_key(url: str, description: str, search_engine: str, search_api_key: str, num_results: int,
+                           fields: Iterable[str]) -> str:
+    """预取键：输入、发现参数、搜索 API 密钥或提取画像任一变化都会使预取失效"""
+    return single_flight_key(
+        "prefetch", url, description, search_engine, credential_fingerprint(search_api_key), num_results, list(fields)
+    )
+
+def is_prefetchable_input(url: str, description: str) -> bool:
+    """输入是否足以开始推测性发现（完整的 URL 或足够长的描述）"""
+    if url:
+        return _URL_PATTERN.fullmatch(url.strip()) is not None
+    return len((description or "").strip()) >= PREFETCH_MIN_DESCRIPTION_LENGTH
+
+def discard_discovery_prefetch() -> None:
+    """丢弃当前会话的预取"""
+    prefetch = st.session_state.pop('discovery_prefetch', None)
+    if prefetch is not None:
+        prefetch.cancel()
+
+def update_discovery_prefetch(url: str, description: str) -> Optional[DiscoveryPrefetch]:
+    """按当前输入启动或保留预取，输入变化时丢弃旧的预取"""
+    engine = st.session_state.get('search_engine')
+    search_api_key = get_search_api_key(engine) if engine else None
+    if get_missing_configs() or not search_api_key or not is_prefetchable_input(url, description):
+        discard_discovery_prefetch()
+        return None
+    
+    num_results = discovery_num_results(st.session_state.get('target_count'))
+    fields = get_extraction_fields(st.session_state.get('extraction_profile', 'full'))
+    key = discovery_prefetch_key(url, description, engine, search_api_key, num_results, fields)
+    prefetch = st.session_state.get('discovery_prefetch')
+    if prefetch is not None and prefetch.key == key and not prefetch.is_expired():
+        return prefetch
+    discard_discovery_prefetch()
+    
+    # 强制刷新提取缓存时不预取提取，避免与正式分析重复调用 Firecrawl
+    extraction_count = 0
+    if not st.session_state.get('refresh_extraction', False):
+        extraction_count = st.session_state.get('prefetch_extractions', 0)
+    # 预取以批量优先级排队，不抢占其他会话的正式分析（被分析使用时提升为分析的优先级）
+    ctx = get_script_run_ctx()
+    job = SchedulerJob(ctx.session_id if ctx is not None else "local", JOB_PRIORITY_WEIGHTS["batch"])
+    prefetch = DiscoveryPrefetch(
+        key, url, description, engine, search_api_key, num_results,
+        st.session_state.get('firecrawl_api_key'), extraction_count, fields, job
+    ).start()
+    st.session_state.discovery_prefetch = prefetch
+    return prefetch
+
+def take_discovery_prefetch(url: str, description: str, search_engine: str, search_api_key: str, num_results: int,
+                            fields: Iterable[str], job: SchedulerJob = None) -> Optional[List[str]]:
+    """取出与本次分析参数一致且已完成的预取 URL（预取仍在进行时返回 None，由发现请求合并复用）
+    
+    分析会加入预取进行中的发现和提取请求，因此预取作业的权重提升到分析作业的权重，后续排队的调用不再以批量优先级等待。
+    """
+    prefetch = st.session_state.get('discovery_prefetch')
+    if prefetch is None or prefetch.consumed:
+        return None
+    key = discovery_prefetch_key(url, description, search_engine, search_api_key, num_results, fields)
+    if prefetch.key != key or prefetch.is_expired():
+        discard_discovery_prefetch()
+        return None
+    prefetch.consumed = True
+    if job is not None and prefetch.job is not None:
+        prefetch.job.weight = max(prefetch.job.weight, job.weight)
+    if prefetch.done and not prefetch.error and prefetch.urls:
+        return list(prefetch.urls)
+    return None
+
+def describe_discovery_prefetch(prefetch: DiscoveryPrefetch) -> str:
+    """预取状态的简短说明"""
+    if not prefetch.done:
+        return f"⚡ 正在后台预取竞争对手（已发现 {len(prefetch.urls)} 个）"
+    if prefetch.error:
+        return "⚡ 预取失败，将在点击分析时重新搜索"
+    return f"⚡ 已预取 {len(prefetch.urls)} 个竞争对手 URL，点击分析时直接使用"
+
+@st.fragment(run_every=PREFETCH_STATUS_INTERVAL)
+def render_prefetch_progress() -> None:
+    """预取进行中的状态（定时刷新；预取结束或被使用后重跑页面，换成静态说明并停止刷新）"""
+    prefetch = st.session_state.get('discovery_prefetch')
+    if prefetch is None or prefetch.consumed or prefetch.done:
+        st.rerun()
+    st.caption(describe_discovery_prefetch(prefetch))
+
+# 组合模式：多家目标公司共享一个竞争对手提取队列，每个唯一竞争对手只提取一次
+PORTFOLIO_DISCOVERY_WORKERS = 3
+PORTFOLIO_REPORT_WORKERS = 4  # 并发生成报告的公司数（实际调用并发仍受提供方调度器限额约束）
+PORTFOLIO_MAX_TARGETS = 200
+_TARGET_URL_PATTERN = re.compile(r'^(https?://)?[\w-]+(\.[\w-]+)+(/\S*)?$')
+
+def parse_portfolio_targets(text: str) -> List[Tuple[str, str]]:
+    """解析组合模式输入：每行一家公司（URL 或描述），返回 (url, description) 列表"""
+    targets = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if _TARGET_URL_PATTERN.match(line):
+            targets.append((line if "://" in line else f"https://{line}", ""))
+        else:
+            targets.append(("", line))
+    return targets[:PORTFOLIO_MAX_TARGETS]
+
+def portfolio_target_label(target: Tuple[str, str]) -> str:
+    """组合中目标公司的显示名称"""
+    url, description = target
+    return url or (description if len(description) <= 40 else description[:40] + "...")
+
+def normalize_competitor_url(competitor_url: str) -> str:
+    """规范化竞争对手 URL（小写主机名，去掉 www、查询参数和末尾斜杠），作为共享队列的键"""
+    parsed = urlparse(competitor_url if "://" in competitor_url else f"https://{competitor_url}")
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return competitor_url.strip().lower()
+    return f"https://{host}{parsed.path.rstrip('/')}"
+
+def run_portfolio_pipeline(targets: List[Tuple[str, str]], search_engine: str, search_api_key: str,
+                           firecrawl_api_key: str, deduplicator: CompetitorUrlDeduplicator = None,
+                           max_workers: int = PIPELINE_MAX_WORKERS, num_results: int = 10,
+                           job: SchedulerJob = None, fields: Iterable[str] = None,
+                           use_cache: bool = True) -> Iterator[Tuple[str, Any]]:
+    """组合模式流水线：并发发现各目标公司的竞争对手，规范化后放入共享队列，每个唯一竞争对手只提取一次
+    
+    事件类型：
+    - ("url", (target_index, key, is_new))：目标公司发现竞争对手；is_new 为 False 表示已在队列中，复用其提取结果
+    - ("duplicate", (target_index, url, canonical_key))：与队列中的竞争对手属于同一品牌，已合并
+    - ("alias", (key, canonical_key))：提取前页面指纹显示与已有竞争对手相同
+    - ("record", (key, record, error))：提取完成（失败时 record 为 None）
+    - ("discovery_error", (target_index, message))：某家公司的发现阶段出错
+    - ("discovery_done", (target_index, url_count))：某家公司的发现阶段结束
+    """
+    events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+    stop_event = threading.Event()
+    
+    def discover(target_index: int, url: str, description: str) -> None:
+        track_job_thread(job)
+        url_count = 0
+        try:
+            for competitor_url in iter_competitor_urls(url, description, search_engine, search_api_key, num_results, job):
+                if stop_event.is_set():
+                    break
+                events.put(("url", (target_index, competitor_url)))
+                url_count += 1
+        except Exception as e:
+            events.put(("discovery_error", (target_index, str(e))))
+        finally:
+            events.put(("discovery_done", (target_index, url_count)))
+    
+    discovery_executor = ThreadPoolExecutor(max_workers=PORTFOLIO_DISCOVERY_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=max_workers, initializer=track_job_thread, initargs=(job,))
+    for target_index, (url, description) in enumerate(targets):
+        discovery_executor.submit(discover, target_index, url, description)
+    def submit_extraction(key: str) -> None:
+        future = executor.submit(_pipeline_extract, key, firecrawl_api_key, job, fields, use_cache)
+        future.add_done_callback(lambda f: events.put(("extracted", (key, f))))
+    
+    def on_fingerprint(future, rank: int, key: str) -> None:
+        try:
+            fingerprint = future.result()
+        except Exception:
+            fingerprint = ""
+        events.put(("fingerprint", (rank, key, fingerprint)))
+    
+    resolver = _RankedFingerprintResolver(deduplicator) if deduplicator is not None and deduplicator.use_fingerprints else None
+    queued = set()
+    pending_targets = len(targets)
+    pending = 0
+    try:
+        while pending_targets or pending:
+            kind, payload = events.get()
+            if kind == "url":
+                target_index, competitor_url = payload
+                key = normalize_competitor_url(competitor_url)
+                if key in queued:
+                    yield "url", (target_index, key, False)
+                    continue
+                canonical_key = deduplicator.check_brand(key) if deduplicator is not None else None
+                if canonical_key:
+                    yield "duplicate", (target_index, competitor_url, canonical_key)
+                    continue
+                pending += 1
+                if resolver is not None:
+                    # 按进入共享队列的顺序判定指纹重复
+                    future = executor.submit(fetch_page_fingerprint, key)
+                    future.add_done_callback(lambda f, r=len(queued), k=key: on_fingerprint(f, r, k))
+                else:
+                    submit_extraction(key)
+                queued.add(key)
+                yield "url", (target_index, key, True)
+            elif kind == "fingerprint":
+                for _, key, canonical_key in resolver.add(*payload):
+                    if canonical_key:
+                        pending -= 1
+                        yield "alias", (key, canonical_key)
+                    else:
+                        submit_extraction(key)
+            elif kind == "extracted":
+                pending -= 1
+                key, future = payload
+                try:
+                    _, result = future.result()
+                except Exception as e:
+                    yield "record", (key, None, str(e))
+                    continue
+                yield "record", (key, result, None)
+            elif kind == "discovery_done":
+                pending_targets -= 1
+                yield kind, payload
+            else:
+                yield kind, payload
+    finally:
+        stop_event.set()
+        discovery_executor.shutdown(wait=False, cancel_futures=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def fan_out_portfolio_records(assignments: Dict[int, List[str]], records: Dict[str, Dict],
+                              aliases: Dict[str, str] = None) -> Dict[int, List[Dict]]:
+    """将共享队列中提取的记录按发现顺序分发给每家目标公司（同一竞争对手只出现一次）"""
+    aliases = aliases or {}
+    company_data = {}
+    for target_index, keys in assignments.items():
+        resolved = []
+        for key in keys:
+            key = aliases.get(key, key)
+            if key in records and key not in resolved:
+                resolved.append(key)
+        company_data[target_index] = [records[key] for key in resolved]
+    return company_data
+
+# 功能与技术栈相似度分析（本地确定性计算）
+SIMILARITY_CLUSTER_THRESHOLD = 0.35
+SIMILARITY_HEATMAP_LIMIT = 60
+
+# 常见技术名称别名，归一化后再比较
+_TERM_ALIASES = {
+    'js': 'javascript',
+    'ts': 'typescript',
+    'reactjs': 'react',
+    'react.js': 'react',
+    'vuejs': 'vue',
+    'vue.js': 'vue',
+    'node': 'node.js',
+    'nodejs': 'node.js',
+    'postgres': 'postgresql',
+    'k8s': 'kubernetes',
+    'golang': 'go',
+    'amazon web services': 'aws',
+    'google cloud platform': 'gcp',
+    'google cloud': 'gcp',
+}
+
+def normalize_term(term: str) -> str:
+    """归一化技术/功能术语（小写、去除首尾标点、合并别名）"""
+    normalized = re.sub(r'\s+', ' ', str(term).lower()).strip(" \t.,;:!?()[]{}\"'、，。；：")
+    return _TERM_ALIASES.get(normalized, normalized)
+
+def _feature_terms(feature: str) -> List[str]:
+    """将功能描述切分为词项（英文按单词，中文按二元组）"""
+    text = normalize_term(feature)
+    terms = [word for word in re.findall(r'[a-z0-9][a-z0-9+#.\-]*', text) if len(word) > 1]
+    for chunk in re.findall(r'[一-鿿]+', text):
+        terms.extend(chunk[i:i + 2] for i in range(max(1, len(chunk) - 1)))
+    return terms
+
+def build_term_matrix(competitor_data: List[Dict], field: str) -> Tuple[np.ndarray, List[str]]:
+    """构建竞争对手 × 词项的计数矩阵"""
+    documents = []
+    for competitor in competitor_data:
+        items = [item for item in _as_text_list(competitor.get(field)) if item != 'N/A']
+        if field == 'key_features':
+            documents.append([term for item in items for term in _feature_terms(item)])
+        else:
+            documents.append([term for term in (normalize_term(item) for item in items) if term])
+    
+    vocabulary = sorted({term for document in documents for term in document})
+    term_index = {term: column for column, term in enumerate(vocabulary)}
+    counts = np.zeros((len(documents), len(vocabulary)), dtype=np.float64)
+    for row, document in enumerate(documents):
+        for term in document:
+            counts[row, term_index[term]] += 1
+    return counts, vocabulary
+
+def tfidf_matrix(counts: np.ndarray) -> np.ndarray:
+    """计算 L2 归一化的 TF-IDF 矩阵"""
+    if counts.size == 0:
+        return counts
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1
+    weights = counts * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+def cosine_similarity_matrix(weights: np.ndarray) -> np.ndarray:
+    """计算行向量两两余弦相似度（输入已归一化）"""
+    if weights.size == 0:
+        return np.zeros((weights.shape[0], weights.shape[0]))
+    return np.clip(weights @ weights.T, 0.0, 1.0)
+
+def jaccard_similarity_matrix(counts: np.ndarray) -> np.ndarray:
+    """计算行集合两两 Jaccard 相似度"""
+    presence = (counts > 0).astype(np.float64)
+    intersection = presence @ presence.T
+    sizes = presence.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def cluster_by_similarity(similarity: np.ndarray, threshold: float = SIMILARITY_CLUSTER_THRESHOLD) -> np.ndarray:
+    """按相似度阈值做单链接聚类，返回每行的簇编号"""
+    parents = list(range(similarity.shape[0]))
+    
+    def find(node: int) -> int:
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+    
+    for i, j in np.argwhere(np.triu(similarity >= threshold, k=1)):
+        root_i, root_j = find(int(i)), find(int(j))
+        if root_i != root_j:
+            parents[max(root_i, root_j)] = min(root_i, root_j)
+    _, labels = np.unique([find(node) for node in range(len(parents))], return_inverse=True)
+    return labels
+
+def compute_similarity_analytics(competitor_data: List[Dict]) -> Dict[str, Any]:
+    """计算功能 TF-IDF 余弦相似度、技术栈 Jaccard 相似度、综合相似度和聚类"""
+    names = [str(competitor.get('company_name') or f'竞争对手 {i}') for i, competitor in enumerate(competitor_data, 1)]
+    feature_counts, feature_terms = build_term_matrix(competitor_data, 'key_features')
+    tech_counts, tech_terms = build_term_matrix(competitor_data, 'tech_stack')
+    
+    feature_similarity = cosine_similarity_matrix(tfidf_matrix(feature_counts))
+    tech_similarity = jaccard_similarity_matrix(tech_counts)
+    # 只对实际提取到的字段取平均（提取画像可能只包含功能或技术栈）
+    available = [matrix for matrix, terms in ((feature_similarity, feature_terms), (tech_similarity, tech_terms)) if terms]
+    combined_similarity = sum(available) / len(available) if available else np.zeros_like(feature_similarity)
+    np.fill_diagonal(combined_similarity, 1.0)
+    
+    return {
+        'names': names,
+        'feature_similarity': feature_similarity,
+        'tech_similarity': tech_similarity,
+        'combined_similarity': combined_similarity,
+        'clusters': cluster_by_similarity(combined_similarity),
+        'feature_terms': feature_terms,
+        'tech_terms': tech_terms,
+        'tech_presence': tech_counts > 0,
+    }
+
+def summarize_similarity_analytics(analytics: Dict[str, Any], top_terms: int = 10) -> str:
+    """生成用于 LLM 提示的紧凑数值摘要"""
+    names = analytics['names']
+    if len(names) < 2 or not (analytics['feature_terms'] or analytics['tech_terms']):
+        return ""
+    
+    combined = analytics['combined_similarity'].copy()
+    np.fill_diagonal(combined, -1.0)
+    presence = analytics['tech_presence']
+    tech_terms = analytics['tech_terms']
+    lines = []
+    
+    if tech_terms:
+        adoption = presence.sum(axis=0)
+        order = np.argsort(-adoption, kind='stable')[:top_terms]
+        shared = [f"{tech_terms[k]}({int(adoption[k])}/{len(names)})" for k in order if adoption[k] > 1]
+        if shared:
+            lines.append("共同技术栈: " + ", ".join(shared))
+    
+    for i, name in enumerate(names):
+        nearest = int(np.argmax(combined[i]))
+        unique_tech = [tech_terms[k] for k in np.flatnonzero(presence[i] & (presence.sum(axis=0) == 1))][:5] if tech_terms else []
+        line = (f"{name}: 最相似={names[nearest]} 综合={combined[i, nearest]:.2f} "
+                f"功能={analytics['feature_similarity'][i, nearest]:.2f} 技术={analytics['tech_similarity'][i, nearest]:.2f}")
+        if unique_tech:
+            line += f" 独有技术={', '.join(unique_tech)}"
+        lines.append(line)
+    
+    clusters = analytics['clusters']
+    groups = [[names[i] for i in np.flatnonzero(clusters == label)] for label in np.unique(clusters)]
+    groups = [group for group in groups if len(group) > 1]
+    if groups:
+        lines.append("相似群组: " + "; ".join("[" + ", ".join(group) + "]" for group in groups))
+    
+    return "\n".join(lines)
+
+def _get_similarity_analytics(competitor_data: List[Dict]) -> Dict[str, Any]:
+    """获取（并在会话中复用）相似度分析结果"""
+    cached = st.session_state.get('similarity_analytics_cache')
+    if cached is not None and cached[0] is competitor_data:
+        return cached[1]
+    analytics = compute_similarity_analytics(competitor_data)
+    st.session_state.similarity_analytics_cache = (competitor_data, analytics)
+    return analytics
+
+def render_similarity_analytics(competitor_data: List[Dict], key_prefix: str = "similarity") -> None:
+    """显示相似度热力图和聚类结果"""
+    if len(competitor_data) < 2:
+        return
+    
+    analytics = _get_similarity_analytics(competitor_data)
+    if not (analytics['feature_terms'] or analytics['tech_terms']):
+        return  # 提取画像未包含功能和技术栈
+    st.subheader("🧮 功能与技术栈相似度")
+    matrix_options = {
+        "综合相似度": 'combined_similarity',
+        "功能相似度 (TF-IDF 余弦)": 'feature_similarity',
+        "技术栈相似度 (Jaccard)": 'tech_similarity',
+    }
+    matrix_label = st.selectbox("相似度矩阵", options=list(matrix_options), key=f"{key_prefix}_matrix")
+    
+    # 按簇排序，使相似的竞争对手在热力图中相邻
+    order = np.argsort(analytics['clusters'], kind='stable')[:SIMILARITY_HEATMAP_LIMIT]
+    names = [f"{i + 1}. {analytics['names'][i]}" for i in order]
+    matrix = analytics[matrix_options[matrix_label]][np.ix_(order, order)]
+    heatmap_data = pd.DataFrame({
+        '竞争对手 A': np.repeat(names, len(names)),
+        '竞争对手 B': np.tile(names, len(names)),
+        '相似度': matrix.ravel().round(3),
+    })
+    chart = alt.Chart(heatmap_data).mark_rect().encode(
+        x=alt.X('竞争对手 B:N', sort=names, title=None),
+        y=alt.Y('竞争对手 A:N', sort=names, title=None),
+        color=alt.Color('相似度:Q', scale=alt.Scale(domain=[0, 1], scheme='blues')),
+        tooltip=['竞争对手 A', '竞争对手 B', '相似度']
+    )
+    st.altair_chart(chart, use_container_width=True)
+    if len(analytics['names']) > SIMILARITY_HEATMAP_LIMIT:
+        st.caption(f"热力图仅显示前 {SIMILARITY_HEATMAP_LIMIT} 个竞争对手（按相似群组排序）")
+    
+    cluster_table = pd.DataFrame({'公司': analytics['names'], '相似群组': analytics['clusters'] + 1})
+    cluster_table = cluster_table.groupby('相似群组', sort=True)['公司'].agg(lambda companies: ', '.join(companies)).reset_index()
+    st.dataframe(cluster_table, use_container_width=True, hide_index=True)
 
-### 4. 技术栈对比
-- 分析各竞争对手使用的技术
-- 评估技术优势和劣势
+# 生成对比表格
+COMPARISON_PAGE_SIZES = [10, 25, 50, 100]
 
-### 5. 营销策略分析
-- 分析目标受众和营销重点
-- 制定差异化营销策略
+# 对比表格列
+COMPARISON_COLUMNS = ['公司', '网站', '定价', '关键功能', '技术栈', '营销重点', '客户反馈']
 
-## 建议
-1. 深入分析竞争对手的优劣势
-2. 制定差异化竞争策略
-3. 关注市场趋势和客户需求
-4. 持续监控竞争对手动态
+def _truncate_series(series: pd.Series, limit: int = 100) -> pd.Series:
+    """向量化截断长文本"""
+    return series.where(series.str.len() <= limit, series.str.slice(0, limit) + '...')
 
----
-*注：此为备用分析报告，建议检查Qwen API配置以获得更深入的分析。*
-"""
-        
-        return analysis
+def _join_list_series(series: pd.Series, limit: int = 3) -> pd.Series:
+    """向量化拼接列表列的前几项"""
+    joined = series.str.slice(0, limit).str.join(', ')
+    return joined.where(joined.str.len() > 0, 'N/A')
 
-# 获取竞争对手 URL 的函数
-def get_competitor_urls(url: str = None, description: str = None) -> List[str]:
-    """获取竞争对手 URL 列表"""
-    if not url and not description:
-        raise ValueError("请提供 URL 或描述")
+def normalize_competitor_frame(competitor_data: List[Dict]) -> pd.DataFrame:
+    """将竞争对手记录一次性规范化为 DataFrame，并附带对比表格列和检索列"""
+    text_fields = ['company_name', 'competitor_url', 'pricing', 'marketing_focus', 'customer_feedback']
+    list_fields = ['key_features', 'tech_stack']
+    frame = pd.DataFrame(competitor_data, columns=text_fields + list_fields)
 
-    if search_engine == "Perplexity AI - Sonar Pro":
-        perplexity_url = "https://api.perplexity.ai/chat/completions"
-        
-        content = "找到 10 个与公司相似的竞争对手公司 URL，"
-        if url and description:
-            content += f"URL: {url} 和描述: {description}"
-        elif url:
-            content += f"URL: {url}"
-        else:
-            content += f"描述: {description}"
-        content += "。只返回 URL，不要其他文本。"
+    frame[text_fields] = frame[text_fields].fillna('N/A').astype(str)
+    for field in list_fields:
+        frame[field] = frame[field].map(_as_text_list)
 
-        payload = {
-            "model": "sonar-pro",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "精确并只返回  10个公司 URL。"
-                },
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.8,
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {st.session_state.perplexity_api_key}",
-            "Content-Type": "application/json"
-        }
+    table = pd.DataFrame({
+        '公司': frame['company_name'],
+        '网站': frame['competitor_url'],
+        '定价': _truncate_series(frame['pricing']),
+        '关键功能': _join_list_series(frame['key_features']),
+        '技术栈': _join_list_series(frame['tech_stack']),
+        '营销重点': _truncate_series(frame['marketing_focus']),
+        '客户反馈': _truncate_series(frame['customer_feedback']),
+    })
+    table['_search'] = frame['company_name'].str.cat(
+        [frame['competitor_url'], frame['pricing'], frame['marketing_focus'], frame['customer_feedback'],
+         frame['key_features'].str.join(' '), frame['tech_stack'].str.join(' ')],
+        sep=' '
+    ).str.lower()
+    table['_row'] = range(len(table))
+    return table
 
-        try:
-            response = requests.post(perplexity_url, json=payload, headers=headers)
-            response.raise_for_status()
-            urls = response.json()['choices'][0]['message']['content'].strip().split('\n')
-            return [url.strip() for url in urls if url.strip()]
-        except Exception as e:
-            st.error(f"从 Perplexity 获取竞争对手 URL 时出错: {str(e)}")
-            return []
+def _get_comparison_table(competitor_data: List[Dict], key_prefix: str) -> pd.DataFrame:
+    """获取（并在会话中复用）规范化后的对比表格，避免每次交互重建"""
+    cache_key = f"{key_prefix}_frame_cache"
+    cached = st.session_state.get(cache_key)
+    if cached is not None and cached[0] is competitor_data:
+        return cached[1]
+    table = normalize_competitor_frame(competitor_data)
+    st.session_state[cache_key] = (competitor_data, table)
+    return table
 
-    else:  # Exa AI
-        try:
-            if EXA_AVAILABLE:
-                exa = Exa(api_key=st.session_state.exa_api_key)
-                
-                if url:
-                    # 使用 find_similar 查找相似网站
-                    result = exa.find_similar(
-                        url=url,
-                        num_results=10,
-                        exclude_source_domain=True,
-                        category="company"
-                    )
-                else:
-                    # 使用 search 根据描述搜索
-                    result = exa.search(
-                        description,
-                        type="neural",
-                        category="company",
-                        use_autoprompt=True,
-                        num_results=10
-                    )
-                
-                # 确保返回10个URL，如果不足则尝试补充
-                urls = [item.url for item in result.results]
-                
-                # 如果结果不足10个，尝试使用不同的搜索策略
-                if len(urls) < 10 and description:
-                    try:
-                        # 尝试使用不同的搜索词
-                        additional_result = exa.search(
-                            f"{description} competitors",
-                            type="neural",
-                            num_results=10 - len(urls)
-                        )
-                        additional_urls = [item.url for item in additional_result.results]
-                        urls.extend(additional_urls)
-                    except:
-                        pass
-                
-                # 去重并限制为10个
-                unique_urls = list(dict.fromkeys(urls))[:10]
-                return unique_urls
-            else:
-                st.error("Exa 库未安装，请运行: pip install exa-py")
-                return []
-        except Exception as e:
-            st.error(f"从 Exa 获取竞争对手 URL 时出错: {str(e)}")
-            return []
+def _render_competitor_detail(competitor: Dict) -> None:
+    """显示单个竞争对手的详细信息卡片"""
+    features = competitor.get('key_features') or []
+    tech_stack = competitor.get('tech_stack') or []
 
-# 使用 Firecrawl 提取竞争对手信息
-def extract_competitor_info(competitor_url: str) -> Optional[Dict]:
-    """使用 Firecrawl 提取竞争对手信息"""
-    try:
-        if not FIRECRAWL_AVAILABLE:
-            st.error("Firecrawl 库未安装，请运行: pip install firecrawl-py")
-            return None
-            
-        # 初始化 FirecrawlApp
-        app = FirecrawlApp(api_key=st.session_state.firecrawl_api_key)
-        
-        # 添加通配符以爬取子页面
-        url_pattern = f"{competitor_url}/*"
-        
-        # 定义数据提取提示
-        extraction_prompt = """
-        提取有关公司产品的详细信息，包括：
-        - 公司名称和基本信息
-        - 定价详情、计划和层级
-        - 关键功能和主要能力
-        - 技术栈和技术详情
-        - 营销重点和目标受众
-        - 客户反馈和推荐
-        
-        分析整个网站内容，为每个字段提供全面信息。
-        """
-        
-        # 调用 Firecrawl 提取功能
-        response = app.extract(
-            [url_pattern],
-            prompt=extraction_prompt,
-            schema=CompetitorDataSchema.model_json_schema()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(
+            f"**基本信息**\n\n"
+            f"**公司名称**: {competitor.get('company_name', 'N/A')}\n\n"
+            f"**网站**: {competitor.get('competitor_url', 'N/A')}\n\n"
+            f"**定价信息**\n\n{competitor.get('pricing', 'N/A')}\n\n"
+            f"**营销重点**\n\n{competitor.get('marketing_focus', 'N/A')}"
+        )
+    with col2:
+        feature_lines = "\n".join(f"- {feature}" for feature in features) or "N/A"
+        tech_lines = "\n".join(f"- {tech}" for tech in tech_stack) or "N/A"
+        st.markdown(
+            f"**关键功能**\n\n{feature_lines}\n\n"
+            f"**技术栈**\n\n{tech_lines}\n\n"
+            f"**客户反馈**\n\n{competitor.get('customer_feedback', 'N/A')}"
         )
-        
-        # 处理 ExtractResponse 对象
-        try:
-            if hasattr(response, 'success') and response.success:
-                if hasattr(response, 'data') and response.data:
-                    extracted_info = response.data
-                    
-                    # 创建 JSON 结构
-                    competitor_json = {
-                        "competitor_url": competitor_url,
-                        "company_name": extracted_info.get('company_name', 'N/A') if isinstance(extracted_info, dict) else getattr(extracted_info, 'company_name', 'N/A'),
-                        "pricing": extracted_info.get('pricing', 'N/A') if isinstance(extracted_info, dict) else getattr(extracted_info, 'pricing', 'N/A'),
-                        "key_features": extracted_info.get('key_features', [])[:5] if isinstance(extracted_info, dict) and extracted_info.get('key_features') else getattr(extracted_info, 'key_features', [])[:5] if hasattr(extracted_info, 'key_features') else ['N/A'],
-                        "tech_stack": extracted_info.get('tech_stack', [])[:5] if isinstance(extracted_info, dict) and extracted_info.get('tech_stack') else getattr(extracted_info, 'tech_stack', [])[:5] if hasattr(extracted_info, 'tech_stack') else ['N/A'],
-                        "marketing_focus": extracted_info.get('marketing_focus', 'N/A') if isinstance(extracted_info, dict) else getattr(extracted_info, 'marketing_focus', 'N/A'),
-                        "customer_feedback": extracted_info.get('customer_feedback', 'N/A') if isinstance(extracted_info, dict) else getattr(extracted_info, 'customer_feedback', 'N/A')
-                    }
-                    
-                    return competitor_json
-                else:
-                    return None
-            else:
-                return None
-                
-        except Exception as response_error:
-            return None
-            
-    except Exception as e:
-        st.error(f"使用 Firecrawl 提取信息失败: {str(e)}")
-        return None
 
-# 生成对比表格
-def generate_comparison_report(competitor_data: List[Dict]) -> None:
-    """生成竞争对手对比报告"""
+def generate_comparison_report(competitor_data: List[Dict], key_prefix: str = "comparison") -> None:
+    """生成竞争对手对比报告（服务端筛选、排序和分页，详情按需渲染）"""
     if not competitor_data:
         st.error("没有可比较的竞争对手数据")
         return
     
-    # 准备表格数据
-    table_data = []
-    for competitor in competitor_data:
-        row = {
-            '公司': f"{competitor.get('company_name', 'N/A')}",
-            '网站': competitor.get('competitor_url', 'N/A'),
-            '定价': competitor.get('pricing', 'N/A')[:100] + '...' if len(competitor.get('pricing', '')) > 100 else competitor.get('pricing', 'N/A'),
-            '关键功能': ', '.join(competitor.get('key_features', [])[:3]) if competitor.get('key_features') else 'N/A',
-            '技术栈': ', '.join(competitor.get('tech_stack', [])[:3]) if competitor.get('tech_stack') else 'N/A',
-            '营销重点': competitor.get('marketing_focus', 'N/A')[:100] + '...' if len(competitor.get('marketing_focus', '')) > 100 else competitor.get('marketing_focus', 'N/A'),
-            '客户反馈': competitor.get('customer_feedback', 'N/A')[:100] + '...' if len(competitor.get('customer_feedback', '')) > 100 else competitor.get('customer_feedback', 'N/A')
-        }
-        table_data.append(row)
-    
-    # 创建并显示表格
-    df = pd.DataFrame(table_data)
+    table = _get_comparison_table(competitor_data, key_prefix)
     st.subheader("📊 竞争对手对比表")
     st.markdown("---")
     
-    # 使用更好的表格显示
+    # 筛选、排序和分页控件
+    filter_col, sort_col, order_col, size_col = st.columns([3, 2, 1, 1])
+    with filter_col:
+        query = st.text_input("筛选", placeholder="按公司、功能、技术栈等关键词筛选", key=f"{key_prefix}_filter")
+    with sort_col:
+        sort_by = st.selectbox("排序字段", options=["默认"] + COMPARISON_COLUMNS, key=f"{key_prefix}_sort")
+    with order_col:
+        descending = st.selectbox("顺序", options=["升序", "降序"], key=f"{key_prefix}_order") == "降序"
+    with size_col:
+        page_size = st.selectbox("每页", options=COMPARISON_PAGE_SIZES, key=f"{key_prefix}_page_size")
+    
+    view = table
+    if query.strip():
+        view = view[view['_search'].str.contains(query.strip().lower(), regex=False)]
+    if sort_by != "默认":
+        view = view.sort_values(sort_by, ascending=not descending, key=lambda col: col.str.lower(), kind="stable")
+    
+    total_pages = max(1, -(-len(view) // page_size))
+    page_key = f"{key_prefix}_page"
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    page = int(st.number_input("页码", min_value=1, max_value=total_pages, step=1, key=page_key))
+    page_view = view.iloc[(page - 1) * page_size:page * page_size]
+    st.caption(f"共 {len(table)} 条记录，筛选后 {len(view)} 条，第 {page}/{total_pages} 页")
+    
+    # 只发送当前页的数据
     st.dataframe(
-        df, 
+        page_view[COMPARISON_COLUMNS],
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -809,74 +3059,34 @@ def generate_comparison_report(competitor_data: List[Dict]) -> None:
         }
     )
     
-    # 显示详细数据
+    # 详细信息只渲染用户选中的竞争对手
     st.subheader("📋 详细竞争对手信息")
-    for i, competitor in enumerate(competitor_data, 1):
-        with st.expander(f"🏢 {competitor.get('company_name', f'竞争对手 {i}')} - 详细信息"):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**基本信息**")
-                st.write(f"**公司名称**: {competitor.get('company_name', 'N/A')}")
-                st.write(f"**网站**: {competitor.get('competitor_url', 'N/A')}")
-                
-                st.markdown("**定价信息**")
-                st.write(competitor.get('pricing', 'N/A'))
-                
-                st.markdown("**营销重点**")
-                st.write(competitor.get('marketing_focus', 'N/A'))
-            
-            with col2:
-                st.markdown("**关键功能**")
-                features = competitor.get('key_features', [])
-                if features:
-                    for feature in features:
-                        st.write(f"• {feature}")
-                else:
-                    st.write("N/A")
-                
-                st.markdown("**技术栈**")
-                tech_stack = competitor.get('tech_stack', [])
-                if tech_stack:
-                    for tech in tech_stack:
-                        st.write(f"• {tech}")
-                else:
-                    st.write("N/A")
-                
-                st.markdown("**客户反馈**")
-                st.write(competitor.get('customer_feedback', 'N/A'))
+    row_ids = page_view['_row'].tolist()
+    selected_row = st.selectbox(
+        "选择要查看详情的竞争对手",
+        options=[None] + row_ids,
+        format_func=lambda row: "（未选择）" if row is None else f"🏢 {table['公司'].iat[row]}",
+        key=f"{key_prefix}_detail"
+    )
+    if selected_row is not None:
+        with st.container(border=True):
+            _render_competitor_detail(competitor_data[selected_row])
     
-    # 显示原始数据（可选）
-    with st.expander("🔍 查看原始JSON数据"):
-        st.json(competitor_data)
+    # 显示原始数据（仅当前页，按需加载）
+    if st.toggle("🔍 查看当前页原始JSON数据", key=f"{key_prefix}_raw_json"):
+        st.json([competitor_data[row] for row in row_ids])
 
-# 备用分析函数（不依赖AI）
-def generate_fallback_analysis(competitor_data: List[Dict]) -> str:
-    """生成备用分析报告（不依赖AI）"""
-    if not competitor_data:
-        return "没有竞争对手数据可供分析"
-    
-    analysis = f"""
-# 竞争对手分析报告（基础版本）
+# 基础分析报告（不依赖AI）：逐个竞争对手渲染条目后一次性拼接，耗时与竞争对手数量成线性关系
+BASELINE_REPORT_HEADER = """
+# 竞争对手分析报告（{variant}）
 
 ## 分析概览
-成功分析了 {len(competitor_data)} 个竞争对手的数据。
+成功分析了 {count} 个竞争对手的数据。
 
 ## 竞争对手列表
 """
-    
-    for i, competitor in enumerate(competitor_data, 1):
-        analysis += f"""
-### {i}. {competitor.get('company_name', f'竞争对手 {i}')}
-- **网站**: {competitor.get('competitor_url', 'N/A')}
-- **定价策略**: {competitor.get('pricing', 'N/A')[:200]}...
-- **关键功能**: {', '.join(competitor.get('key_features', [])[:3]) if competitor.get('key_features') else 'N/A'}
-- **技术栈**: {', '.join(competitor.get('tech_stack', [])[:3]) if competitor.get('tech_stack') else 'N/A'}
-- **营销重点**: {competitor.get('marketing_focus', 'N/A')[:200]}...
 
-"""
-    
-    analysis += """
+BASELINE_REPORT_FOOTER = """
 ## 基础分析建议
 
 ### 1. 市场定位分析
@@ -906,114 +3116,930 @@ def generate_fallback_analysis(competitor_data: List[Dict]) -> str:
 4. 持续监控竞争对手动态
 
 ---
-*注：此为基础分析报告，建议配置AI模型以获得更深入的分析。*
+*注：{note}*
 """
+
+BASELINE_TEXT_LIMIT = 200
+BASELINE_LIST_LIMIT = 3
+
+def _render_baseline_competitor(index: int, competitor: Dict[str, Any]) -> str:
+    """渲染基础报告中的单个竞争对手条目（提取画像未包含的字段不显示）"""
+    lines = [f"\n### {index}. {competitor.get('company_name', f'竞争对手 {index}')}",
+             f"- **网站**: {competitor.get('competitor_url', 'N/A')}"]
+    if 'pricing' in competitor:
+        lines.append(f"- **定价策略**: {str(competitor['pricing'] or 'N/A')[:BASELINE_TEXT_LIMIT]}...")
+    if 'key_features' in competitor:
+        features = competitor['key_features']
+        lines.append(f"- **关键功能**: {', '.join(map(str, features[:BASELINE_LIST_LIMIT])) if features else 'N/A'}")
+    if 'tech_stack' in competitor:
+        tech_stack = competitor['tech_stack']
+        lines.append(f"- **技术栈**: {', '.join(map(str, tech_stack[:BASELINE_LIST_LIMIT])) if tech_stack else 'N/A'}")
+    if 'marketing_focus' in competitor:
+        lines.append(f"- **营销重点**: {str(competitor['marketing_focus'] or 'N/A')[:BASELINE_TEXT_LIMIT]}...")
+    return "\n".join(lines) + "\n\n"
+
+def render_baseline_report(competitor_data: List[Dict], variant: str = "基础版本",
+                           note: str = "此为基础分析报告，建议配置AI模型以获得更深入的分析。") -> str:
+    """渲染基础分析报告（不依赖AI，提取完成后即可显示）"""
+    if not competitor_data:
+        return "没有竞争对手数据可供分析"
+    
+    parts = [BASELINE_REPORT_HEADER.format(variant=variant, count=len(competitor_data))]
+    parts.extend(_render_baseline_competitor(i, competitor) for i, competitor in enumerate(competitor_data, 1))
+    parts.append(BASELINE_REPORT_FOOTER.format(note=note))
+    return "".join(parts)
+
+def generate_fallback_analysis(competitor_data: List[Dict]) -> str:
+    """生成备用分析报告（不依赖AI）"""
+    return render_baseline_report(competitor_data)
+
+# 结果导出与加载
+EXPORT_TEXT_FIELDS = ["competitor_url", "company_name", "pricing", "marketing_focus", "customer_feedback"]
+EXPORT_LIST_FIELDS = ["key_features", "tech_stack"]
+RUN_METADATA_KEY = "run_metadata"
+EXPORT_CACHE_MAX_ENTRIES = 12  # 缓存的导出文件数（每次运行最多 3 种格式）
+
+# 导出格式: 格式标识 -> (显示名称, MIME 类型, 文件后缀)
+EXPORT_FORMATS = {
+    "parquet": ("Parquet", "application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("Arrow IPC", "application/vnd.apache.arrow.file", ".arrow"),
+    "jsonl": ("JSONL", "application/x-ndjson", ".jsonl"),
+}
+
+_LIST_VALUE_TYPES = (list, tuple, np.ndarray)
+
+def _is_missing(value: Any) -> bool:
+    """值是否缺失（None、NaN 等；列表值不算缺失）"""
+    return not isinstance(value, _LIST_VALUE_TYPES) and pd.isna(value)
+
+def _as_text(value: Any) -> Optional[str]:
+    """将字段值规范化为字符串（缺失值保持为 None）"""
+    if _is_missing(value):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def _as_text_list(value: Any) -> List[str]:
+    """将列表字段规范化为字符串列表（缺失值和非列表值返回空列表，单个字符串视为一项）"""
+    if isinstance(value, str):
+        return [value] if value else []
+    if not isinstance(value, _LIST_VALUE_TYPES):
+        return []
+    return [item if isinstance(item, str) else str(item) for item in value if not _is_missing(item)]
+
+def build_run_metadata(competitor_data: List[Dict], input_url: str = None, input_description: str = None,
+                       analysis_report: str = None, model_route: Dict[str, Any] = None,
+                       stage_timings: Dict[str, float] = None) -> Dict[str, Any]:
+    """构建一次分析运行的元数据"""
+    model_provider = st.session_state.get('model_provider')
+    if model_route:
+        # 对冲或故障转移时报告可能来自备用提供方
+        model_provider = model_route.get("provider", model_provider)
+        model = model_route["model"]
+    elif model_provider == "openai":
+        model = st.session_state.get('openai_model', OPENAI_DEFAULT_MODEL)
+    elif model_provider == "qwen":
+        model = st.session_state.get('qwen_model', QWEN_DEFAULT_MODEL)
+    elif model_provider == "openai_compatible":
+        model = st.session_state.get('local_model')
+    else:
+        model = None
+
+    return {
+        "run_id": f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "input_url": input_url or None,
+        "input_description": input_description or None,
+        "model_provider": model_provider,
+        "model": model,
+        "search_engine": st.session_state.get('search_engine'),
+        "extraction_profile": st.session_state.get('extraction_profile', 'full'),
+        "competitor_count": len(competitor_data),
+        "analysis_report": analysis_report,
+        "model_route": model_route,
+        "stage_timings": {stage: round(seconds, 3) for stage, seconds in (stage_timings or {}).items()},
+    }
+
+def competitor_data_to_arrow(competitor_data: List[Dict], run_metadata: Dict[str, Any]) -> "pa.Table":
+    """按列构建 Arrow 表（key_features/tech_stack 为列表列，运行元数据写入 schema）"""
+    columns = {field: [_as_text(record.get(field)) for record in competitor_data] for field in EXPORT_TEXT_FIELDS}
+    columns.update({field: [_as_text_list(record.get(field)) for record in competitor_data] for field in EXPORT_LIST_FIELDS})
+
+    schema = pa.schema(
+        [pa.field(field, pa.string()) for field in EXPORT_TEXT_FIELDS]
+        + [pa.field(field, pa.list_(pa.string())) for field in EXPORT_LIST_FIELDS],
+        metadata={RUN_METADATA_KEY: json.dumps(run_metadata, ensure_ascii=False)}
+    )
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def iter_jsonl_lines(competitor_data: Iterable[Dict], run_metadata: Dict[str, Any]) -> Iterator[str]:
+    """逐行生成 JSONL：首行为运行元数据，其后每行一条竞争对手记录"""
+    yield json.dumps({f"_{RUN_METADATA_KEY}": run_metadata}, ensure_ascii=False) + "\n"
+    for record in competitor_data:
+        row = {field: _as_text(record.get(field)) for field in EXPORT_TEXT_FIELDS}
+        row.update({field: _as_text_list(record.get(field)) for field in EXPORT_LIST_FIELDS})
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+def export_competitor_data(competitor_data: List[Dict], run_metadata: Dict[str, Any], fmt: str) -> bytes:
+    """将竞争对手记录和运行元数据导出为指定格式"""
+    if fmt == "jsonl":
+        return "".join(iter_jsonl_lines(competitor_data, run_metadata)).encode("utf-8")
+
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("PyArrow 库未安装，请运行: pip install pyarrow")
+
+    table = competitor_data_to_arrow(competitor_data, run_metadata)
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(table, sink, compression="zstd")
+    elif fmt == "arrow":
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    return sink.getvalue().to_pybytes()
+
+def load_run_data(file_name: str, data: bytes) -> Tuple[List[Dict], Dict[str, Any]]:
+    """从导出文件加载竞争对手记录和运行元数据"""
+    if file_name.endswith(".jsonl"):
+        competitor_data = []
+        run_metadata = {}
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if f"_{RUN_METADATA_KEY}" in record:
+                run_metadata = record[f"_{RUN_METADATA_KEY}"]
+            else:
+                competitor_data.append(record)
+        return competitor_data, run_metadata
+
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("PyArrow 库未安装，请运行: pip install pyarrow")
+
+    if file_name.endswith(".parquet"):
+        table = pq.read_table(pa.BufferReader(data))
+    elif file_name.endswith((".arrow", ".feather")):
+        table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    else:
+        raise ValueError(f"无法识别的文件类型: {file_name}")
+
+    schema_metadata = table.schema.metadata or {}
+    raw_metadata = schema_metadata.get(RUN_METADATA_KEY.encode("utf-8"))
+    run_metadata = json.loads(raw_metadata) if raw_metadata else {}
+    return table.to_pylist(), run_metadata
+
+def get_export_bytes(competitor_data: List[Dict], run_metadata: Dict[str, Any], fmt: str, key_prefix: str) -> bytes:
+    """获取导出文件内容（按导出区域和 run_id 缓存在 session_state 中，重新运行页面时不重复序列化）"""
+    cache = st.session_state.setdefault('export_cache', {})
+    cache_key = (key_prefix, run_metadata.get('run_id'), len(competitor_data), fmt)
+    if cache_key in cache:
+        cache[cache_key] = cache.pop(cache_key)  # 移到末尾，按最近使用淘汰
+    else:
+        cache[cache_key] = export_competitor_data(competitor_data, run_metadata, fmt)
+        # 同一导出区域只保留当前运行的结果，总条目数也有上限
+        for stale_key in [key for key in cache if key[0] == key_prefix and key[1:3] != cache_key[1:3]]:
+            del cache[stale_key]
+        while len(cache) > EXPORT_CACHE_MAX_ENTRIES:
+            del cache[next(iter(cache))]
+    return cache[cache_key]
+
+def render_export_buttons(competitor_data: List[Dict], run_metadata: Dict[str, Any], key_prefix: str = "export") -> None:
+    """显示结果导出按钮"""
+    st.subheader("💾 导出结果")
+    formats = list(EXPORT_FORMATS) if PYARROW_AVAILABLE else ["jsonl"]
+    columns = st.columns(len(formats))
+    for column, fmt in zip(columns, formats):
+        label, mime, suffix = EXPORT_FORMATS[fmt]
+        with column:
+            st.download_button(
+                f"下载 {label}",
+                data=get_export_bytes(competitor_data, run_metadata, fmt, key_prefix),
+                file_name=f"competitors_{run_metadata.get('run_id', 'run')}{suffix}",
+                mime=mime,
+                use_container_width=True,
+                key=f"{key_prefix}_{fmt}"
+            )
+    if not PYARROW_AVAILABLE:
+        st.caption("安装 pyarrow 后可导出 Parquet / Arrow 格式")
+
+@st.fragment
+def render_results_view() -> None:
+    """对比表格和相似度分析（独立重新运行，筛选、翻页、展开详情时不重跑整个页面）"""
+    last_run = st.session_state.get('last_run')
+    if not last_run:
+        return
+    generate_comparison_report(last_run['competitor_data'])
+    render_similarity_analytics(last_run['competitor_data'])
+
+def render_analysis_report(analysis_report: str) -> None:
+    """显示分析报告"""
+    st.subheader("🧠 竞争对手智能分析报告")
+    st.markdown("---")
+    st.markdown(analysis_report)
+
+def render_saved_run(competitor_data: List[Dict], run_metadata: Dict[str, Any]) -> None:
+    """将已保存的运行结果重新显示为对比视图"""
+    st.info(
+        f"分析运行 {run_metadata.get('run_id', 'N/A')}："
+        f"{len(competitor_data)} 个竞争对手"
+        f"（模型: {run_metadata.get('model') or 'N/A'}，搜索引擎: {run_metadata.get('search_engine') or 'N/A'}）"
+    )
+    render_results_view()
+
+    analysis_report = run_metadata.get('analysis_report')
+    if analysis_report:
+        render_analysis_report(analysis_report)
+
+# 采样性能分析
+PROFILER_SAMPLE_INTERVAL = 0.01
+PROFILER_TOP_FUNCTIONS = 25
+
+def _profiler_frame_name(frame_key: Tuple[str, str, int]) -> str:
+    """调用栈帧的显示名称"""
+    name, file_name, line = frame_key
+    return f"{name} ({file_name.replace(chr(92), '/').rsplit('/', 1)[-1]}:{line})"
+
+class SamplingProfiler:
+    """低开销采样分析器：后台线程定期采集分析线程及本次运行作业的工作线程的调用栈
+    
+    只采集调用 start 的线程和登记到 job 的线程（见 track_job_thread），不会混入其他会话的线程。
+    每个线程的每次采样计为一个采样间隔的线程时间，多个线程并发工作时线程时间之和可超过墙钟时间。
+    """
+
+    def __init__(self, job: SchedulerJob = None, interval: float = PROFILER_SAMPLE_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self.thread_samples: Dict[Tuple, int] = {}
+        self.cpu_samples: Dict[Tuple, int] = {}
+        self.cpu_state_available = os.path.isdir("/proc/self/task")
+        self.wall_time = 0.0
+        self.process_cpu_time = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._target_ident = None
+
+    def start(self) -> None:
+        """开始采样：跟踪当前线程以及登记到作业的工作线程（提取、发现等）"""
+        self._target_ident = threading.get_ident()
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止采样"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wall_time = time.perf_counter() - self._started_wall
+        self.process_cpu_time = time.process_time() - self._started_cpu
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _thread_on_cpu(self, thread: Optional[threading.Thread]) -> bool:
+        """根据 /proc 中的线程状态判断是否正在占用 CPU（R 状态）"""
+        native_id = getattr(thread, "native_id", None)
+        if not self.cpu_state_available or native_id is None:
+            return False
+        try:
+            with open(f"/proc/self/task/{native_id}/stat", encoding="utf-8") as stat_file:
+                return stat_file.read().rsplit(")", 1)[1].split()[0] == "R"
+        except (OSError, IndexError):
+            return False
+
+    def _sample(self) -> None:
+        tracked = {self._target_ident}
+        if self.job is not None:
+            tracked |= set(self.job.thread_idents)
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident not in tracked:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            thread = threads.get(ident)
+            thread_name = re.sub(r"_\d+$", "", thread.name) if thread else str(ident)
+            key = (thread_name,) + tuple(reversed(stack))
+            self.thread_samples[key] = self.thread_samples.get(key, 0) + 1
+            if self._thread_on_cpu(thread):
+                self.cpu_samples[key] = self.cpu_samples.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        """墙钟/线程/CPU 时间汇总"""
+        sample_count = sum(self.thread_samples.values())
+        cpu_count = sum(self.cpu_samples.values())
+        return {
+            "wall_time": self.wall_time,
+            "thread_time": sample_count * self.interval,
+            "process_cpu_time": self.process_cpu_time,
+            "samples": sample_count,
+            "cpu_ratio": cpu_count / sample_count if sample_count and self.cpu_state_available else None,
+        }
+
+    def top_functions(self, limit: int = PROFILER_TOP_FUNCTIONS) -> pd.DataFrame:
+        """按自身耗时（栈顶函数）排序的热点函数"""
+        totals: Dict[Tuple[str, str, int], List[int]] = {}
+        for samples, column in ((self.thread_samples, 0), (self.cpu_samples, 1)):
+            for key, count in samples.items():
+                if len(key) > 1:
+                    totals.setdefault(key[-1], [0, 0])[column] += count
+        rows = [
+            {
+                "函数": _profiler_frame_name(frame_key),
+                "线程时间(s)": round(sampled * self.interval, 3),
+                "CPU 时间(s)": round(cpu * self.interval, 3),
+            }
+            for frame_key, (sampled, cpu) in sorted(totals.items(), key=lambda item: -item[1][0])[:limit]
+        ]
+        return pd.DataFrame(rows, columns=["函数", "线程时间(s)", "CPU 时间(s)"])
+
+    def to_collapsed(self, cpu: bool = False) -> str:
+        """折叠栈格式（flamegraph.pl / speedscope 均可导入）"""
+        samples = self.cpu_samples if cpu else self.thread_samples
+        lines = []
+        for key, count in samples.items():
+            frames = [key[0]] + [_profiler_frame_name(frame_key) for frame_key in key[1:]]
+            lines.append(f"{';'.join(frame.replace(';', ',') for frame in frames)} {count}")
+        return "\n".join(sorted(lines)) + "\n"
+
+    def to_speedscope(self, name: str) -> str:
+        """speedscope 采样格式，包含线程时间和 CPU 时间两个视图"""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Any, int] = {}
+
+        def index_of(frame_key) -> int:
+            if frame_key not in frame_index:
+                frame_index[frame_key] = len(frames)
+                if isinstance(frame_key, tuple):
+                    frames.append({"name": frame_key[0], "file": frame_key[1], "line": frame_key[2]})
+                else:
+                    frames.append({"name": f"[{frame_key}]"})
+            return frame_index[frame_key]
+
+        profiles = []
+        for label, samples in (("thread time", self.thread_samples), ("cpu", self.cpu_samples)):
+            stacks = [[index_of(frame_key) for frame_key in key] for key in samples]
+            weights = [count * self.interval for count in samples.values()]
+            profiles.append({
+                "type": "sampled",
+                "name": f"{name} ({label})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            })
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": name,
+            "exporter": "competitor-agent-team",
+        })
+
+@contextmanager
+def profile_run(enabled: bool, job: SchedulerJob = None):
+    """可选地对一次分析运行（当前线程及 job 的工作线程）进行采样，结果保存到 session_state.last_profile"""
+    if not enabled:
+        yield None
+        return
+    profiler = SamplingProfiler(job)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        st.session_state.last_profile = {
+            "name": f"analysis-{time.strftime('%Y%m%d-%H%M%S')}",
+            "summary": profiler.summary(),
+            "top_functions": profiler.top_functions(),
+            "speedscope": profiler.to_speedscope("competitor analysis"),
+            "collapsed": profiler.to_collapsed(),
+        }
+
+def render_profile_report(profile: Dict[str, Any]) -> None:
+    """显示性能采样结果和下载按钮"""
+    summary = profile["summary"]
+    with st.expander("⏱️ 性能采样结果", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("墙钟时间", f"{summary['wall_time']:.2f} s")
+        col2.metric("进程 CPU 时间", f"{summary['process_cpu_time']:.2f} s")
+        cpu_ratio = summary['cpu_ratio']
+        col3.metric("采样中占用 CPU 比例", f"{cpu_ratio:.0%}" if cpu_ratio is not None else "N/A")
+        st.caption(
+            f"本次运行的线程共 {summary['samples']} 个采样，约 {summary['thread_time']:.2f} s 线程时间"
+            "（多个工作线程并发时可超过墙钟时间）；未占用 CPU 的采样主要是网络/锁等待"
+        )
+        st.dataframe(profile["top_functions"], use_container_width=True, hide_index=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "下载 speedscope 文件",
+                data=profile["speedscope"],
+                file_name=f"{profile['name']}.speedscope.json",
+                mime="application/json",
+                use_container_width=True,
+                key="profile_speedscope"
+            )
+        with col2:
+            st.download_button(
+                "下载折叠栈（火焰图）",
+                data=profile["collapsed"],
+                file_name=f"{profile['name']}.collapsed.txt",
+                mime="text/plain",
+                use_container_width=True,
+                key="profile_collapsed"
+            )
+        st.caption("speedscope 文件可在 https://www.speedscope.app 打开；折叠栈可用 flamegraph.pl 生成火焰图")
+
+# 分析报告生成（单次分析和组合模式共用）
+def get_backend_setting(name: str, hedge: bool = False, default: Any = None) -> Any:
+    """读取会话中的后端配置；备用提供方优先使用 hedge_ 前缀的单独配置，未填写时使用主配置"""
+    if hedge and st.session_state.get(f"hedge_{name}"):
+        return st.session_state[f"hedge_{name}"]
+    return st.session_state.get(name, default)
+
+def create_backend(provider: str, job: SchedulerJob = None, hedge: bool = False) -> AnalyzerBackend:
+    """根据会话中的配置创建指定提供商的分析器后端（hedge 为 True 时使用备用提供方的配置）"""
+    if provider == "openai_compatible":
+        return OpenAICompatibleAnalyzer(
+            get_backend_setting('local_base_url', hedge, OPENAI_COMPATIBLE_DEFAULT_BASE_URL),
+            get_backend_setting('local_model', hedge, ''),
+            api_key=get_backend_setting('local_api_key', hedge, ''),
+            routing_policy=st.session_state.get('routing_policy', 'fixed'),
+            job=job
+        )
+    if provider == "openai":
+        openai_api_key = get_backend_setting('openai_api_key', hedge)
+        if openai_api_key:
+            return OpenAIAnalyzer(
+                openai_api_key,
+                st.session_state.get('openai_model', OPENAI_DEFAULT_MODEL),
+                routing_policy=st.session_state.get('routing_policy', 'fixed'),
+                job=job
+            )
+        raise Exception("OpenAI API Key 未配置")
+    # qwen
+    dashscope_api_key = get_backend_setting('dashscope_api_key', hedge)
+    if dashscope_api_key:
+        return QwenAnalyzer(
+            dashscope_api_key,
+            st.session_state.get('qwen_model', QWEN_DEFAULT_MODEL),
+            routing_policy=st.session_state.get('routing_policy', 'fixed'),
+            job=job
+        )
+    raise Exception("DashScope API Key 未配置")
+
+def create_analyzer(job: SchedulerJob = None) -> AnalyzerBackend:
+    """根据侧边栏选择的模型提供商创建分析器（启用对冲且备用提供方已配置时返回对冲分析器）"""
+    providers = [st.session_state.model_provider]
+    hedge_provider = st.session_state.get('hedge_provider')
+    if st.session_state.get('hedging_enabled') and hedge_provider and hedge_provider not in providers:
+        providers.append(hedge_provider)
+    
+    backends = []
+    errors = []
+    for index, provider in enumerate(providers):
+        try:
+            backends.append(create_backend(provider, job, hedge=index > 0))
+        except Exception as e:
+            errors.append(e)
+    if not backends:
+        raise errors[0]
+    if len(backends) == 1:
+        return backends[0]
+    return HedgedAnalyzer(backends, st.session_state.get('hedge_delay', HEDGE_DEFAULT_DELAY))
+
+def generate_analysis_report(analyzer: AnalyzerBackend, competitor_data: List[Dict], analytics_summary: str = None,
+                             incremental: bool = False, builder: IncrementalReportBuilder = None
+                             ) -> Tuple[Tuple[str, Optional[Dict], Optional[Dict]], bool]:
+    """生成分析报告，返回 ((报告, 模型路由, 增量统计), 是否复用了其他会话的结果)
+    
+    增量模式只重新分析输入变化的竞争对手（builder 为提取期间已开始片段分析的构建器）；
+    相同数据、模型配置和 API 密钥的并发分析在所有会话间合并为一次调用。
+    """
+    def analyze() -> Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        if incremental:
+            if builder is not None:
+                return builder.finish(competitor_data, analytics_summary)
+            return generate_incremental_report(analyzer, competitor_data, analytics_summary)
+        return analyzer.analyze_competitors_with_route(competitor_data, analytics_summary) + (None,)
+    
+    analysis_key = single_flight_key(
+        "analyze", analyzer.identity(), analyzer.credential_key(), competitor_data, analytics_summary, incremental
+    )
+    return _single_flight.do(analysis_key, analyze)
+
+def is_failed_report(analysis_report: Optional[str]) -> bool:
+    """报告为空或为分析器返回的错误信息"""
+    return (
+        not analysis_report
+        or analysis_report.startswith("分析过程中出现错误")
+        or "未正确初始化" in analysis_report[:40]
+        or "未正确配置" in analysis_report[:40]
+    )
+
+def run_analysis(url: str, description: str, job: SchedulerJob = None) -> bool:
+    """执行一次完整分析：发现、提取、对比、LLM 报告和导出，成功生成报告时返回 True"""
+    # 发现与提取流式重叠：每发现一个 URL 立即开始提取
+    engine = st.session_state.search_engine
+    job = job or get_current_job()
+    deduplicator = None
+    if st.session_state.get('dedupe_enabled'):
+        deduplicator = CompetitorUrlDeduplicator(st.session_state.get('dedupe_fingerprints', False))
+
+    competitor_urls = {}
+    extracted_records = {}
+    failed_ranks = set()
+    skipped_duplicates = 0
+    # 各阶段耗时（秒，自运行开始计），写入运行元数据供导出和压测统计
+    stage_timings = {}
+    run_started = time.perf_counter()
+    # 增量报告模式下每条记录提取完成即开始该竞争对手的分析片段，不等全部记录到齐
+    report_builder = None
+    if st.session_state.get('incremental_report', False):
+        try:
+            report_builder = IncrementalReportBuilder(create_analyzer(job))
+        except Exception:
+            report_builder = None
+
+    with st.status("正在搜索并分析竞争对手...", expanded=True) as pipeline_status:
+        target_count = st.session_state.get('target_count')
+        num_results = discovery_num_results(target_count)
+        fields = get_extraction_fields(st.session_state.get('extraction_profile', 'full'))
+        discovered_urls = take_discovery_prefetch(
+            url, description, engine, get_search_api_key(engine), num_results, fields, job
+        )
+        if discovered_urls:
+            st.info(f"⚡ 使用后台预取的 {len(discovered_urls)} 个竞争对手 URL")
+
+        for event, payload in run_competitor_pipeline(
+            url, description, engine, get_search_api_key(engine),
+            st.session_state.firecrawl_api_key, deduplicator,
+            num_results=num_results, target_count=target_count, job=job,
+            fields=fields,
+            use_cache=not st.session_state.get('refresh_extraction', False),
+            discovered_urls=discovered_urls
+        ):
+            if event == "url":
+                competitor_urls[payload[0]] = payload[1]
+                pipeline_status.update(label=f"已发现 {len(competitor_urls)} 个竞争对手，正在使用 Firecrawl 分析...")
+            elif event == "duplicate":
+                skipped_duplicates += 1
+                st.info(f"↺ 跳过重复的竞争对手 {payload[0]}（与 {payload[1]} 相同）")
+            elif event == "record":
+                rank, comp_url, competitor_info, error = payload
+                if competitor_info is not None:
+                    extracted_records[rank] = competitor_info
+                    if report_builder is not None:
+                        report_builder.submit(competitor_info)
+                    st.success(f"✓ 成功分析 {comp_url}")
+                else:
+                    failed_ranks.add(rank)
+                    if error:
+                        st.error(f"使用 Firecrawl 提取信息失败: {error}")
+                    st.error(f"✗ 分析失败 {comp_url}")
+            elif event == "discovery_error":
+                engine_name = "Perplexity" if engine == "perplexity" else "Exa"
+                st.error(f"从 {engine_name} 获取竞争对手 URL 时出错: {payload}")
+            elif event == "discovery_done":
+                stage_timings["discovery"] = time.perf_counter() - run_started
+                st.write(f"找到 {payload} 个竞争对手 URL")
+            elif event == "target_reached":
+                cancelled_count, cutoff_rank = payload
+                # 只保留截止排名之前的结果，排名靠后但先完成的提取不计入
+                late_ranks = [rank for rank in extracted_records if rank >= cutoff_rank]
+                for rank in late_ranks:
+                    del extracted_records[rank]
+                failed_ranks = {rank for rank in failed_ranks if rank < cutoff_rank}
+                competitor_urls = {rank: u for rank, u in competitor_urls.items() if rank < cutoff_rank}
+                message = f"已按排名取得 {target_count} 个不同的竞争对手，取消剩余 {cancelled_count} 个提取任务"
+                if late_ranks:
+                    message += f"，舍弃 {len(late_ranks)} 个排名靠后的结果"
+                st.info(message)
+        pipeline_status.update(label="竞争对手搜索与提取完成", state="complete", expanded=False)
+    stage_timings["extraction"] = time.perf_counter() - run_started
+
+    if not competitor_urls:
+        st.error("未找到竞争对手 URL！")
+        st.stop()
+
+    if skipped_duplicates:
+        st.info(f"已合并 {skipped_duplicates} 个重复的竞争对手 URL，共分析 {len(competitor_urls)} 个")
+
+    # 按发现顺序整理结果，与逐个提取时的顺序一致
+    competitor_data = [extracted_records[rank] for rank in sorted(extracted_records)]
+
+    if competitor_data:
+        st.success(f"成功分析了 {len(extracted_records)}/{len(extracted_records) + len(failed_ranks)} 个竞争对手！")
+
+        # 提取后合并内容近似的记录
+        if st.session_state.get('dedupe_enabled'):
+            record_count = len(competitor_data)
+            competitor_data = merge_near_duplicate_records(competitor_data)
+            if len(competitor_data) < record_count:
+                st.info(f"已将 {record_count} 条记录合并为 {len(competitor_data)} 个不同的竞争对手")
+
+        # 结果先保存到 session_state，对比表格和相似度视图从中读取
+        st.session_state.last_run = {"competitor_data": competitor_data, "metadata": {}}
+        comparison_started = time.perf_counter()
+        with st.spinner("正在生成对比表格..."):
+            render_results_view()
+        stage_timings["comparison"] = time.perf_counter() - comparison_started
+
+        # 本地计算功能与技术栈相似度，数值摘要随提示发送给 LLM
+        analytics_summary = summarize_similarity_analytics(_get_similarity_analytics(competitor_data))
+
+        # 先显示基础分析报告，AI 报告生成后在同一位置替换
+        st.subheader("🧠 竞争对手智能分析报告")
+        report_placeholder = st.empty()
+        baseline_report = generate_fallback_analysis(competitor_data)
+        with report_placeholder.container():
+            st.info("AI 分析报告生成中，先显示基础分析报告，生成后将自动替换")
+            st.markdown("---")
+            st.markdown(baseline_report)
+        final_report = baseline_report
+
+        # 生成分析报告
+        model_route = None
+        analysis_started = time.perf_counter()
+        with st.spinner("正在生成分析报告..."):
+            try:
+                analyzer = report_builder.analyzer if report_builder is not None else create_analyzer(job)
+                (analysis_report, model_route, incremental_stats), shared_analysis = generate_analysis_report(
+                    analyzer, competitor_data, analytics_summary, st.session_state.get('incremental_report', False),
+                    report_builder
+                )
+
+                # 用分析报告替换基础报告
+                with report_placeholder.container():
+                    if model_route:
+                        st.caption(describe_model_route(model_route))
+                    if shared_analysis:
+                        st.caption("↺ 已复用其他会话中正在进行的相同分析")
+                    if incremental_stats:
+                        st.caption(
+                            f"增量报告：复用 {incremental_stats['reused']} 个竞争对手的分析，"
+                            f"重新分析 {incremental_stats['computed']} 个"
+                            + (f"，{incremental_stats['failed']} 个分析失败（改用原始数据）"
+                               if incremental_stats['failed'] else "")
+                            + ("，合并结果来自缓存" if incremental_stats['merge_cached'] else "")
+                        )
+                    st.markdown("---")
+
+                    # 检查报告内容是否为空或包含错误信息
+                    if not is_failed_report(analysis_report):
+                        st.markdown(analysis_report)
+                        final_report = analysis_report
+                    else:
+                        st.error("AI分析报告生成失败，显示基础分析报告")
+                        st.markdown("---")
+                        st.markdown(baseline_report)
+
+            except Exception as e:
+                with report_placeholder.container():
+                    st.error(f"AI分析过程中出现错误: {str(e)}")
+                    st.info("显示基础分析报告作为备用方案")
+                    st.markdown("---")
+                    st.markdown(baseline_report)
+            finally:
+                if report_builder is not None:
+                    report_builder.close()
+
+        stage_timings["analysis"] = time.perf_counter() - analysis_started
+        stage_timings["total"] = time.perf_counter() - run_started
+        st.success("分析完成！")
+        st.caption("阶段耗时：" + " · ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_timings.items()))
+
+        # 保存本次运行结果并提供导出
+        run_metadata = build_run_metadata(competitor_data, url, description, final_report, model_route, stage_timings)
+        st.session_state.last_run = {"competitor_data": competitor_data, "metadata": run_metadata}
+        render_export_buttons(competitor_data, run_metadata)
+        return True
+    else:
+        if report_builder is not None:
+            report_builder.close()
+        st.error("无法提取任何竞争对手数据")
+    return False
+
+def run_portfolio_analysis(targets: List[Tuple[str, str]], job: SchedulerJob = None) -> bool:
+    """组合模式：共享队列发现和提取竞争对手，再为每家公司生成对比表格和报告，结果保存到 session_state"""
+    engine = st.session_state.search_engine
+    job = job or get_current_job()
+    deduplicator = None
+    if st.session_state.get('dedupe_enabled'):
+        deduplicator = CompetitorUrlDeduplicator(st.session_state.get('dedupe_fingerprints', False))
+    
+    assignments: Dict[int, List[str]] = {index: [] for index in range(len(targets))}
+    records: Dict[str, Dict] = {}
+    aliases: Dict[str, str] = {}
+    discovered_urls = 0
+    queued_urls = 0
+    failed_extractions = 0
+    finished_targets = 0
+    
+    with st.status(f"正在发现并提取 {len(targets)} 家公司的竞争对手...", expanded=True) as pipeline_status:
+        for event, payload in run_portfolio_pipeline(
+            targets, engine, get_search_api_key(engine), st.session_state.firecrawl_api_key, deduplicator,
+            job=job,
+            fields=get_extraction_fields(st.session_state.get('extraction_profile', 'full')),
+            use_cache=not st.session_state.get('refresh_extraction', False)
+        ):
+            if event == "url":
+                target_index, key, is_new = payload
+                assignments[target_index].append(key)
+                discovered_urls += 1
+                queued_urls += int(is_new)
+            elif event == "duplicate":
+                target_index, _, canonical_key = payload
+                assignments[target_index].append(canonical_key)
+                discovered_urls += 1
+            elif event == "alias":
+                aliases[payload[0]] = payload[1]
+                queued_urls -= 1
+            elif event == "record":
+                key, record, error = payload
+                if record is not None:
+                    records[key] = record
+                else:
+                    failed_extractions += 1
+                    st.error(f"✗ 分析失败 {key}" + (f": {error}" if error else ""))
+            elif event == "discovery_error":
+                target_index, message = payload
+                st.error(f"{portfolio_target_label(targets[target_index])}: 获取竞争对手 URL 时出错: {message}")
+            elif event == "discovery_done":
+                finished_targets += 1
+            pipeline_status.update(
+                label=f"已完成 {finished_targets}/{len(targets)} 家公司的发现，"
+                      f"发现 {discovered_urls} 个竞争对手 URL，共享队列中 {queued_urls} 个，已提取 {len(records)} 个"
+            )
+        pipeline_status.update(label="组合竞争对手搜索与提取完成", state="complete", expanded=False)
+    
+    company_data = fan_out_portfolio_records(assignments, records, aliases)
+    if st.session_state.get('dedupe_enabled'):
+        company_data = {index: merge_near_duplicate_records(data) for index, data in company_data.items()}
+    if not any(company_data.values()):
+        st.error("无法提取任何竞争对手数据")
+        return False
+    st.success(
+        f"组合共 {len(targets)} 家公司：发现 {discovered_urls} 个竞争对手 URL，"
+        f"去重后只需提取 {queued_urls} 个（节省 {discovered_urls - queued_urls} 次提取），失败 {failed_extractions} 个"
+    )
+    
+    # 在线程池中并发为各公司生成报告（增量模式下共同竞争对手的分析片段在公司之间复用）
+    reports: Dict[int, str] = {}
+    routes: Dict[int, Optional[Dict[str, Any]]] = {}
+    companies = {target_index: data for target_index, data in company_data.items() if data}
+    try:
+        analyzer = create_analyzer(job)
+    except Exception as e:
+        st.error(f"AI分析过程中出现错误: {str(e)}，将为各公司显示基础分析报告")
+        analyzer = None
+    if analyzer is not None:
+        incremental = st.session_state.get('incremental_report', False)
+        progress = st.progress(0.0, text="正在生成各公司的分析报告...")
+        with ThreadPoolExecutor(max_workers=min(PORTFOLIO_REPORT_WORKERS, len(companies)),
+                                initializer=track_job_thread, initargs=(job,)) as executor:
+            futures = {
+                executor.submit(generate_portfolio_report, analyzer, data, incremental): target_index
+                for target_index, data in companies.items()
+            }
+            for position, future in enumerate(as_completed(futures), 1):
+                target_index = futures[future]
+                try:
+                    reports[target_index], routes[target_index] = future.result()
+                except Exception as e:
+                    st.error(f"{portfolio_target_label(targets[target_index])}: AI分析过程中出现错误: {str(e)}")
+                progress.progress(position / len(futures), text=f"已生成 {position}/{len(futures)} 家公司的分析报告")
+        progress.empty()
+    
+    metadata: Dict[int, Dict[str, Any]] = {}
+    for target_index, data in companies.items():
+        if is_failed_report(reports.get(target_index)):
+            reports[target_index] = generate_fallback_analysis(data)
+            routes[target_index] = None
+        url, description = targets[target_index]
+        metadata[target_index] = build_run_metadata(data, url, description, reports[target_index], routes[target_index])
     
-    return analysis
+    st.session_state.last_portfolio = {
+        "targets": targets,
+        "company_data": company_data,
+        "reports": reports,
+        "metadata": metadata,
+        "stats": {"discovered": discovered_urls, "extracted": queued_urls, "failed": failed_extractions},
+    }
+    return True
+
+def generate_portfolio_report(analyzer: AnalyzerBackend, competitor_data: List[Dict],
+                              incremental: bool = False) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """为组合中的一家公司生成报告，返回 (报告, 模型路由)（不依赖 Streamlit 会话，可在工作线程中调用）"""
+    analytics_summary = summarize_similarity_analytics(compute_similarity_analytics(competitor_data))
+    (analysis_report, model_route, _), _ = generate_analysis_report(analyzer, competitor_data, analytics_summary, incremental)
+    return analysis_report, model_route
+
+@st.fragment
+def render_portfolio_view() -> None:
+    """组合模式结果：选择公司查看其对比表格、相似度分析和报告"""
+    portfolio = st.session_state.get('last_portfolio')
+    if not portfolio:
+        return
+    targets = portfolio["targets"]
+    company_data = portfolio["company_data"]
+    stats = portfolio["stats"]
+    st.subheader("🗂️ 组合分析结果")
+    st.caption(
+        f"{len(targets)} 家公司，发现 {stats['discovered']} 个竞争对手 URL，"
+        f"共享提取 {stats['extracted']} 个（节省 {stats['discovered'] - stats['extracted']} 次提取）"
+    )
+    target_index = st.selectbox(
+        "选择公司",
+        options=list(range(len(targets))),
+        format_func=lambda index: f"{portfolio_target_label(targets[index])}（{len(company_data.get(index, []))} 个竞争对手）",
+        key="portfolio_company"
+    )
+    data = company_data.get(target_index) or []
+    if not data:
+        st.warning("未能提取该公司的竞争对手数据")
+        return
+    generate_comparison_report(data, key_prefix=f"portfolio_{target_index}")
+    render_similarity_analytics(data, key_prefix=f"portfolio_similarity_{target_index}")
+    analysis_report = portfolio["reports"].get(target_index)
+    if analysis_report:
+        render_analysis_report(analysis_report)
+    # 元数据在运行时生成一次（run_id 固定），导出文件按 run_id 缓存，切换公司或重跑时不重新序列化
+    render_export_buttons(data, portfolio["metadata"][target_index], key_prefix=f"portfolio_export_{target_index}")
 
 # 主程序逻辑
 def main():
     """主程序逻辑"""
     # 检查必要的配置
-    required_configs = []
-    
-    if not st.session_state.get('model_provider'):
-        required_configs.append("AI模型提供商")
-    if not st.session_state.get('search_engine'):
-        required_configs.append("搜索引擎")
-    if not st.session_state.get('firecrawl_api_key'):
-        required_configs.append("Firecrawl API")
-    
+    required_configs = get_missing_configs()
     if required_configs:
         st.warning(f"请先配置以下选项：{', '.join(required_configs)}")
         return
     
     # 分析按钮
+    just_ran = False
+    url = st.session_state.get('input_url', '')
+    description = st.session_state.get('input_description', '')
+    portfolio_mode = st.session_state.get('portfolio_mode', False)
     st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         if st.button("🚀 开始分析竞争对手", type="primary", use_container_width=True):
-            if url or description:
-                # 获取竞争对手 URL
-                with st.spinner("正在搜索竞争对手..."):
-                    competitor_urls = get_competitor_urls(url=url, description=description)
-                    st.write(f"找到 {len(competitor_urls)} 个竞争对手 URL")
-                
-                if not competitor_urls:
-                    st.error("未找到竞争对手 URL！")
-                    st.stop()
-                
-                # 提取竞争对手信息
-                competitor_data = []
-                successful_extractions = 0
-                failed_extractions = 0
-                
-                for i, comp_url in enumerate(competitor_urls):
-                    with st.spinner(f"正在使用 Firecrawl 分析竞争对手 {i+1}/{len(competitor_urls)}: {comp_url}"):
-                        competitor_info = extract_competitor_info(comp_url)
-                        
-                        if competitor_info is not None:
-                            competitor_data.append(competitor_info)
-                            successful_extractions += 1
-                            st.success(f"✓ 成功分析 {comp_url}")
-                        else:
-                            failed_extractions += 1
-                            st.error(f"✗ 分析失败 {comp_url}")
-                
-                if competitor_data:
-                    st.success(f"成功分析了 {successful_extractions}/{len(competitor_urls)} 个竞争对手！")
-                    
-                    # 生成对比表格
-                    with st.spinner("正在生成对比表格..."):
-                        generate_comparison_report(competitor_data)
-                    
-                    # 生成分析报告
-                    with st.spinner("正在生成分析报告..."):
-                        try:
-                            # 根据选择的模型提供商进行分析
-                            if st.session_state.model_provider == "openai":
-                                if st.session_state.get('openai_api_key'):
-                                    analyzer = OpenAIAnalyzer(st.session_state.openai_api_key)
-                                    analysis_report = analyzer.analyze_competitors(competitor_data)
-                                else:
-                                    raise Exception("OpenAI API Key 未配置")
-                            else:  # qwen
-                                if st.session_state.get('dashscope_api_key'):
-                                    analyzer = QwenAnalyzer(
-                                        st.session_state.dashscope_api_key,
-                                        st.session_state.get('qwen_model', 'qwen-max')
-                                    )
-                                    analysis_report = analyzer.analyze_competitors(competitor_data)
-                                else:
-                                    raise Exception("DashScope API Key 未配置")
-                            
-                            # 显示分析报告
-                            st.subheader("🧠 竞争对手智能分析报告")
-                            st.markdown("---")
-                            
-                            # 检查报告内容是否为空或包含错误信息
-                            if analysis_report and not analysis_report.startswith("分析过程中出现错误") and not analysis_report.startswith("Agent 未正确初始化"):
-                                # 使用容器美化显示
-                                with st.container():
-                                    st.markdown(analysis_report)
-                            else:
-                                st.error("AI分析报告生成失败，显示基础分析报告")
-                                st.markdown("---")
-                                fallback_report = generate_fallback_analysis(competitor_data)
-                                st.markdown(fallback_report)
-                                
-                        except Exception as e:
-                            st.error(f"AI分析过程中出现错误: {str(e)}")
-                            st.info("显示基础分析报告作为备用方案")
-                            st.markdown("---")
-                            fallback_report = generate_fallback_analysis(competitor_data)
-                            st.markdown(fallback_report)
-                    
-                    st.success("分析完成！")
+            if portfolio_mode:
+                targets = parse_portfolio_targets(st.session_state.get('portfolio_targets', ''))
+                if targets:
+                    job = get_current_job()
+                    with profile_run(st.session_state.get('profiling_enabled', False), job):
+                        run_portfolio_analysis(targets, job)
                 else:
-                    st.error("无法提取任何竞争对手数据")
+                    st.error("请至少输入一家公司（每行一个 URL 或描述）")
+            elif url or description:
+                job = get_current_job()
+                with profile_run(st.session_state.get('profiling_enabled', False), job):
+                    just_ran = run_analysis(url, description, job)
             else:
                 st.error("请提供 URL 或描述")
+    
+    # 加载历史结果
+    with st.expander("📂 加载历史结果"):
+        uploaded_file = st.file_uploader(
+            "选择导出的结果文件",
+            type=["parquet", "arrow", "feather", "jsonl"],
+            help="支持本应用导出的 Parquet / Arrow / JSONL 文件"
+        )
+    
+    if uploaded_file is not None and st.session_state.get('loaded_file_id') != uploaded_file.file_id:
+        try:
+            competitor_data, run_metadata = load_run_data(uploaded_file.name, uploaded_file.getvalue())
+        except Exception as e:
+            st.error(f"加载结果文件失败: {str(e)}")
+        else:
+            st.session_state.last_run = {"competitor_data": competitor_data, "metadata": run_metadata}
+            st.session_state.loaded_file_id = uploaded_file.file_id
+    
+    # 重新显示最近一次的结果（筛选、翻页等交互不会丢失结果）
+    last_run = st.session_state.get('last_run')
+    if portfolio_mode:
+        render_portfolio_view()
+    elif last_run and not just_ran:
+        render_saved_run(last_run['competitor_data'], last_run['metadata'])
+        render_export_buttons(last_run['competitor_data'], last_run['metadata'])
+    
+    # 最近一次运行的性能采样结果
+    if st.session_state.get('last_profile'):
+        render_profile_report(st.session_state.last_profile)
+
+# 侧边栏配置和输入区域（在主程序之前运行，主程序读取其中写入的 session_state）
+with st.sidebar:
+    render_sidebar_config()
+render_input_form()
 
 # 运行主程序
 if __name__ == "__main__":
@@ -1040,6 +4066,9 @@ with st.expander("📖 使用说明"):
     
     # 搜索引擎支持（可选）
     pip install exa-py
+    
+    # Parquet / Arrow 导出支持（可选）
+    pip install pyarrow
     ```
     
     ### 2. 获取 API 密钥
@@ -1082,24 +4111,35 @@ with st.expander("📖 使用说明"):
     - 如果AI分析失败，系统会自动提供基础分析报告
     """)
 
+# 提供方调度队列
+with st.sidebar.expander("📶 提供方调度队列"):
+    render_scheduler_status()
+
 # 依赖检查
-with st.expander("🔧 依赖检查"):
-    st.markdown("### 依赖库状态")
-    
-    dependencies = [
-        ("Streamlit", True, "Web界面框架"),
-        ("Pandas", True, "数据处理"),
-        ("Requests", True, "HTTP请求"),
-        ("Pydantic", True, "数据验证"),
-        ("Agno (OpenAI)", AGNO_AVAILABLE, "OpenAI模型支持"),
-        ("Qwen Agent", QWEN_AVAILABLE, "Qwen模型支持"),
-        ("Firecrawl", FIRECRAWL_AVAILABLE, "网站爬取"),
-        ("Exa", EXA_AVAILABLE, "Exa搜索引擎支持")
-    ]
-    
-    for dep_name, available, description in dependencies:
-        status = "✅ 已安装" if available else "❌ 未安装"
-        st.write(f"- **{dep_name}**: {status} - {description}")
-    
-    if not all([AGNO_AVAILABLE or QWEN_AVAILABLE, FIRECRAWL_AVAILABLE]):
-        st.warning("⚠️ 请安装必要的依赖库以获得完整功能")
+@st.fragment
+def render_dependency_check() -> None:
+    """依赖库状态面板"""
+    with st.expander("🔧 依赖检查"):
+        st.markdown("### 依赖库状态")
+    
+        dependencies = [
+            ("Streamlit", True, "Web界面框架"),
+            ("Pandas", True, "数据处理"),
+            ("Requests", True, "HTTP请求"),
+            ("Pydantic", True, "数据验证"),
+            ("Agno (OpenAI)", AGNO_AVAILABLE, "OpenAI模型支持"),
+            ("Qwen Agent", QWEN_AVAILABLE, "Qwen模型支持"),
+            ("Firecrawl", FIRECRAWL_AVAILABLE, "网站爬取"),
+            ("Exa", EXA_AVAILABLE, "Exa搜索引擎支持"),
+            ("PyArrow", PYARROW_AVAILABLE, "Parquet/Arrow 导出"),
+            ("tldextract", TLDEXTRACT_AVAILABLE, "按公共后缀列表识别品牌域名")
+        ]
+    
+        for dep_name, available, description in dependencies:
+            status = "✅ 已安装" if available else "❌ 未安装"
+            st.write(f"- **{dep_name}**: {status} - {description}")
+    
+        if not all([AGNO_AVAILABLE or QWEN_AVAILABLE, FIRECRAWL_AVAILABLE]):
+            st.warning("⚠️ 请安装必要的依赖库以获得完整功能")
+
+render_dependency_check()
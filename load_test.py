@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+竞争对手分析应用压测工具
+启动应用服务器和本地模拟的 Perplexity / Firecrawl / OpenAI 服务，
+通过 Streamlit WebSocket 协议驱动多个并发会话各完成一次完整分析，
+统计各阶段延迟分位数、每会话内存和饱和点
+
+用法：
+    python load_test.py --sessions 1,2,4,8,16
+    python load_test.py --sessions 4,8 --llm-latency 5 --distinct-keys --json result.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+DEFAULT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "competitor_agent_team_combined - 1.py")
+ANALYZE_BUTTON_LABEL = "🚀 开始分析竞争对手"
+INPUT_URL_LABEL = "输入您的公司 URL："
+STAGE_TIMINGS_PREFIX = "阶段耗时："
+STAGES = ["discovery", "extraction", "comparison", "analysis", "total"]
+_STAGE_PATTERN = re.compile(r"(\w+) ([\d.]+)s")
+
+# 本地模拟服务
+_FAKE_WORDS = [
+    "analytics", "dashboard", "workflow", "automation", "reporting", "integration", "security",
+    "collaboration", "forecasting", "billing", "onboarding", "alerts", "api", "sso", "audit",
+    "python", "react", "postgres", "kubernetes", "kafka", "redis", "go", "rust", "aws", "gcp",
+]
+
+def _fake_competitor(url: str) -> Dict[str, Any]:
+    """根据 URL 生成稳定但彼此不同的模拟提取结果"""
+    rng = random.Random(url)
+    name = url.split("//", 1)[-1].split("/", 1)[0]
+    return {
+        "company_name": name,
+        "pricing": f"Starter ${rng.randint(5, 50)}/mo, Pro ${rng.randint(60, 300)}/mo, Enterprise custom",
+        "key_features": rng.sample(_FAKE_WORDS[:15], 5),
+        "tech_stack": rng.sample(_FAKE_WORDS[15:], 4),
+        "marketing_focus": " ".join(rng.sample(_FAKE_WORDS, 8)),
+        "customer_feedback": " ".join(rng.sample(_FAKE_WORDS, 10)),
+    }
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """模拟的外部服务接口
+
+    - POST /perplexity/chat/completions：Perplexity 流式搜索（SSE）
+    - POST /firecrawl/v1/extract 与 GET /firecrawl/v1/extract/<id>：Firecrawl 提取任务
+    - POST /openai/v1/chat/completions：OpenAI 对话补全
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, chunks: List[str], latency: float) -> None:
+        """按 OpenAI 兼容的 SSE 格式逐块发送，总耗时约为 latency"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks:
+            time.sleep(latency / max(len(chunks), 1))
+            event = {"choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_POST(self):
+        body = self._read_json()
+        config = self.server.config
+        if self.path.startswith("/perplexity/"):
+            query = body.get("messages", [{}])[-1].get("content", "")
+            seed = hashlib.sha1(query.encode("utf-8")).hexdigest()[:6]
+            urls = [f"https://rival{seed}{index}.com\n" for index in range(config["competitors"])]
+            self._send_stream(urls, config["search_latency"])
+        elif self.path.startswith("/firecrawl/") and self.path.endswith("/extract"):
+            job_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.extract_jobs[job_id] = (body.get("urls") or [""])[0]
+            self._send_json({"success": True, "id": job_id})
+        elif self.path.startswith("/openai/") and self.path.endswith("/chat/completions"):
+            report = "# 竞争对手分析报告（压测）\n\n" + "\n".join(
+                f"- 维度 {index}: " + " ".join(_FAKE_WORDS) for index in range(config["report_lines"])
+            )
+            if body.get("stream"):
+                self._send_stream([line + "\n" for line in report.split("\n")], config["llm_latency"])
+                return
+            time.sleep(config["llm_latency"])
+            self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": report}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def do_GET(self):
+        match = re.search(r"/firecrawl/v1/extract/(\w+)$", self.path)
+        if not match:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+            return
+        with self.server.lock:
+            url_pattern = self.server.extract_jobs.pop(match.group(1), "")
+        time.sleep(self.server.config["extract_latency"])
+        self._send_json({
+            "success": True,
+            "status": "completed",
+            "data": _fake_competitor(url_pattern.rstrip("/*")),
+        })
+
+def start_fake_providers(config: Dict[str, Any]) -> ThreadingHTTPServer:
+    """在后台线程中启动模拟服务"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProviderHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.extract_jobs = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="fake-providers", daemon=True).start()
+    return server
+
+# 应用服务器
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_app_server(app_path: str, port: int, provider_url: str, timeout: float = 60) -> subprocess.Popen:
+    """以无界面模式启动 Streamlit，外部服务地址指向模拟服务"""
+    env = dict(
+        os.environ,
+        PERPLEXITY_API_URL=f"{provider_url}/perplexity/chat/completions",
+        FIRECRAWL_API_URL=f"{provider_url}/firecrawl",
+        OPENAI_BASE_URL=f"{provider_url}/openai/v1",
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", app_path,
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Streamlit 服务启动失败（退出码 {process.returncode}）")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待 Streamlit 服务启动超时")
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """读取进程常驻内存（Linux 读取 /proc，其他平台尝试 psutil）"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+# 模拟浏览器会话
+class SessionClient:
+    """通过 WebSocket 协议驱动一个 Streamlit 会话"""
+
+    def __init__(self, port: int, timeout: float):
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+        self.widgets: Dict[str, str] = {}
+        self.texts: List[str] = []
+        self.exceptions: List[str] = []
+        self._message_cache: Dict[str, ForwardMsg] = {}
+
+    async def connect(self) -> None:
+        self.connection = await websocket_connect(
+            f"ws://127.0.0.1:{self.port}/_stcore/stream", subprotocols=["streamlit"]
+        )
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _handle_message(self, msg: ForwardMsg) -> None:
+        if msg.WhichOneof("type") == "ref_hash":
+            msg = self._message_cache.get(msg.ref_hash, msg)
+        elif msg.hash:
+            self._message_cache[msg.hash] = msg
+        if msg.WhichOneof("type") != "delta" or msg.delta.WhichOneof("type") != "new_element":
+            return
+        element = msg.delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in ("button", "text_input", "text_area"):
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = widget.id
+        elif kind == "markdown":
+            self.texts.append(element.markdown.body)
+        elif kind == "alert":
+            self.texts.append(element.alert.body)
+        elif kind == "exception":
+            self.exceptions.append(f"{element.exception.type}: {element.exception.message}")
+
+    async def rerun(self, widget_states: List[WidgetState]) -> float:
+        """请求重新运行脚本并等待运行结束，返回收到第一条界面更新的耗时"""
+        self.texts = []
+        back_msg = BackMsg()
+        back_msg.rerun_script.widget_states.widgets.extend(widget_states)
+        started = time.perf_counter()
+        first_delta = None
+        await self.connection.write_message(back_msg.SerializeToString(), binary=True)
+        while True:
+            payload = await asyncio.wait_for(self.connection.read_message(), self.timeout)
+            if payload is None:
+                raise RuntimeError("WebSocket 连接已关闭")
+            msg = ForwardMsg.FromString(payload)
+            if first_delta is None and msg.WhichOneof("type") in ("delta", "ref_hash"):
+                first_delta = time.perf_counter() - started
+            if msg.WhichOneof("type") == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return first_delta or 0.0
+                continue
+            self._handle_message(msg)
+
+def _text_state(widget_id: str, value: str) -> WidgetState:
+    state = WidgetState(id=widget_id)
+    state.string_value = value
+    return state
+
+def parse_stage_timings(texts: List[str]) -> Dict[str, float]:
+    """从页面上的阶段耗时说明中解析各阶段耗时"""
+    for text in texts:
+        if text.startswith(STAGE_TIMINGS_PREFIX):
+            return {stage: float(seconds) for stage, seconds in _STAGE_PATTERN.findall(text)}
+    return {}
+
+async def run_session(port: int, index: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """模拟一位用户：打开页面、填写配置和公司 URL、点击分析并等待报告"""
+    client = SessionClient(port, args.timeout)
+    result: Dict[str, Any] = {"session": index, "client": client, "ok": False}
+    try:
+        await client.connect()
+        await client.rerun([])
+
+        key_suffix = str(index) if args.distinct_keys else "shared"
+        company_url = "https://load-test-company.com" if args.shared_input else f"https://load-test-company-{index}.com"
+        values = {
+            "OpenAI API Key": f"sk-load-{key_suffix}",
+            "Perplexity API Key": f"pplx-load-{key_suffix}",
+            "Firecrawl API Key": f"fc-load-{key_suffix}",
+            INPUT_URL_LABEL: company_url,
+        }
+        missing = [label for label in values if label not in client.widgets]
+        if missing:
+            raise RuntimeError(f"页面上找不到输入框: {missing}")
+        states = [_text_state(client.widgets[label], value) for label, value in values.items()]
+        await client.rerun(states)
+
+        button_id = client.widgets.get(ANALYZE_BUTTON_LABEL)
+        if not button_id:
+            raise RuntimeError("页面上找不到分析按钮")
+        clicked = time.perf_counter()
+        result["first_response"] = await client.rerun(states + [WidgetState(id=button_id, trigger_value=True)])
+        result["client_total"] = time.perf_counter() - clicked
+        result["stages"] = parse_stage_timings(client.texts)
+        if client.exceptions:
+            result["error"] = client.exceptions[0]
+        elif not result["stages"]:
+            result["error"] = next((text for text in client.texts if "失败" in text or "错误" in text), "未生成分析结果")
+        else:
+            result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+# 统计
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+async def run_level(port: int, server_pid: int, sessions: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """以指定并发数运行一轮，会话在内存采样之后才断开"""
+    rss_before = rss_bytes(server_pid)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_session(port, index, args) for index in range(sessions)))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes(server_pid)
+    for result in results:
+        result.pop("client").close()
+    await asyncio.sleep(args.cooldown)
+
+    completed = [result for result in results if result["ok"]]
+    latencies = {stage: [result["stages"][stage] for result in completed if stage in result["stages"]] for stage in STAGES}
+    latencies["client_total"] = [result["client_total"] for result in completed]
+    latencies["first_response"] = [result["first_response"] for result in completed]
+    return {
+        "sessions": sessions,
+        "completed": len(completed),
+        "errors": [result["error"] for result in results if not result["ok"]],
+        "elapsed": elapsed,
+        "throughput_per_min": len(completed) / elapsed * 60 if elapsed else 0.0,
+        "latency": {
+            stage: {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+            for stage, values in latencies.items()
+        },
+        "memory_per_session": (rss_after - rss_before) / sessions if rss_before and rss_after else None,
+        "server_rss": rss_after,
+    }
+
+def find_saturation(levels: List[Dict[str, Any]], min_gain: float, latency_factor: float) -> Optional[int]:
+    """返回第一个饱和的并发数：出现失败、p95 总延迟超过单会话基线的倍数，或吞吐不再明显增长"""
+    baseline = levels[0]["latency"]["client_total"]["p95"] if levels else None
+    best_throughput = 0.0
+    for level in levels:
+        p95 = level["latency"]["client_total"]["p95"]
+        if level["errors"] or p95 is None:
+            return level["sessions"]
+        if baseline and p95 > baseline * latency_factor:
+            return level["sessions"]
+        if best_throughput and level["throughput_per_min"] < best_throughput * (1 + min_gain):
+            return level["sessions"]
+        best_throughput = max(best_throughput, level["throughput_per_min"])
+    return None
+
+def _format_seconds(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "-"
+
+def print_report(levels: List[Dict[str, Any]], saturation: Optional[int]) -> None:
+    """以表格形式输出压测结果"""
+    for level in levels:
+        memory = level["memory_per_session"]
+        memory_text = f"{memory / 2 ** 20:.1f} MiB" if memory is not None else "N/A"
+        print(
+            f"\n== 并发 {level['sessions']}：完成 {level['completed']}/{level['sessions']}，"
+            f"耗时 {level['elapsed']:.1f}s，吞吐 {level['throughput_per_min']:.1f} 次/分，"
+            f"每会话内存 {memory_text}"
+        )
+        print(f"   {'阶段':<16}{'p50':>8}{'p95':>8}{'p99':>8}")
+        for stage, values in level["latency"].items():
+            print(f"   {stage:<16}" + "".join(f"{_format_seconds(values[f'p{pct}']):>8}" for pct in (50, 95, 99)))
+        for error in sorted(set(level["errors"]))[:5]:
+            print(f"   ✗ {error}")
+    print()
+    if saturation is None:
+        print("在测试的并发范围内未达到饱和")
+    else:
+        print(f"饱和点：并发 {saturation} 个会话时延迟或吞吐开始恶化")
+
+async def run_load_test(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    providers = start_fake_providers({
+        "competitors": args.competitors,
+        "search_latency": args.search_latency,
+        "extract_latency": args.extract_latency,
+        "llm_latency": args.llm_latency,
+        "report_lines": 20,
+    })
+    port = args.port or _free_port()
+    server = start_app_server(args.app, port, f"http://127.0.0.1:{providers.server_address[1]}")
+    try:
+        # 预热一次，排除首次导入和缓存初始化的开销
+        await run_session(port, -1, args)
+        levels = []
+        for sessions in args.sessions:
+            level = await run_level(port, server.pid, sessions, args)
+            levels.append(level)
+            print(f"并发 {sessions}: 完成 {level['completed']}/{sessions}，耗时 {level['elapsed']:.1f}s", flush=True)
+        return levels
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        providers.shutdown()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="模拟多个并发会话压测竞争对手分析应用")
+    parser.add_argument("--app", default=DEFAULT_APP, help="应用脚本路径")
+    parser.add_argument("--port", type=int, default=0, help="Streamlit 端口（默认随机空闲端口）")
+    parser.add_argument("--sessions", default="1,2,4,8,16",
+                        type=lambda text: [int(item) for item in text.split(",") if item.strip()],
+                        help="逐轮测试的并发会话数，逗号分隔")
+    parser.add_argument("--competitors", type=int, default=10, help="模拟搜索返回的竞争对手数量")
+    parser.add_argument("--search-latency", type=float, default=1.0, help="模拟搜索耗时（秒）")
+    parser.add_argument("--extract-latency", type=float, default=2.0, help="模拟单个网站提取耗时（秒）")
+    parser.add_argument("--llm-latency", type=float, default=3.0, help="模拟 LLM 分析耗时（秒）")
+    parser.add_argument("--distinct-keys", action="store_true", help="每个会话使用不同的 API Key（默认共享同一组 Key 和配额）")
+    parser.add_argument("--shared-input", action="store_true", help="所有会话分析同一家公司（测试请求合并）")
+    parser.add_argument("--timeout", type=float, default=300, help="单次页面运行的超时时间（秒）")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="每轮之间的间隔（秒）")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="判定饱和的最小吞吐增长比例")
+    parser.add_argument("--latency-factor", type=float, default=2.0, help="判定饱和的 p95 延迟相对单会话基线的倍数")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    levels = asyncio.run(run_load_test(args))
+    saturation = find_saturation(levels, args.min_gain, args.latency_factor)
+    print_report(levels, saturation)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as result_file:
+            json.dump({"levels": levels, "saturation": saturation}, result_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
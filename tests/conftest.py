@@ -0,0 +1,25 @@
+import importlib.util
+import logging
+import pathlib
+
+import pytest
+
+APP_PATH = pathlib.Path(__file__).resolve().parent.parent / "competitor_agent_team_combined - 1.py"
+
+
+@pytest.fixture(scope="session")
+def app():
+    """以模块形式加载应用脚本（Streamlit 裸模式运行，页面调用均为空操作）"""
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    spec = importlib.util.spec_from_file_location("competitor_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def session_state(app):
+    """每个测试使用干净的 session_state"""
+    app.st.session_state.clear()
+    yield app.st.session_state
+    app.st.session_state.clear()
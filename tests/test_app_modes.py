@@ -0,0 +1,53 @@
+import pathlib
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = pathlib.Path(__file__).resolve().parent.parent / "competitor_agent_team_combined - 1.py"
+
+RECORDS = [{"competitor_url": f"https://c{i}.com", "company_name": f"C{i}", "pricing": "$1"} for i in range(3)]
+
+
+@pytest.fixture
+def app_test():
+    at = AppTest.from_file(str(APP_PATH), default_timeout=30)
+    at.session_state["model_provider"] = "openai"
+    at.session_state["search_engine"] = "perplexity"
+    at.session_state["firecrawl_api_key"] = "fk"
+    at.session_state["last_run"] = {"competitor_data": RECORDS, "metadata": {"run_id": "single-run"}}
+    at.session_state["last_portfolio"] = {
+        "targets": [("https://a.com", "")],
+        "company_data": {0: RECORDS},
+        "reports": {0: "# 报告"},
+        "stats": {"discovered": 3, "extracted": 3, "failed": 0},
+        "metadata": {0: {"run_id": "portfolio-run"}},
+    }
+    return at
+
+
+def _shows_single_run(at):
+    return any("single-run" in info.value for info in at.info)
+
+
+def _shows_portfolio(at):
+    return any(header.value == "🗂️ 组合分析结果" for header in at.subheader)
+
+
+def test_mode_switch_changes_main_view(app_test):
+    at = app_test.run()
+    assert not at.exception
+    assert _shows_single_run(at) and not _shows_portfolio(at)
+
+    at.toggle(key="portfolio_mode").set_value(True).run()
+    assert not at.exception
+    assert _shows_portfolio(at) and not _shows_single_run(at)
+    # 切换标记只触发一次整页重跑
+    assert "portfolio_mode_changed" not in at.session_state
+
+    at.toggle(key="portfolio_mode").set_value(False).run()
+    assert _shows_single_run(at) and not _shows_portfolio(at)
+
+
+def test_mode_toggle_requests_full_rerun(app, session_state):
+    app.mark_portfolio_mode_changed()
+    assert session_state["portfolio_mode_changed"] is True
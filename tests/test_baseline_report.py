@@ -0,0 +1,50 @@
+FULL_RECORD = {
+    "competitor_url": "https://a.com",
+    "company_name": "A",
+    "pricing": "$" + "9" * 300,
+    "key_features": ["f1", "f2", "f3", "f4"],
+    "tech_stack": [],
+    "marketing_focus": None,
+    "customer_feedback": "好评",
+}
+
+
+def test_empty_data(app):
+    assert app.render_baseline_report([]) == "没有竞争对手数据可供分析"
+
+
+def test_full_record_is_truncated_and_padded(app):
+    report = app.render_baseline_report([FULL_RECORD, {"competitor_url": "https://b.com"}])
+    assert report.startswith("\n# 竞争对手分析报告（基础版本）")
+    assert "成功分析了 2 个竞争对手的数据" in report
+    assert "### 1. A\n- **网站**: https://a.com" in report
+    assert f"- **定价策略**: ${'9' * (app.BASELINE_TEXT_LIMIT - 1)}...\n" in report
+    assert "- **关键功能**: f1, f2, f3\n" in report
+    assert "- **技术栈**: N/A\n" in report
+    assert "- **营销重点**: N/A...\n" in report
+    # 缺少名称时按序号命名
+    assert "### 2. 竞争对手 2\n- **网站**: https://b.com\n\n" in report
+    assert report.rstrip().endswith("*注：此为基础分析报告，建议配置AI模型以获得更深入的分析。*")
+
+
+def test_unextracted_fields_are_omitted(app):
+    record = {"competitor_url": "https://a.com", "company_name": "A", "pricing": "$10"}
+    report = app.render_baseline_report([record])
+    assert "- **定价策略**: $10..." in report
+    for label in ("关键功能", "技术栈", "营销重点"):
+        assert label not in report.split("## 基础分析建议")[0]
+
+
+def test_fallback_uses_backend_variant(app):
+    class ShortAnalyzer(app.AnalyzerBackend):
+        provider = "qwen"
+        display_name = "Stub"
+
+        def _stream(self, prompt, model):
+            yield "太短"
+
+    report = ShortAnalyzer("key", "qwen-max").analyze_competitors([FULL_RECORD])
+    assert report == app.render_baseline_report(
+        [FULL_RECORD], "Stub 备用版本", "此为备用分析报告，建议检查Stub API配置以获得更深入的分析。"
+    )
+    assert app.generate_fallback_analysis([FULL_RECORD]) == app.render_baseline_report([FULL_RECORD])
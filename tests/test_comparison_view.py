@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def test_as_text_list_handles_missing_and_array_values(app):
+    assert app._as_text_list(None) == []
+    assert app._as_text_list(float("nan")) == []
+    assert app._as_text_list(3) == []
+    assert app._as_text_list("") == []
+    assert app._as_text_list("python") == ["python"]
+    assert app._as_text_list(np.array(["a", "b"])) == ["a", "b"]
+    assert app._as_text_list(["a", None, 1]) == ["a", "1"]
+
+
+def test_as_text_treats_nan_as_missing(app):
+    assert app._as_text(float("nan")) is None
+    assert app._as_text(12) == "12"
+
+
+def test_normalize_frame_with_partial_records(app):
+    # 加载的 JSONL/Parquet 和部分字段画像的记录经常缺少列表字段
+    records = [
+        {"company_name": "Alpha", "competitor_url": "https://alpha.com", "key_features": ["sso", "api"]},
+        {"company_name": "Beta", "competitor_url": "https://beta.io"},
+        {"company_name": "Gamma", "tech_stack": np.array(["rust"])},
+    ]
+    table = app.normalize_competitor_frame(records)
+
+    assert list(table["关键功能"]) == ["sso, api", "N/A", "N/A"]
+    assert table.loc[2, "技术栈"] == "rust"
+    assert table.loc[1, "定价"] == "N/A"
+    assert "sso" in table.loc[0, "_search"]
@@ -0,0 +1,101 @@
+import pytest
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://acme.com", "https://www.acme.com/pricing"),
+    ("https://app.acme.co.uk", "acme.co.uk"),
+])
+def test_brand_key_matches_same_registered_domain(app, first, second):
+    assert app.competitor_brand_key(first) == app.competitor_brand_key(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://foo.github.io", "https://bar.github.io"),
+    ("https://x.vercel.app", "https://y.vercel.app"),
+    ("https://a.myshopify.com", "https://b.myshopify.com"),
+    ("https://medium.com/@acme", "https://medium.com/@globex"),
+    ("https://www.g2.com/products/acme", "https://www.g2.com/products/globex"),
+    ("https://acme.com", "https://acme.ai"),
+])
+def test_brand_key_keeps_unrelated_sites_apart(app, first, second):
+    assert app.competitor_brand_key(first) != app.competitor_brand_key(second)
+
+
+def test_brand_key_without_host(app):
+    assert app.competitor_brand_key("") is None
+    assert app.competitor_brand_key("not a url") is None
+
+
+def test_deduplicator_checks_brand(app):
+    deduplicator = app.CompetitorUrlDeduplicator()
+    urls = ["https://acme.com", "https://www.acme.com/about", "https://acme.ai",
+            "https://foo.github.io", "https://bar.github.io", "", ""]
+    assert [deduplicator.check_brand(url) for url in urls] == [
+        None, "https://acme.com", None, None, None, None, None
+    ]
+
+
+PAGE = "Acme analytics platform with dashboards, alerts and workflow automation for finance teams"
+
+
+def test_deduplicator_checks_fingerprint(app):
+    assert app.CompetitorUrlDeduplicator().check_fingerprint("https://acme.com", PAGE) is None
+
+    deduplicator = app.CompetitorUrlDeduplicator(use_fingerprints=True)
+    assert deduplicator.check_fingerprint("https://acme.com", PAGE) is None
+    assert deduplicator.check_fingerprint("https://acme.de", PAGE + "!") == "https://acme.com"
+    assert deduplicator.check_fingerprint("https://rust.dev", "Rust compiler toolchain for embedded firmware") is None
+    assert deduplicator.check_fingerprint("https://empty.com", "") is None
+
+
+def test_ranked_resolver_keeps_higher_ranked_duplicate(app):
+    resolver = app._RankedFingerprintResolver(app.CompetitorUrlDeduplicator(use_fingerprints=True))
+    # 排名靠后的重复页面先抓取完成：等到排名 0 到达后才按顺序判定
+    assert resolver.add(1, "https://acme.de", PAGE + "!") == []
+    assert resolver.add(0, "https://acme.com", PAGE) == [
+        (0, "https://acme.com", None),
+        (1, "https://acme.de", "https://acme.com"),
+    ]
+    assert resolver.add(2, "https://other.com", "Completely different gardening supplies shop") == [
+        (2, "https://other.com", None)
+    ]
+
+
+def test_minhash_lsh_finds_near_duplicates(app):
+    text = "Acme analytics platform with dashboards, alerts and workflow automation for finance teams"
+    index = app.MinHashLSHIndex()
+    index.add("acme", app.minhash_signature(text))
+    index.add("other", app.minhash_signature("Rust compiler toolchain for embedded firmware developers"))
+
+    assert index.query(app.minhash_signature(text + "!")) == ["acme"]
+    assert index.query(app.minhash_signature("Completely different gardening supplies shop")) == []
+
+
+def _record(url, name, marketing):
+    return {"competitor_url": url, "company_name": name, "key_features": ["dashboards", "alerts"],
+            "marketing_focus": marketing, "pricing": "N/A", "tech_stack": ["python"]}
+
+
+def test_merge_regional_sites_with_similar_content(app):
+    marketing = "All-in-one analytics for finance teams: dashboards, alerts and forecasting"
+    merged = app.merge_near_duplicate_records([
+        _record("https://acme.com", "Acme", marketing),
+        _record("https://acme.de", "Acme GmbH", marketing),
+    ])
+    assert len(merged) == 1
+    assert merged[0]["merged_urls"] == ["https://acme.de"]
+
+
+def test_merge_keeps_competitors_with_similar_copy_apart(app):
+    marketing = "All-in-one analytics for finance teams: dashboards, alerts and forecasting"
+    records = [
+        _record("https://acme.com", "Acme", marketing),
+        _record("https://globex.com", "Globex", marketing),
+        _record("https://foo.github.io", "Foo", marketing),
+    ]
+    assert len(app.merge_near_duplicate_records(records)) == 3
+
+
+def test_merge_same_company_name(app):
+    records = [_record("https://acme.com", "Acme", "x"), _record("https://acme-analytics.io", "acme", "y")]
+    assert len(app.merge_near_duplicate_records(records)) == 1
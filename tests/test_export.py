@@ -0,0 +1,67 @@
+import pytest
+
+RECORDS = [
+    {
+        "competitor_url": "https://alpha.com",
+        "company_name": "Alpha",
+        "pricing": "$10/mo",
+        "key_features": ["dashboards", "alerts"],
+        "tech_stack": ["python"],
+        "marketing_focus": "SMB",
+        "customer_feedback": "good",
+    },
+    {"competitor_url": "https://beta.io", "company_name": "Beta", "key_features": None},
+]
+
+
+@pytest.mark.parametrize("fmt, file_name", [
+    ("jsonl", "run.jsonl"),
+    ("parquet", "run.parquet"),
+    ("arrow", "run.arrow"),
+])
+def test_export_round_trip(app, fmt, file_name):
+    if fmt != "jsonl" and not app.PYARROW_AVAILABLE:
+        pytest.skip("pyarrow 未安装")
+    metadata = {"run_id": "r1", "model": "gpt-4o-mini", "stage_timings": {"total": 1.5}}
+    data = app.export_competitor_data(RECORDS, metadata, fmt)
+    loaded, loaded_metadata = app.load_run_data(file_name, data)
+
+    assert loaded_metadata == metadata
+    assert [record["company_name"] for record in loaded] == ["Alpha", "Beta"]
+    assert list(loaded[0]["key_features"]) == ["dashboards", "alerts"]
+    assert list(loaded[1]["key_features"]) == []
+    assert loaded[1]["pricing"] is None
+
+
+def test_run_metadata_uses_configured_model(app, session_state):
+    session_state.model_provider = "openai"
+    session_state.openai_model = "gpt-4o-mini"
+    metadata = app.build_run_metadata(RECORDS)
+    assert metadata["model"] == "gpt-4o-mini"
+
+    route = {"provider": "qwen", "model": "qwen-turbo"}
+    metadata = app.build_run_metadata(RECORDS, model_route=route)
+    assert (metadata["model_provider"], metadata["model"]) == ("qwen", "qwen-turbo")
+
+
+def test_run_ids_are_unique(app, session_state):
+    assert app.build_run_metadata(RECORDS)["run_id"] != app.build_run_metadata(RECORDS)["run_id"]
+
+
+def test_export_bytes_cached_per_run(app, session_state, monkeypatch):
+    calls = []
+    original = app.export_competitor_data
+
+    def counting_export(*args):
+        calls.append(args[2])
+        return original(*args)
+
+    monkeypatch.setattr(app, "export_competitor_data", counting_export)
+    metadata = {"run_id": "r1"}
+    first = app.get_export_bytes(RECORDS, metadata, "jsonl", "export")
+    assert app.get_export_bytes(RECORDS, metadata, "jsonl", "export") is first
+    assert calls == ["jsonl"]
+
+    # 同一导出区域的新运行替换旧的缓存
+    app.get_export_bytes(RECORDS, {"run_id": "r2"}, "jsonl", "export")
+    assert [key[1] for key in session_state.export_cache] == ["r2"]
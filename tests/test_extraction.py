@@ -0,0 +1,93 @@
+import pytest
+
+
+@pytest.fixture
+def fresh_cache(app, monkeypatch):
+    cache = app.ExtractionFieldCache()
+    monkeypatch.setattr(app, "_extraction_cache", cache)
+    return cache
+
+
+def test_record_only_contains_profile_fields(app):
+    record = app.build_competitor_record("https://acme.com", {"company_name": "Acme", "pricing": "", "tech_stack": ["go"]},
+                                         ("company_name", "pricing"))
+    assert record == {"competitor_url": "https://acme.com", "company_name": "Acme", "pricing": "N/A"}
+
+
+def test_record_with_nothing_extracted_is_none(app):
+    assert app.build_competitor_record("https://acme.com", {"tech_stack": ["go"]}, ("company_name", "pricing")) is None
+    assert app.build_competitor_record("https://acme.com", {}) is None
+
+
+def test_full_record_pads_missing_fields(app):
+    record = app.build_competitor_record("https://acme.com", {"company_name": "Acme"})
+    assert set(record) == {"competitor_url", *app.EXTRACTION_FIELDS}
+    assert record["key_features"] == ["N/A"]
+
+
+def test_cache_is_scoped_per_api_key(app, fresh_cache):
+    fresh_cache.put("https://acme.com/", "key-a", {"pricing": "$10"})
+    assert fresh_cache.get("https://ACME.com", "key-a") == {"pricing": "$10"}
+    assert fresh_cache.get("https://acme.com", "key-b") == {}
+
+
+def test_cached_fields_served_without_firecrawl(app, fresh_cache):
+    fresh_cache.put("https://acme.com", "key-a", {"company_name": "Acme", "pricing": "$10"})
+    record = app._extract_competitor_record("https://acme.com", "key-a", fields=("company_name", "pricing"))
+    assert record == {"competitor_url": "https://acme.com", "company_name": "Acme", "pricing": "$10"}
+
+
+def test_prompts_skip_fields_not_extracted(app):
+    data = [{"competitor_url": "https://acme.com", "company_name": "Acme", "pricing": "$10"}]
+    prompt = app.build_analysis_prompt(data)
+    assert "定价策略分析" in prompt
+    assert "技术栈对比" not in prompt
+    assert "产品功能对比" not in prompt
+    fragment = app.build_competitor_fragment_prompt(data[0])
+    assert "定价模式" in fragment and "技术栈特点" not in fragment
+    assert "技术栈对比" in app.build_report_merge_prompt([("Acme", "text")])
+
+
+def test_partial_records_skip_similarity_and_merge_padding(app):
+    data = [{"competitor_url": "https://acme.com", "company_name": "Acme", "pricing": "$10"},
+            {"competitor_url": "https://www.acme.com/pricing", "company_name": "Acme", "pricing": "$10/mo"}]
+    assert app.summarize_similarity_analytics(app.compute_similarity_analytics(data)) == ""
+    merged = app.merge_near_duplicate_records(data)
+    assert len(merged) == 1
+    assert "key_features" not in merged[0] and "tech_stack" not in merged[0]
+    assert merged[0]["pricing"] == "$10/mo"
+
+
+def test_baseline_report_skips_fields_not_extracted(app):
+    report = app.render_baseline_report([{"competitor_url": "https://acme.com", "company_name": "Acme", "pricing": "$10"}])
+    assert "**定价策略**: $10..." in report
+    assert "**技术栈**" not in report
+
+
+def test_cache_evicts_expired_fields(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, "time", lambda: now[0])
+    cache = app.ExtractionFieldCache(ttl=100)
+    cache.put("https://a.com", "k", {"pricing": "$1"})
+    now[0] += 50
+    cache.put("https://a.com", "k", {"company_name": "A"})
+    cache.put("https://b.com", "k", {"pricing": "$2"})
+
+    now[0] += 60
+    assert cache.get("https://a.com", "k") == {"company_name": "A"}
+    assert len(cache._entries) == 2
+
+    # 写入时定期清理其他 URL 的过期条目
+    now[0] += app.EXTRACTION_CACHE_SWEEP_INTERVAL
+    cache.put("https://c.com", "k", {"pricing": "$3"})
+    assert list(cache._entries) == [cache._key("https://c.com", "k")]
+
+
+def test_cache_caps_entries(app):
+    cache = app.ExtractionFieldCache(max_entries=2)
+    for name in ("a", "b", "c"):
+        cache.put(f"https://{name}.com", "k", {"pricing": name})
+    cache.put("https://b.com", "k", {"company_name": "B"})
+    cache.put("https://d.com", "k", {"pricing": "d"})
+    assert cache.get("https://a.com", "k") == {} and cache.get("https://c.com", "k") == {}
+    assert cache.get("https://b.com", "k") == {"pricing": "b", "company_name": "B"}
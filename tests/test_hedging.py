@@ -0,0 +1,148 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def stub_backend(app):
+    class StubBackend(app.AnalyzerBackend):
+        provider = "openai_compatible"
+
+        def __init__(self, name, chunks=("输出",), error=None, stall=False):
+            super().__init__(f"{name}-key", f"{name}-model")
+            self.display_name = name
+            self.chunks = chunks
+            self.error = error
+            self.stall = stall
+            self.calls = 0
+            self.aborted = threading.Event()
+
+        def _stream(self, prompt, model):
+            self.calls += 1
+            if self.stall:
+                # 模拟停滞的请求：只有取消回调能让它提前结束
+                with app.on_call_cancelled(self.aborted.set):
+                    self.aborted.wait(timeout=5)
+                return
+            if self.error:
+                raise self.error
+            yield from self.chunks
+
+    return StubBackend
+
+
+def test_primary_wins_without_starting_hedge(app, stub_backend):
+    primary, secondary = stub_backend("主"), stub_backend("备")
+    text, route = app.HedgedAnalyzer([primary, secondary], hedge_delay=5).complete_with_route("提示")
+    assert text == "输出"
+    assert route["model"] == "主-model" and "hedge" not in route
+    assert secondary.calls == 0
+
+
+def test_stalled_primary_is_hedged_and_aborted(app, stub_backend):
+    primary, secondary = stub_backend("主", stall=True), stub_backend("备", chunks=("备用", "输出"))
+    started = time.monotonic()
+    text, route = app.HedgedAnalyzer([primary, secondary], hedge_delay=0.05).complete_with_route("提示")
+    assert text == "备用输出"
+    assert route["model"] == "备-model"
+    assert route["hedge"] == "主 超过 0.05s 未开始输出"
+    # 备用胜出时立即取消停滞的主调用，而不是等到它的下一个片段
+    assert primary.aborted.wait(timeout=1)
+    assert time.monotonic() - started < 1
+
+
+def test_error_fails_over_immediately(app, stub_backend):
+    primary, secondary = stub_backend("主", error=RuntimeError("503")), stub_backend("备")
+    text, route = app.HedgedAnalyzer([primary, secondary], hedge_delay=5).complete_with_route("提示")
+    assert text == "输出"
+    assert route["hedge"] == "主 出错，已故障转移"
+
+
+def test_empty_response_fails_over(app, stub_backend):
+    primary, secondary = stub_backend("主", chunks=()), stub_backend("备")
+    text, route = app.HedgedAnalyzer([primary, secondary], hedge_delay=5).complete_with_route("提示")
+    assert text == "输出"
+    assert route["model"] == "备-model"
+
+
+def test_all_backends_failing_raises(app, stub_backend):
+    backends = [stub_backend("主", error=RuntimeError("503")), stub_backend("备", chunks=())]
+    with pytest.raises(RuntimeError) as excinfo:
+        app.HedgedAnalyzer(backends, hedge_delay=5).complete_with_route("提示")
+    assert "所有提供方均调用失败" in str(excinfo.value)
+    assert "主: 503" in str(excinfo.value) and "备: 响应为空" in str(excinfo.value)
+
+
+def test_stream_applies_winner_finalize(app, stub_backend):
+    class Finalizing(stub_backend):
+        def _finalize(self, content):
+            return content.upper()
+
+    primary, secondary = stub_backend("主", error=RuntimeError("503")), Finalizing("备", chunks=("a", "b"))
+    analyzer = app.HedgedAnalyzer([primary, secondary], hedge_delay=5)
+    assert list(analyzer.stream("提示")) == ["AB"]
+    assert analyzer.complete("提示") == "AB"
+    # 未覆盖 _finalize 的后端保持逐片段输出
+    assert list(app.HedgedAnalyzer([stub_backend("主", chunks=("a", "b"))]).stream("提示")) == ["a", "b"]
+
+
+class _StalledHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(b": connected\n\n")
+        self.wfile.flush()
+        self.server.release.wait(timeout=10)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_losing_http_backend_releases_scheduler_slot(app, monkeypatch, stub_backend):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StalledHandler)
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheduler = app.ProviderScheduler({"openai_compatible": (1, 6000)})
+    monkeypatch.setattr(app, "_scheduler", scheduler)
+    try:
+        primary = app.OpenAICompatibleAnalyzer(f"http://127.0.0.1:{server.server_address[1]}/v1", "local")
+        analyzer = app.HedgedAnalyzer([primary, stub_backend("备")], hedge_delay=0.2)
+        assert analyzer.complete("提示") == "输出"
+
+        # 停滞的 HTTP 响应被中止，调度许可随即释放
+        deadline = time.monotonic() + 2
+        while any(resource["active"] for resource in scheduler.resources.values()) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert not any(resource["active"] for resource in scheduler.resources.values())
+    finally:
+        server.release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def test_hedge_backend_uses_its_own_credentials(app, session_state):
+    session_state.update(
+        model_provider="openai_compatible", local_base_url="http://primary/v1", local_model="m", local_api_key="local",
+        openai_api_key="shared-openai", hedging_enabled=True, hedge_provider="openai",
+        hedge_openai_api_key="hedge-openai",
+    )
+    primary, hedge = app.create_analyzer().backends
+    assert (primary.base_url, primary.api_key) == ("http://primary/v1", "local")
+    assert hedge.api_key == "hedge-openai"
+    assert session_state["openai_api_key"] == "shared-openai"
+
+    # 未填写备用密钥时使用已配置的密钥
+    session_state["hedge_openai_api_key"] = ""
+    assert app.create_analyzer().backends[1].api_key == "shared-openai"
+
+    session_state.update(
+        model_provider="openai", hedge_provider="openai_compatible",
+        hedge_local_base_url="http://hedge/v1", hedge_local_model="hm",
+    )
+    primary, hedge = app.create_analyzer().backends
+    assert primary.api_key == "shared-openai"
+    assert (hedge.base_url, hedge.model, hedge.api_key) == ("http://hedge/v1", "hm", "local")
@@ -0,0 +1,156 @@
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def stub_analyzer(app):
+    class StubAnalyzer(app.AnalyzerBackend):
+        provider = "qwen"
+        display_name = "Stub"
+        
+        def __init__(self):
+            super().__init__("key", "qwen-max", routing_policy="balanced")
+            self.prompts = []
+        
+        def _stream(self, prompt, model):
+            self.prompts.append(prompt)
+            time.sleep(0.01)
+            yield f"{model} 输出 " + "内容" * 60
+    
+    return StubAnalyzer()
+
+
+def _records(count):
+    return [{"competitor_url": f"https://c{i}.com", "company_name": f"C{i}", "pricing": f"${i}"} for i in range(count)]
+
+
+def test_merge_route_is_returned_explicitly(app, stub_analyzer, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path))
+    report, route, stats = app.generate_incremental_report(stub_analyzer, _records(4), None, cache=cache)
+    assert route["stage"] == "final"
+    assert report.startswith(route["model"])
+    assert stats == {"reused": 0, "computed": 4, "failed": 0, "merge_cached": False}
+    
+    # 全部命中缓存时不调用 LLM，路由取自缓存条目
+    calls = len(stub_analyzer.prompts)
+    report_again, cached_route, stats = app.generate_incremental_report(stub_analyzer, _records(4), None, cache=cache)
+    assert len(stub_analyzer.prompts) == calls
+    assert (report_again, cached_route) == (report, route)
+    assert stats["merge_cached"]
+
+
+def test_only_changed_competitors_recomputed(app, stub_analyzer, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path))
+    app.generate_incremental_report(stub_analyzer, _records(3), None, cache=cache)
+    changed = _records(3)
+    changed[1]["pricing"] = "$99"
+    _, _, stats = app.generate_incremental_report(stub_analyzer, changed, None, cache=cache)
+    assert stats == {"reused": 2, "computed": 1, "failed": 0, "merge_cached": False}
+
+
+def test_cache_prune_limits_entries_and_age(app, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path), max_entries=3, max_age=3600)
+    now = time.time()
+    for i in range(5):
+        cache.put(f"key{i}", f"text{i}")
+        os.utime(tmp_path / f"key{i}.json", (now - 100 + i, now - 100 + i))
+    os.utime(tmp_path / "key4.json", (now - 7200, now - 7200))
+    assert cache.get("key0") == "text0"  # 读取刷新最近使用时间
+    
+    assert cache.prune() == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["key0.json", "key2.json", "key3.json"]
+    
+    # 文件数未超限时只删除超过保留时间的文件
+    os.utime(tmp_path / "key2.json", (now - 7200, now - 7200))
+    assert cache.prune() == 1
+    assert not (tmp_path / "key2.json").exists()
+
+
+def test_cache_is_scoped_by_api_key(app, stub_analyzer, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path))
+    app.generate_incremental_report(stub_analyzer, _records(2), None, cache=cache)
+    stub_analyzer.api_key = "other-key"
+    _, _, stats = app.generate_incremental_report(stub_analyzer, _records(2), None, cache=cache)
+    assert stats == {"reused": 0, "computed": 2, "failed": 0, "merge_cached": False}
+
+
+@pytest.fixture
+def flaky_analyzer(app, stub_analyzer):
+    class FlakyAnalyzer(type(stub_analyzer)):
+        def __init__(self):
+            super().__init__()
+            self.failing = {"C1"}
+            self.merge_output = None
+
+        def _stream(self, prompt, model):
+            self.prompts.append(prompt)
+            if "单个竞争对手" in prompt and any(f'"company_name": "{name}"' in prompt for name in self.failing):
+                raise RuntimeError("503")
+            if "单个竞争对手" not in prompt and self.merge_output is not None:
+                yield self.merge_output
+                return
+            yield f"{model} 输出 " + "内容" * 60
+
+    return FlakyAnalyzer()
+
+
+def test_failed_fragment_does_not_abort_report(app, flaky_analyzer, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path))
+    report, route, stats = app.generate_incremental_report(flaky_analyzer, _records(3), None, cache=cache)
+    assert route is not None and report.startswith(route["model"])
+    assert stats == {"reused": 0, "computed": 2, "failed": 1, "merge_cached": False}
+    # 失败的竞争对手在合并提示中使用原始数据
+    assert '"pricing": "$1"' in flaky_analyzer.prompts[-1]
+
+    # 成功的片段已缓存，重试只重新分析失败的一个，且不复用降级的合并结果
+    flaky_analyzer.failing.clear()
+    _, _, stats = app.generate_incremental_report(flaky_analyzer, _records(3), None, cache=cache)
+    assert stats == {"reused": 2, "computed": 1, "failed": 0, "merge_cached": False}
+
+
+def test_short_merge_output_falls_back(app, flaky_analyzer, tmp_path):
+    flaky_analyzer.failing.clear()
+    flaky_analyzer.merge_output = "太短"
+    cache = app.ReportFragmentCache(str(tmp_path))
+    report, _, _ = app.generate_incremental_report(flaky_analyzer, _records(2), None, cache=cache)
+    assert report == flaky_analyzer._generate_fallback_analysis(_records(2))
+
+    _, _, stats = app.generate_incremental_report(flaky_analyzer, _records(2), None, cache=cache)
+    assert not stats["merge_cached"]
+
+
+def test_builder_starts_fragments_as_records_arrive(app, stub_analyzer, tmp_path):
+    cache = app.ReportFragmentCache(str(tmp_path))
+    builder = app.IncrementalReportBuilder(stub_analyzer, cache)
+    records = _records(3)
+    for record in records:
+        builder.submit(record)
+    # 合并前片段已在后台完成
+    deadline = time.monotonic() + 5
+    while len(stub_analyzer.prompts) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stub_analyzer.prompts) == 3
+    assert all("单个竞争对手" in prompt for prompt in stub_analyzer.prompts)
+
+    # 后续被合并掉的记录不计入统计，finish 只新增合并调用
+    report, route, stats = builder.finish(records[:2], None)
+    assert stats == {"reused": 0, "computed": 2, "failed": 0, "merge_cached": False}
+    assert len(stub_analyzer.prompts) == 4
+    assert route["stage"] == "final"
+
+    # 提前完成的片段都已写入缓存
+    _, _, stats = app.generate_incremental_report(stub_analyzer, records, None, cache=cache)
+    assert stats == {"reused": 3, "computed": 0, "failed": 0, "merge_cached": False}
+
+
+def test_analysis_report_uses_streaming_builder(app, stub_analyzer, tmp_path):
+    builder = app.IncrementalReportBuilder(stub_analyzer, app.ReportFragmentCache(str(tmp_path)))
+    records = _records(2)
+    for record in records:
+        builder.submit(record)
+    (report, route, stats), shared = app.generate_analysis_report(stub_analyzer, records, "摘要-流式", True, builder)
+    assert not shared
+    assert stats["computed"] == 2
+    assert len(stub_analyzer.prompts) == 3
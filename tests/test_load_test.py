@@ -0,0 +1,79 @@
+import importlib.util
+import json
+import pathlib
+import urllib.request
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="module")
+def load_test():
+    spec = importlib.util.spec_from_file_location("load_test", ROOT / "load_test.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_page_labels_match_app(load_test):
+    # 压测按页面文字定位控件和结果，应用改动文案时需同步修改
+    source = (ROOT / "competitor_agent_team_combined - 1.py").read_text(encoding="utf-8")
+    for label in (load_test.ANALYZE_BUTTON_LABEL, load_test.INPUT_URL_LABEL, load_test.STAGE_TIMINGS_PREFIX):
+        assert f'"{label}' in source
+
+
+def test_parse_stage_timings(load_test):
+    texts = ["其他说明", "阶段耗时：discovery 0.05s · extraction 1.20s · analysis 3s · total 4.25s"]
+    assert load_test.parse_stage_timings(texts) == {
+        "discovery": 0.05, "extraction": 1.2, "analysis": 3.0, "total": 4.25
+    }
+    assert load_test.parse_stage_timings(["分析完成！"]) == {}
+
+
+def test_percentile(load_test):
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert load_test.percentile(values, 50) == 3.0
+    assert load_test.percentile(values, 99) == 5.0
+    assert load_test.percentile([7.0], 95) == 7.0
+    assert load_test.percentile([], 50) is None
+
+
+def _level(sessions, p95, throughput, errors=()):
+    return {"sessions": sessions, "errors": list(errors), "throughput_per_min": throughput,
+            "latency": {"client_total": {"p95": p95}}}
+
+
+def test_find_saturation(load_test):
+    scaling = [_level(1, 2.0, 30), _level(2, 2.1, 57), _level(4, 2.3, 104)]
+    assert load_test.find_saturation(scaling, min_gain=0.1, latency_factor=3) is None
+    assert load_test.find_saturation(scaling + [_level(8, 2.4, 108)], 0.1, 3) == 8
+    assert load_test.find_saturation(scaling + [_level(8, 7.0, 200)], 0.1, 3) == 8
+    assert load_test.find_saturation(scaling + [_level(8, 2.4, 200, ["超时"])], 0.1, 3) == 8
+
+
+def test_fake_providers(load_test):
+    config = {"competitors": 3, "search_latency": 0, "extract_latency": 0, "llm_latency": 0, "report_lines": 2}
+    server = load_test.start_fake_providers(config)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def request(path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        with urllib.request.urlopen(urllib.request.Request(base + path, data=data), timeout=10) as response:
+            return response.read().decode()
+
+    try:
+        search = request("/perplexity/chat/completions", {"messages": [{"content": "acme"}], "stream": True})
+        urls = [
+            json.loads(line[len("data: "):])["choices"][0]["delta"]["content"].strip()
+            for line in search.splitlines() if line.startswith("data: {")
+        ]
+        assert len(urls) == 3 and all(url.startswith("https://rival") for url in urls)
+        assert search.rstrip().endswith("data: [DONE]")
+
+        job = json.loads(request("/firecrawl/v1/extract", {"urls": [urls[0] + "/*"]}))
+        extracted = json.loads(request(f"/firecrawl/v1/extract/{job['id']}"))
+        assert extracted["data"] == load_test._fake_competitor(urls[0])
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,80 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    chunks = ["竞争", "分析", "报告"]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, self.headers.get("Authorization"), body))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        events = [{"choices": [{"delta": {"role": "assistant"}}]}]
+        events += [{"choices": [{"delta": {"content": chunk}}]} for chunk in self.chunks]
+        for event in events:
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b": keep-alive\n\ndata: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sse_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_streams_sse_chunks(app, sse_server):
+    analyzer = app.OpenAICompatibleAnalyzer(_base_url(sse_server) + "/", "local-model", api_key="secret")
+    assert list(analyzer.stream("提示")) == _SSEHandler.chunks
+    assert analyzer.last_route["model"] == "local-model"
+
+    path, authorization, body = sse_server.requests[0]
+    assert path == "/v1/chat/completions"
+    assert authorization == "Bearer secret"
+    assert body["model"] == "local-model" and body["stream"] is True
+    assert body["messages"][-1] == {"role": "user", "content": "提示"}
+
+
+def test_no_authorization_header_without_key(app, sse_server):
+    analyzer = app.OpenAICompatibleAnalyzer(_base_url(sse_server), "local-model")
+    assert analyzer.complete("提示") == "".join(_SSEHandler.chunks)
+    assert sse_server.requests[0][1] is None
+
+
+def test_scheduler_quota_is_keyed_on_base_url_and_key(app, monkeypatch, sse_server):
+    scheduler = app.ProviderScheduler({"openai_compatible": (1, 6000)})
+    monkeypatch.setattr(app, "_scheduler", scheduler)
+    base_url = _base_url(sse_server)
+    for analyzer in (
+        app.OpenAICompatibleAnalyzer(base_url, "m", api_key="shared"),
+        app.OpenAICompatibleAnalyzer(base_url.replace("127.0.0.1", "localhost"), "m", api_key="shared"),
+        app.OpenAICompatibleAnalyzer(base_url, "m"),
+    ):
+        analyzer.complete("提示")
+    # 同一密钥用于两个服务地址、以及无密钥的服务，各自拥有独立配额
+    assert len(scheduler.resources) == 3
+
+
+def test_backend_requires_stream_implementation(app):
+    class Incomplete(app.AnalyzerBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("key", "model")
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def fake_sources(app, monkeypatch):
+    """替换发现、页面指纹和提取，返回可配置的假数据"""
+    sources = {'urls': [], 'fingerprints': {}, 'delays': {}, 'failures': set()}
+    
+    def fake_urls(url, description, search_engine, api_key, num_results=10, job=None):
+        yield from sources['urls']
+    
+    def fake_fingerprint(competitor_url, *args, **kwargs):
+        time.sleep(sources['delays'].get(competitor_url, 0))
+        return sources['fingerprints'].get(competitor_url, "")
+    
+    def fake_extract(competitor_url, api_key, job=None, fields=None, use_cache=True):
+        time.sleep(sources['delays'].get(competitor_url, 0))
+        if competitor_url in sources['failures']:
+            return None
+        return {'competitor_url': competitor_url, 'company_name': competitor_url.split('//')[1].split('.')[0]}
+    
+    monkeypatch.setattr(app, "iter_competitor_urls", fake_urls)
+    monkeypatch.setattr(app, "fetch_page_fingerprint", fake_fingerprint)
+    monkeypatch.setattr(app, "extract_competitor_record", fake_extract)
+    return sources
+
+
+def _run(app, deduplicator=None, **kwargs):
+    return list(app.run_competitor_pipeline("https://me.com", "", "perplexity", "k", "f", deduplicator, **kwargs))
+
+
+def test_fingerprint_duplicates_keep_earlier_rank(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://acme-mirror.net", "https://globex.com"]
+    fake_sources['fingerprints'] = {
+        "https://acme.com": "Acme team chat for modern companies",
+        "https://acme-mirror.net": "Acme team chat for modern companies",
+        "https://globex.com": "Globex payroll and benefits",
+    }
+    # 排名靠前的 URL 指纹返回更慢，重复判定仍应保留它
+    fake_sources['delays'] = {"https://acme.com": 0.2}
+    events = _run(app, app.CompetitorUrlDeduplicator(use_fingerprints=True))
+    
+    assert ("duplicate", ("https://acme-mirror.net", "https://acme.com")) in events
+    extracted = sorted(payload[1] for event, payload in events if event == "record")
+    assert extracted == ["https://acme.com", "https://globex.com"]
+    accepted = [payload[1] for event, payload in events if event == "url"]
+    assert sorted(accepted) == extracted
+
+
+def test_brand_duplicates_are_not_extracted(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://www.acme.com/pricing", "https://globex.com"]
+    events = _run(app, app.CompetitorUrlDeduplicator())
+    assert [payload for event, payload in events if event == "duplicate"] == [
+        ("https://www.acme.com/pricing", "https://acme.com")
+    ]
+    assert [payload for event, payload in events if event == "url"] == [(0, "https://acme.com"), (1, "https://globex.com")]
+    assert ("discovery_done", 2) in events
+
+
+def test_failed_extractions_reported(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://globex.com"]
+    fake_sources['failures'] = {"https://globex.com"}
+    records = {payload[1]: payload[2] for event, payload in _run(app) if event == "record"}
+    assert records["https://globex.com"] is None
+    assert records["https://acme.com"]['company_name'] == "acme"
+
+
+def test_portfolio_fingerprint_aliases_follow_queue_order(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://acme-mirror.net"]
+    fake_sources['fingerprints'] = {
+        "https://acme.com": "Acme team chat for modern companies",
+        "https://acme-mirror.net": "Acme team chat for modern companies",
+    }
+    fake_sources['delays'] = {"https://acme.com": 0.2}
+    events = list(app.run_portfolio_pipeline(
+        [("https://me.com", "")], "perplexity", "k", "f", app.CompetitorUrlDeduplicator(use_fingerprints=True)
+    ))
+    assert ("alias", ("https://acme-mirror.net", "https://acme.com")) in events
+    assert [payload[0] for event, payload in events if event == "record"] == ["https://acme.com"]
+
+
+def _target_cutoff(events):
+    return next(payload[1] for event, payload in events if event == "target_reached")
+
+
+def test_target_counts_distinct_records_after_merge(app, fake_sources):
+    # acme.com 与 acme.de 品牌键不同，但提取后按公司名合并，只算一个竞争对手
+    fake_sources['urls'] = ["https://acme.com", "https://acme.de", "https://globex.com", "https://initech.com"]
+    events = _run(app, app.CompetitorUrlDeduplicator(), target_count=2, max_workers=1)
+    cutoff = _target_cutoff(events)
+    kept = [payload[2] for event, payload in events if event == "record" and payload[0] < cutoff]
+    assert cutoff == 3
+    assert len(app.merge_near_duplicate_records(kept)) == 2
+
+
+def test_target_prefers_earlier_ranks(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://globex.com", "https://initech.com"]
+    fake_sources['delays'] = {"https://acme.com": 0.2}
+    events = _run(app, target_count=1, max_workers=3)
+    assert _target_cutoff(events) == 1
+    assert ("record", (0, "https://acme.com",
+                       {'competitor_url': "https://acme.com", 'company_name': "acme"}, None)) in events
+
+
+def test_target_skips_failures(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://globex.com", "https://initech.com"]
+    fake_sources['failures'] = {"https://acme.com"}
+    events = _run(app, target_count=2, max_workers=1)
+    assert _target_cutoff(events) == 3
+
+
+def test_target_not_reached_runs_to_completion(app, fake_sources):
+    fake_sources['urls'] = ["https://acme.com", "https://globex.com"]
+    events = _run(app, target_count=5)
+    assert not any(event == "target_reached" for event, _ in events)
+    assert sum(event == "record" for event, _ in events) == 2
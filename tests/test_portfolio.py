@@ -0,0 +1,101 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+
+def test_parse_portfolio_targets(app):
+    text = "\n  example.com  \n\nhttps://www.foo.io/path\n一家做在线协作文档的 SaaS 公司\n"
+    assert app.parse_portfolio_targets(text) == [
+        ("https://example.com", ""),
+        ("https://www.foo.io/path", ""),
+        ("", "一家做在线协作文档的 SaaS 公司"),
+    ]
+    assert app.parse_portfolio_targets("") == []
+    assert app.parse_portfolio_targets(None) == []
+
+    many = "\n".join(f"c{i}.com" for i in range(app.PORTFOLIO_MAX_TARGETS + 5))
+    assert len(app.parse_portfolio_targets(many)) == app.PORTFOLIO_MAX_TARGETS
+
+
+def test_normalize_competitor_url(app):
+    assert app.normalize_competitor_url("https://WWW.Example.com/Pricing/?ref=x") == "https://example.com/Pricing"
+    assert app.normalize_competitor_url("example.com/") == "https://example.com"
+    assert app.normalize_competitor_url("http://example.com") == app.normalize_competitor_url("https://example.com/")
+
+
+def test_fan_out_keeps_discovery_order_and_resolves_aliases(app):
+    records = {"a": {"competitor_url": "a"}, "b": {"competitor_url": "b"}}
+    assignments = {0: ["b", "a", "missing"], 1: ["a", "a2"]}
+    company_data = app.fan_out_portfolio_records(assignments, records, aliases={"a2": "a"})
+    assert company_data == {0: [records["b"], records["a"]], 1: [records["a"]]}
+
+
+@pytest.fixture
+def blocking_analyzer(app):
+    class BlockingAnalyzer(app.AnalyzerBackend):
+        provider = "qwen"
+        display_name = "Stub"
+
+        def __init__(self, barrier):
+            super().__init__("key", "qwen-max", routing_policy="balanced")
+            self.barrier = barrier
+
+        def _stream(self, prompt, model):
+            # 所有报告都在等待时才放行：串行生成会在此超时
+            self.barrier.wait(timeout=5)
+            yield f"{model} 报告 " + "内容" * 60
+
+    return BlockingAnalyzer
+
+
+@pytest.fixture
+def portfolio_run(app, session_state, monkeypatch):
+    """用假的共享队列运行组合分析：pricing_sizes[i] 为第 i 家公司竞争对手定价文本的长度"""
+    def run(analyzer, pricing_sizes):
+        def fake_pipeline(targets, *args, **kwargs):
+            for index, size in enumerate(pricing_sizes):
+                for i in range(2):
+                    key = f"https://c{index}-{i}.com"
+                    yield "url", (index, key, True)
+                    yield "record", (key, {"competitor_url": key, "company_name": key, "pricing": "价" * size}, None)
+                yield "discovery_done", index
+
+        monkeypatch.setattr(app, "run_portfolio_pipeline", fake_pipeline)
+        monkeypatch.setattr(app, "create_analyzer", lambda job=None: analyzer)
+        # 裸模式下 st.status / st.progress 返回 None，替换为可调用 update/progress 的占位对象
+        monkeypatch.setattr(app.st, "status", mock.MagicMock())
+        monkeypatch.setattr(app.st, "progress", mock.MagicMock())
+        session_state.update(search_engine="perplexity", perplexity_api_key="x", firecrawl_api_key="x")
+        return app.run_portfolio_analysis([(f"https://t{index}.com", "") for index in range(len(pricing_sizes))])
+
+    return run
+
+
+def test_portfolio_reports_run_concurrently(app, session_state, blocking_analyzer, portfolio_run):
+    targets = [1, 1, 1]
+    analyzer = blocking_analyzer(threading.Barrier(len(targets)))
+
+    started = time.monotonic()
+    assert portfolio_run(analyzer, targets)
+    assert time.monotonic() - started < 5
+
+    portfolio = session_state["last_portfolio"]
+    for index in range(len(targets)):
+        route = portfolio["metadata"][index]["model_route"]
+        assert portfolio["reports"][index].startswith(route["model"])
+    # 每家公司的元数据只生成一次，重新渲染时复用同一 run_id
+    run_ids = {metadata["run_id"] for metadata in portfolio["metadata"].values()}
+    assert len(run_ids) == len(targets)
+
+
+def test_each_company_records_its_own_route(app, session_state, blocking_analyzer, portfolio_run):
+    # 短输入路由到 qwen-plus，长输入路由到 qwen-max；两次调用同时进行，共用的 last_route 会被另一家覆盖
+    assert portfolio_run(blocking_analyzer(threading.Barrier(2)), [1, app.ROUTING_SHORT_PROMPT_TOKENS])
+
+    portfolio = session_state["last_portfolio"]
+    models = [portfolio["metadata"][index]["model_route"]["model"] for index in range(2)]
+    assert models == ["qwen-plus", "qwen-max"]
+    for index, model in enumerate(models):
+        assert portfolio["reports"][index].startswith(model)
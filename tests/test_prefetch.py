@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def blocked_discovery(app, monkeypatch):
+    """发现请求阻塞到测试放行，用于模拟进行中的预取"""
+    release = threading.Event()
+
+    def fake_iter(url, description, search_engine, search_api_key, num_results, job=None):
+        yield "https://a.com"
+        release.wait(timeout=5)
+        yield "https://b.com"
+
+    monkeypatch.setattr(app, "iter_competitor_urls", fake_iter)
+    yield release
+    release.set()
+
+
+FIELDS = ("company_name", "pricing")
+
+
+def _take(app, num_results=10, job=None, search_api_key="pk", fields=FIELDS):
+    return app.take_discovery_prefetch("https://acme.com", "", "perplexity", search_api_key, num_results, fields, job)
+
+
+def _start_prefetch(app, session_state, url="https://acme.com"):
+    key = app.discovery_prefetch_key(url, "", "perplexity", "pk", 10, FIELDS)
+    job = app.SchedulerJob("s", app.JOB_PRIORITY_WEIGHTS["batch"])
+    prefetch = app.DiscoveryPrefetch(key, url, "", "perplexity", "pk", 10, job=job).start()
+    session_state["discovery_prefetch"] = prefetch
+    return prefetch
+
+
+def test_is_prefetchable_input(app):
+    assert app.is_prefetchable_input("https://acme.com", "")
+    assert not app.is_prefetchable_input("acme", "")
+    assert not app.is_prefetchable_input("", "太短")
+    assert app.is_prefetchable_input("", "一家做在线协作文档的 SaaS 公司")
+
+
+def test_joining_in_flight_prefetch_raises_its_priority(app, session_state, blocked_discovery):
+    prefetch = _start_prefetch(app, session_state)
+    analysis_job = app.SchedulerJob("s", app.JOB_PRIORITY_WEIGHTS["interactive"])
+
+    assert _take(app, job=analysis_job) is None
+    assert prefetch.consumed
+    assert prefetch.job.weight == app.JOB_PRIORITY_WEIGHTS["interactive"]
+    # 已被使用的预取不会再次交出
+    assert _take(app, job=analysis_job) is None
+
+
+def test_batch_analysis_keeps_batch_priority(app, session_state, blocked_discovery):
+    prefetch = _start_prefetch(app, session_state)
+    _take(app, job=app.SchedulerJob("s", 1.0))
+    assert prefetch.job.weight == app.JOB_PRIORITY_WEIGHTS["batch"]
+
+
+def test_finished_prefetch_returns_urls(app, session_state, blocked_discovery):
+    prefetch = _start_prefetch(app, session_state)
+    assert app.describe_discovery_prefetch(prefetch).startswith("⚡ 正在后台预取")
+    blocked_discovery.set()
+    prefetch.thread.join(timeout=5)
+
+    assert app.describe_discovery_prefetch(prefetch) == "⚡ 已预取 2 个竞争对手 URL，点击分析时直接使用"
+    assert _take(app) == ["https://a.com", "https://b.com"]
+
+
+@pytest.mark.parametrize("changed", [
+    {"num_results": 20},
+    {"search_api_key": "other-key"},
+    {"fields": ("company_name", "tech_stack")},
+])
+def test_mismatched_parameters_discard_prefetch(app, session_state, blocked_discovery, changed):
+    prefetch = _start_prefetch(app, session_state)
+    assert _take(app, **changed) is None
+    assert prefetch.cancelled.is_set()
+    assert "discovery_prefetch" not in session_state
@@ -0,0 +1,42 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _busy_unrelated_work(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def _busy_run_work():
+    time.sleep(0.2)
+
+
+def test_profiler_only_samples_threads_of_its_job(app):
+    job = app.SchedulerJob("session")
+    stop = threading.Event()
+    # 其他会话的线程：在采样开始后启动，但不属于本次运行
+    profiler = app.SamplingProfiler(job, interval=0.005)
+    profiler.start()
+    other = threading.Thread(target=_busy_unrelated_work, args=(stop,), name="other-session")
+    other.start()
+    with ThreadPoolExecutor(max_workers=2, initializer=app.track_job_thread, initargs=(job,)) as executor:
+        list(executor.map(lambda _: _busy_run_work(), range(2)))
+    profiler.stop()
+    stop.set()
+    other.join()
+    
+    sampled_functions = {frame[0] for key in profiler.thread_samples for frame in key[1:]}
+    assert "_busy_run_work" in sampled_functions
+    assert "_busy_unrelated_work" not in sampled_functions
+    
+    summary = profiler.summary()
+    # 两个工作线程并发运行，线程时间之和超过墙钟时间
+    assert summary["thread_time"] > summary["wall_time"]
+    assert list(profiler.top_functions().columns) == ["函数", "线程时间(s)", "CPU 时间(s)"]
+
+
+def test_default_job_does_not_collect_threads(app):
+    app.track_job_thread(app.DEFAULT_SCHEDULER_JOB)
+    app.track_job_thread(None)
+    assert not app.DEFAULT_SCHEDULER_JOB.thread_idents
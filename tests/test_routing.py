@@ -0,0 +1,48 @@
+import pytest
+
+
+def test_estimate_tokens(app):
+    assert app.estimate_tokens("") == 0
+    assert app.estimate_tokens("abcdefgh") == 2
+    assert app.estimate_tokens("竞争对手") == 4
+
+
+def test_fixed_policy_keeps_configured_model(app):
+    route = app.route_model("openai", "short prompt", policy="fixed", fixed_model="gpt-4o")
+    assert route["model"] == "gpt-4o"
+    assert route["provider"] == "openai"
+
+
+def test_fixed_policy_falls_back_when_context_too_small(app):
+    prompt = "x" * 4 * 40000  # 约 40k tokens，超出 qwen-max 的 32k 上下文
+    route = app.route_model("qwen", prompt, policy="fixed", fixed_model="qwen-max")
+    assert route["model"] == "qwen-plus"
+    assert "上下文不足" in route["reason"]
+
+
+@pytest.mark.parametrize("policy, stage, expected", [
+    ("latency", "intermediate", "qwen-turbo"),
+    ("latency", "final", "qwen-turbo"),
+    ("balanced", "intermediate", "qwen-turbo"),
+    ("balanced", "final", "qwen-plus"),
+    ("quality", "final", "qwen-max"),
+])
+def test_policies_on_short_prompt(app, policy, stage, expected):
+    assert app.route_model("qwen", "short prompt", stage=stage, policy=policy)["model"] == expected
+
+
+def test_long_prompt_requires_higher_quality(app):
+    prompt = "x" * 4 * 8000
+    assert app.route_model("openai", prompt, stage="final", policy="balanced")["model"] == "gpt-4o"
+    assert app.route_model("openai", "short", stage="final", policy="balanced")["model"] == "gpt-4o-mini"
+
+
+def test_prompt_exceeding_every_context_uses_largest(app):
+    prompt = "x" * 4 * 200000
+    assert app.route_model("qwen", prompt, policy="quality")["model"] == "qwen-long"
+    assert "超出" in app.route_model("openai", prompt, policy="quality")["reason"]
+
+
+def test_unknown_provider_uses_configured_model(app):
+    route = app.route_model("local", "prompt", policy="latency", fixed_model="llama3")
+    assert route["model"] == "llama3"
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+
+def _hold(scheduler, provider, job, release, acquired, order=None, name=None):
+    with scheduler.slot(provider, "key", job):
+        if order is not None:
+            order.append(name)
+        acquired.set()
+        release.wait(5)
+
+
+def test_concurrency_limit(app):
+    scheduler = app.ProviderScheduler({"p": (2, 6000)})
+    release = threading.Event()
+    acquired = [threading.Event() for _ in range(3)]
+    threads = [threading.Thread(target=_hold, args=(scheduler, "p", None, release, event)) for event in acquired]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    assert sum(event.is_set() for event in acquired) == 2
+    assert scheduler.snapshot()[0]["排队"] == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert all(event.is_set() for event in acquired)
+
+
+def test_separate_api_keys_have_separate_quotas(app):
+    scheduler = app.ProviderScheduler({"p": (1, 6000)})
+    with scheduler.slot("p", "key-a"):
+        with scheduler.slot("p", "key-b"):
+            assert len(scheduler.snapshot()) == 2
+
+
+def test_weighted_fair_queueing(app):
+    scheduler = app.ProviderScheduler({"p": (1, 6000)})
+    batch = app.SchedulerJob("batch-session", app.JOB_PRIORITY_WEIGHTS["batch"])
+    interactive = app.SchedulerJob("interactive-session", app.JOB_PRIORITY_WEIGHTS["interactive"])
+    order = []
+    release = threading.Event()
+    acquired = threading.Event()
+    blocker = threading.Thread(target=_hold, args=(scheduler, "p", None, release, acquired))
+    blocker.start()
+    assert acquired.wait(2)
+    
+    released = threading.Event()
+    released.set()
+    threads = []
+    for name, job in [("b0", batch), ("b1", batch), ("b2", batch),
+                      ("i0", interactive), ("i1", interactive), ("i2", interactive)]:
+        thread = threading.Thread(target=_hold, args=(scheduler, "p", job, released, threading.Event(), order, name))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    
+    # 交互作业权重为批量作业的两倍，后到达也能按完成标签插到批量作业之间
+    assert order == ["i0", "b0", "i1", "i2", "b1", "b2"]
+
+
+def test_interrupted_wait_removes_ticket(app, monkeypatch):
+    scheduler = app.ProviderScheduler({"p": (1, 6000)})
+    job = app.SchedulerJob("session")
+    release = threading.Event()
+    acquired = threading.Event()
+    holder = threading.Thread(target=_hold, args=(scheduler, "p", job, release, acquired))
+    holder.start()
+    assert acquired.wait(2)
+    
+    def interrupted(resource):
+        raise KeyboardInterrupt
+    
+    monkeypatch.setattr(scheduler, "_refill", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        with scheduler.slot("p", "key", job):
+            pass
+    monkeypatch.undo()
+    assert scheduler.snapshot()[0]["排队"] == 0
+    
+    release.set()
+    holder.join(5)
+    later = threading.Event()
+    threading.Thread(target=_hold, args=(scheduler, "p", job, release, later), daemon=True).start()
+    assert later.wait(2)
+
+
+def test_iterate_holds_slot_for_whole_stream(app):
+    scheduler = app.ProviderScheduler({"p": (1, 6000)})
+    stream = scheduler.iterate("p", "key", None, lambda: iter([1, 2]))
+    assert next(stream) == 1
+    assert scheduler.snapshot()[0]["运行中"] == "1/1"
+    assert list(stream) == [2]
+    assert scheduler.snapshot()[0]["运行中"] == "0/1"
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def _competitor(name, features, tech):
+    return {'company_name': name, 'key_features': features, 'tech_stack': tech}
+
+
+def test_term_aliases_normalized(app):
+    assert app.normalize_term(" ReactJS ") == "react"
+    assert app.normalize_term("K8s.") == "kubernetes"
+
+
+def test_similarity_matrices(app):
+    data = [
+        _competitor("A", ["Team chat", "Video calls"], ["React", "Node"]),
+        _competitor("B", ["team chat", "file sharing"], ["reactjs", "nodejs"]),
+        _competitor("C", ["Payroll"], ["Java"]),
+    ]
+    analytics = app.compute_similarity_analytics(data)
+    tech = analytics['tech_similarity']
+    feature = analytics['feature_similarity']
+    assert tech[0, 1] == 1.0
+    assert tech[0, 2] == 0.0
+    assert feature[0, 1] > feature[0, 2]
+    assert np.allclose(np.diag(analytics['combined_similarity']), 1.0)
+    clusters = analytics['clusters']
+    assert clusters[0] == clusters[1] != clusters[2]
+
+
+def test_similarity_handles_missing_fields(app):
+    data = [_competitor("A", float('nan'), None), _competitor("B", "N/A", [])]
+    analytics = app.compute_similarity_analytics(data)
+    assert analytics['combined_similarity'].shape == (2, 2)
+    assert analytics['tech_terms'] == []
+
+
+def test_summary(app):
+    data = [
+        _competitor("A", ["Team chat"], ["React", "AWS"]),
+        _competitor("B", ["Team chat"], ["React", "GCP"]),
+    ]
+    summary = app.summarize_similarity_analytics(app.compute_similarity_analytics(data))
+    assert "共同技术栈: react(2/2)" in summary
+    assert "A: 最相似=B" in summary
+    assert "独有技术=aws" in summary
+    assert "相似群组: [A, B]" in summary
+    assert app.summarize_similarity_analytics(app.compute_similarity_analytics(data[:1])) == ""
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def test_do_runs_once_for_concurrent_callers(app):
+    flight = app.SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+    
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+    
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight.do, "key", work)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "key", work) for _ in range(2)]
+        time.sleep(0.05)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+    
+    assert len(calls) == 1
+    assert results[0] == ("result", False)
+    assert all(result == ("result", True) for result in results[1:])
+    assert flight.stats == {"executed": 1, "shared": 2}
+    assert flight.do("key", lambda: "again") == ("again", False)
+
+
+def test_do_shares_leader_error(app):
+    flight = app.SingleFlight()
+    started = threading.Event()
+    
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("bad key")
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", fail)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", fail)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_extraction_keys_separate_api_keys(app, monkeypatch):
+    seen_keys = []
+    release = threading.Event()
+    
+    def fake_extract(competitor_url, api_key, job=None, fields=None, use_cache=True):
+        seen_keys.append(api_key)
+        release.wait(5)
+        return {"competitor_url": competitor_url, "api_key": api_key}
+    
+    monkeypatch.setattr(app, "_extract_competitor_record", fake_extract)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(app.extract_competitor_record, "https://acme.com", key) for key in ("key-a", "key-b")]
+        time.sleep(0.1)
+        release.set()
+        records = [future.result() for future in futures]
+    
+    assert sorted(seen_keys) == ["key-a", "key-b"]
+    assert [record["api_key"] for record in records] == ["key-a", "key-b"]
+
+
+def test_stream_shares_items_between_consumers(app):
+    flight = app.SingleFlight()
+    release = threading.Event()
+    
+    def source():
+        yield 1
+        release.wait(5)
+        yield 2
+    
+    first = flight.stream("key", source)
+    second = flight.stream("key", source)
+    assert next(first) == 1
+    assert next(second) == 1
+    release.set()
+    assert list(first) == [2]
+    assert list(second) == [2]
+    assert flight.stats == {"executed": 1, "shared": 1}
+
+
+def test_stream_stops_source_after_last_consumer_leaves(app):
+    flight = app.SingleFlight()
+    produced = []
+    closed = threading.Event()
+    
+    def source():
+        try:
+            for item in range(1000):
+                produced.append(item)
+                yield item
+                time.sleep(0.01)
+        finally:
+            closed.set()
+    
+    first = flight.stream("key", source)
+    second = flight.stream("key", source)
+    assert next(first) == 0
+    assert next(second) == 0
+    first.close()
+    time.sleep(0.05)
+    assert not closed.is_set()
+    second.close()
+    assert closed.wait(2)
+    assert len(produced) < 100
+    
+    # 被放弃的流不再接受新的消费者，新请求重新执行
+    assert list(flight.stream("key", lambda: iter([7]))) == [7]